@@ -1,14 +1,16 @@
-import google.generativeai as genai
 import os
+import sys
 from dotenv import load_dotenv
 
+# Before importing src: backends.py reads DISTRIBIQ_BACKEND at import time
 load_dotenv()
-genai.configure(api_key=os.environ.get("GOOGLE_API_KEY"))
 
-print("🔍 Checking available models for your API Key...")
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from src.backends import get_backend, MODEL_BACKEND
+
+print(f"🔍 Checking available models for your API Key ({MODEL_BACKEND} backend)...")
 try:
-    for m in genai.list_models():
-        if 'generateContent' in m.supported_generation_methods:
-            print(f" - {m.name}")
+    for name in get_backend().list_models():
+        print(f" - {name}")
 except Exception as e:
-    print(f"Error: {e}")
\ No newline at end of file
+    print(f"Error: {e}")
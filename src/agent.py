@@ -1,16 +1,55 @@
 import os
 import json
 import time
+import hashlib
+import operator
+import threading
 from datetime import datetime
 import pytz  # ✅ NEW: For timezone support
-from typing import TypedDict, List, Any
-import google.generativeai as genai
-from langgraph.graph import StateGraph, END
+from typing import TypedDict, List, Any, Annotated
 from dotenv import load_dotenv
-import pandas as pd
 
-# --- 1. CONFIGURATION ---
+from concurrent.futures import ThreadPoolExecutor
+
+# Before the imports below: backends.py (and others) read DISTRIBIQ_* settings at import time
 load_dotenv()
+
+# Heavy libraries are imported where they are first needed: google.generativeai
+# by the Gemini backend (backends.py), langgraph by build_graph(), pandas and
+# numpy by the workbook and calendar code. The UI and CLI tools start without them.
+
+try:
+    from kb_cache import KnowledgeBaseCache
+    from doc_pipeline import DocumentPipeline, ingest_progress, get_ingest_progress, PARSE_WORKERS, STATUS_READY
+    from ingest import ingest_pdf, UPLOAD_CONCURRENCY, UPLOAD_RETRIES, UPLOAD_TIMEOUT
+    from query_engine import get_query_engine
+    from retrieval import retrieve_context, RETRIEVAL_TOKEN_BUDGET
+    from prompts import build_suffix, build_merge_prompt, PromptTemplate, PROMPT_VERSION, RESPONSE_SCHEMA
+    from table_extract import attach_rows
+    from prompt_cache import get_prompt_cache
+    from answer_cache import answer_cache, answer_expiry, AnswerCache, normalize_question
+    from backends import get_backend, chunk_text, MODEL_BACKEND
+    from telemetry import telemetry, QueryTrace
+    from pdf_index import get_pdf_index, PageIndex
+    from domains import DOMAINS, classify_question, should_fan_out, concat_answers
+    from model_router import get_model_router
+except ImportError:
+    from src.kb_cache import KnowledgeBaseCache
+    from src.doc_pipeline import DocumentPipeline, ingest_progress, get_ingest_progress, PARSE_WORKERS, STATUS_READY
+    from src.ingest import ingest_pdf, UPLOAD_CONCURRENCY, UPLOAD_RETRIES, UPLOAD_TIMEOUT
+    from src.query_engine import get_query_engine
+    from src.retrieval import retrieve_context, RETRIEVAL_TOKEN_BUDGET
+    from src.prompts import build_suffix, build_merge_prompt, PromptTemplate, PROMPT_VERSION, RESPONSE_SCHEMA
+    from src.table_extract import attach_rows
+    from src.prompt_cache import get_prompt_cache
+    from src.answer_cache import answer_cache, answer_expiry, AnswerCache, normalize_question
+    from src.backends import get_backend, chunk_text, MODEL_BACKEND
+    from src.telemetry import telemetry, QueryTrace
+    from src.pdf_index import get_pdf_index, PageIndex
+    from src.domains import DOMAINS, classify_question, should_fan_out, concat_answers
+    from src.model_router import get_model_router
+
+# --- 1. CONFIGURATION ---
 API_KEY = os.environ.get("GOOGLE_API_KEY")
 
 # ✅ UPDATED: Using the correct Flash model version
@@ -19,10 +58,75 @@ MODEL_NAME = "gemini-2.5-flash"
 # ✅ NEW: Timezone configuration (change to your preferred timezone)
 TIMEZONE = "Europe/Amsterdam"  # Options: "Europe/Berlin", "America/New_York", etc.
 
-if API_KEY:
-    genai.configure(api_key=API_KEY)
-else:
-    print("⚠️ No API Key found. Running in MOCK MODE.")
+# Knowledge base files (relative to this script: ../data/docs)
+DOCS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "docs")
+EXCEL_FILE = "DM_Report_MASTER_Generic.xlsx"
+PDF_FILES = [
+    "Shipping_Tariffs_EMEA_Generic.pdf",
+    "Regulatory_Compliance_Guide_Generic.pdf"
+]
+
+# Ingest every Excel/PDF file found under DOCS_FOLDER (True) or only
+# EXCEL_FILE + PDF_FILES (False). EXCEL_FILE stays the structured source for
+# the fast path and row retrieval either way.
+SCAN_DOCS_FOLDER = True
+
+# Answer simple lookups (lead time, MOQ, tier price, ...) from the workbook
+# directly and only call Gemini when the question needs reasoning
+FAST_PATH_ENABLED = True
+
+# Send only the workbook rows relevant to the question (BM25 over sheet rows)
+# instead of every sheet; budget is in estimated tokens
+RETRIEVAL_ENABLED = True
+
+# How workbook rows are written into prompts: "markdown" (pipe tables) or
+# "compact" (tab-separated, repeated long values dictionary-encoded)
+EXCEL_ENCODING = "markdown"
+
+# Provider-side caching of the stable prompt prefix (role + Excel + PDFs):
+# None (off), "gemini" (cached content) or "local" (offline stand-in)
+PROMPT_CACHE_BACKEND = None
+
+# Reuse answers to repeated questions (same KB version, prompt version and model)
+ANSWER_CACHE_ENABLED = True
+
+# How PDFs reach the model: "text" (pages extracted locally, only the
+# best-matching passages sent with page citations; files without a text
+# layer are still attached whole) or "attach" (every PDF attached to every request)
+PDF_MODE = "text"
+
+# Per-query telemetry (stage timings, tokens, cost) -> JSONL log + Prometheus file, see telemetry.py
+TELEMETRY_ENABLED = True
+
+# Delivery-date questions: business days and public holidays are counted
+# locally (calendar_engine.py). Single-product "when would it arrive?"
+# questions are answered directly; otherwise the dates go into the prompt.
+CALENDAR_ENABLED = True
+
+# Questions spanning several domains (product/pricing, logistics, compliance)
+# are split into one smaller prompt per domain, run in parallel and merged
+# (see domains.py and build_graph). MERGE_MODE: "model" (one short call
+# combines the parts, e.g. price + freight = landed cost) or "concat".
+FAN_OUT_ENABLED = True
+MERGE_MODE = "model"
+DOMAIN_TOKEN_BUDGET = RETRIEVAL_TOKEN_BUDGET // 2     # Excel rows per branch prompt
+
+# Model tiers (see model_router.py): simple lookups go to a lighter model,
+# multi-step questions to a stronger one, each with a timeout budget; slow
+# calls get a hedged duplicate and failed ones fall back to another tier.
+# False: every call goes to MODEL_NAME.
+MODEL_ROUTING_ENABLED = True
+MERGE_TIER = "fast"             # The merge call only combines finished answers
+BRANCH_MAX_TIER = "standard"    # A branch answers one domain: the whole question's complexity overstates it
+
+# Knowledge-base versions whose precompiled solver state (prompt template, PDF
+# page index) is kept: the live one and its predecessor, for questions still
+# in flight during a hot reload
+RUNTIME_KB_VERSIONS = 2
+
+# The Gemini SDK is configured with API_KEY when the backend first needs it (backends.gemini_sdk)
+if not API_KEY and MODEL_BACKEND not in ("replay", "mock"):
+    print("⚠️ No API Key found. Set DISTRIBIQ_BACKEND=replay to run offline from recorded cassettes.")
 
 # --- 2. STATE DEFINITION ---
 class DistribIQState(TypedDict):
@@ -30,16 +134,28 @@ class DistribIQState(TypedDict):
     question: str
     context_files: List[Any]    # Handles for PDFs
     context_text: str           # Text content for Excel
+    kb_version: str             # Fingerprint of the loaded knowledge base
+    context_rows: dict          # Sheet -> Excel rows actually sent to the model
+    pdf_pages: List[str]        # "file, p. N (section)" citations of PDF passages sent
+    timings: dict               # ttft_sec / total_sec of the last answer
+    telemetry: dict             # Full QueryTrace record (stages, tokens, cost)
+    domains: List[str]          # Domains a fan-out question was split into (empty: single solver)
+    domain: str                 # Domain of one fan-out branch
+    partials: Annotated[List[dict], operator.add]   # Branch answers, combined by merge_answers
+    run: dict                   # Per-question objects shared by the graph nodes (trace, clock, cache key)
+    conversation: str           # Bounded chat context (conversation.py): recent turns, summary, entities
     final_answer: dict
 
 # --- 3. DATE/TIME HELPER FUNCTIONS --- ✅ NEW SECTION
-def get_current_datetime():
+def current_time():
+    return datetime.now(pytz.timezone(TIMEZONE))
+
+def get_current_datetime(now=None):
     """
     Returns current date and time in the configured timezone.
     Used to provide real-time context to the AI agent.
     """
-    tz = pytz.timezone(TIMEZONE)
-    now = datetime.now(tz)
+    now = now or current_time()
     return {
         "full_datetime": now.strftime("%A, %B %d, %Y at %H:%M %Z"),
         "date": now.strftime("%Y-%m-%d"),
@@ -52,14 +168,16 @@ def get_current_datetime():
         "is_weekend": now.weekday() >= 5
     }
 
-def get_business_context():
+def get_business_context(now=None):
     """
     Returns business-relevant time context for supply chain operations.
+    Pass `now` (current_time()) to read the clock once per question.
     """
-    dt = get_current_datetime()
+    now = now or current_time()
+    dt = get_current_datetime(now)
     
     # Determine business hours (assuming 8:00-18:00 CET)
-    hour = int(datetime.now(pytz.timezone(TIMEZONE)).strftime("%H"))
+    hour = now.hour
     is_business_hours = 8 <= hour < 18 and not dt["is_weekend"]
     
     return {
@@ -69,28 +187,104 @@ def get_business_context():
         "note": "Consider next business day for responses if outside business hours"
     }
 
-# --- 4. THE FILE LOADER ---
-def prepare_knowledge_base():
+# --- 4. THE SOLVER RUNTIME ---
+class SolverRuntime:
     """
-    Reads Excel locally (converting to markdown) and uploads PDFs to Gemini.
+    Solver state that outlives single questions. Per knowledge-base version
+    it holds the precompiled prompt template (prompts.PromptTemplate) and
+    the PDF page index, both built once when the version is loaded. It also
+    gives access to the model client: the shared backend, which reuses one
+    model object per model name. A question only looks these up.
+    """
+
+    def __init__(self, max_versions=RUNTIME_KB_VERSIONS):
+        self.max_versions = max_versions
+        self._versions = {}         # kb_version -> {"template", "pdf_index"}, oldest first
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        # Looked up on use: server.py and the benchmarks swap backends with set_backend()
+        return get_backend()
+
+    def register(self, kb_version, excel_text, pdf_index=None):
+        """
+        Precompiles the solver state of a freshly loaded knowledge-base version.
+        """
+        entry = {"template": PromptTemplate(excel_text), "pdf_index": pdf_index}
+        with self._lock:
+            self._versions.pop(kb_version, None)
+            self._versions[kb_version] = entry
+            while len(self._versions) > self.max_versions:
+                self._versions.pop(next(iter(self._versions)))
+        return entry
+
+    def template(self, kb_version, excel_text):
+        """
+        Prompt template for the version. A version that was not loaded through
+        prepare_knowledge_base() is registered on first use; a caller passing
+        different workbook text under a known version gets a one-off template.
+        """
+        with self._lock:
+            entry = self._versions.get(kb_version) if kb_version else None
+        if entry is None:
+            if not kb_version:
+                return PromptTemplate(excel_text)
+            entry = self.register(kb_version, excel_text)
+        template = entry["template"]
+        if template.excel_text is not excel_text and template.excel_text != excel_text:
+            return PromptTemplate(excel_text)
+        return template
+
+    def pdf_index(self, kb_version):
+        with self._lock:
+            entry = self._versions.get(kb_version)
+        return entry["pdf_index"] if entry else None
+
+solver_runtime = SolverRuntime()
+
+_calendar_module = None
+
+def _calendar():
+    """
+    calendar_engine.py, imported on first use (it loads numpy and pandas).
+    """
+    global _calendar_module
+    if _calendar_module is None:
+        try:
+            import calendar_engine as module
+        except ImportError:
+            from src import calendar_engine as module
+        _calendar_module = module
+    return _calendar_module
+
+# --- 5. THE FILE LOADER ---
+
+def _document_filter():
+    return None if SCAN_DOCS_FOLDER else {EXCEL_FILE, *PDF_FILES}
+
+def prepare_knowledge_base(use_cache=True, concurrency=UPLOAD_CONCURRENCY,
+                           upload_timeout=UPLOAD_TIMEOUT, upload_retries=UPLOAD_RETRIES,
+                           workers=PARSE_WORKERS):
+    """
+    Scans DOCS_FOLDER and brings the document manifest up to date (see
+    doc_pipeline.py): only new or changed files are parsed (Excel to text in
+    EXCEL_ENCODING, PDF text per page) on a pool of `workers` processes, and
+    deleted files are dropped. PDFs that cannot be searched locally (or all
+    of them with PDF_MODE = "attach") are uploaded to Gemini, up to
+    `concurrency` at a time; those already known before the parse upload
+    while it runs. Parsed artifacts and upload handles are cached
+    on disk by content hash (set use_cache=False to force a cold load).
+    Progress can be polled with get_ingest_progress().
     """
     
-    # ✅ PATH LOGIC: 
-    # Get the folder where THIS script (agent.py) lives
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    # Go up one level (..), then down into data/docs
-    base_folder = os.path.join(current_dir, "..", "data", "docs")
-    
-    # Files to look for
-    excel_file = "DM_Report_MASTER_Generic.xlsx"
-    pdf_files = [
-        "Shipping_Tariffs_EMEA_Generic.pdf",
-        "Regulatory_Compliance_Guide_Generic.pdf"
-    ]
+    base_folder = DOCS_FOLDER
     
     knowledge_context = {
         "pdf_handles": [],
-        "excel_text": ""
+        "excel_text": "",
+        "file_hashes": {},
+        "kb_version": ""
     }
     
     print(f"📂 Preparing Knowledge Base from: {base_folder}")
@@ -99,121 +293,663 @@ def prepare_knowledge_base():
     if not os.path.exists(base_folder):
         print(f"❌ ERROR: Folder '{base_folder}' not found.")
         return knowledge_context
-    
-    # --- PART A: PROCESS EXCEL ---
-    excel_path = os.path.join(base_folder, excel_file)
-    if os.path.exists(excel_path):
-        try:
-            xls = pd.ExcelFile(excel_path)
-            full_text = f"--- SOURCE FILE: {excel_file} ---\n"
-            for sheet_name in xls.sheet_names:
-                df = pd.read_excel(xls, sheet_name=sheet_name)
-                markdown_table = df.to_markdown(index=False)
-                full_text += f"\n### SHEET: {sheet_name}\n{markdown_table}\n"
-            knowledge_context["excel_text"] = full_text
-            print(f"   ✅ Excel processed")
-        except Exception as e:
-            print(f"   ❌ Excel Error: {e}")
 
-    # --- PART B: UPLOAD PDFS ---
-    for filename in pdf_files:
-        full_path = os.path.join(base_folder, filename)
-        if os.path.exists(full_path):
+    # --- PART A: SCAN + PARSE (incremental) ---
+    pipeline = DocumentPipeline(base_folder, workers=workers, excel_encoding=EXCEL_ENCODING)
+    cache = KnowledgeBaseCache() if use_cache else None
+
+    # Uploads are I/O-bound: threads, not processes. PDFs that will be attached
+    # whole anyway start uploading now, while the workbook is parsed.
+    upload_pool = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    uploads = {}
+
+    def submit_upload(rel, content_hash):
+        remote_name = cache.get_pdf_remote_name(rel, content_hash) if cache else None
+        future = upload_pool.submit(ingest_pdf, pipeline.path(rel), remote_name, upload_retries, upload_timeout)
+        uploads[rel] = (content_hash, remote_name, future)
+
+    for rel, content_hash in pipeline.pdfs_to_attach(_document_filter(), all_pdfs=PDF_MODE == "attach").items():
+        submit_upload(rel, content_hash)
+    try:
+        summary = pipeline.sync(_document_filter(), force=not use_cache)
+    except BaseException:
+        upload_pool.shutdown(cancel_futures=True)
+        raise
+    print(f"   🗂️ {len(pipeline.manifest)} documents: {len(summary['added'])} new, "
+          f"{len(summary['changed'])} changed, {len(summary['removed'])} removed, "
+          f"{len(summary['unchanged'])} unchanged")
+    for rel in summary["failed"]:
+        print(f"   ❌ Parse Error: {rel}: {pipeline.manifest[rel]['error']}")
+    knowledge_context["file_hashes"] = pipeline.file_hashes()
+
+    # --- PART B: EXCEL TEXT (the main workbook first) ---
+    excel_texts = []
+    for rel in sorted(pipeline.documents(kind="excel", status=STATUS_READY), key=lambda r: r != EXCEL_FILE):
+        artifact = pipeline.load_artifact(rel)
+        if artifact is None:
+            continue
+        excel_texts.append(artifact["text"])
+        report = artifact.get("encoding_report")
+        if report and rel in summary["added"] + summary["changed"]:
+            print(f"   📉 {rel}: {report['markdown']} tokens as markdown, "
+                  f"{report['compact']} compact ({report['reduction_pct']}% less), using '{EXCEL_ENCODING}'")
+    knowledge_context["excel_text"] = "\n\n".join(excel_texts)
+    if excel_texts:
+        print(f"   ✅ Excel ready ({len(excel_texts)} workbooks)")
+
+    # --- PART C: PDFS ---
+    pdf_docs = pipeline.documents(kind="pdf")
+    pdf_paths = [pipeline.path(rel) for rel in pdf_docs]
+    attach_paths = set(pdf_paths)
+    pdf_index = None
+    if PDF_MODE == "text":
+        # Searched page by page locally: only files without extractable text are attached whole
+        pdf_index = PageIndex(pdf_paths, page_source=pipeline.pdf_pages)
+        attach_paths = set(pdf_index.unindexed)
+        print(f"   📑 PDF page index: {len(pdf_index.passages)} passages from {len(pdf_paths) - len(attach_paths)} PDFs")
+        for filename, error in pdf_index.errors.items():
+            print(f"   ⚠️ {filename} will be attached whole ({error})")
+
+    pdf_jobs = []
+    for rel, entry in pdf_docs.items():
+        if pipeline.path(rel) not in attach_paths:
+            continue    # An early upload of a file that turned out searchable is left unused
+        if rel not in uploads or uploads[rel][0] != entry["hash"]:
+            submit_upload(rel, entry["hash"])
+        pdf_jobs.append((rel, *uploads[rel]))
+
+    ingest_progress.start("uploading", len(pdf_jobs))
+    with upload_pool:
+        for filename, content_hash, remote_name, future in pdf_jobs:
             try:
-                f = genai.upload_file(full_path)
-                while f.state.name == "PROCESSING":
-                    time.sleep(1)
-                    f = genai.get_file(f.name)
+                f, reused = future.result()
                 knowledge_context["pdf_handles"].append(f)
-                print(f"   ✅ PDF Ready: {filename}")
+                if reused:
+                    print(f"   ⚡ PDF reused from cache: {filename}")
+                else:
+                    if cache:
+                        cache.put_pdf_handle(filename, content_hash, f)
+                    print(f"   ✅ PDF Ready: {filename}")
+                ingest_progress.advance(filename)
             except Exception as e:
-                 print(f"   ❌ PDF Error: {e}")
+                if cache and remote_name:
+                    cache.forget_pdf(filename)
+                print(f"   ❌ PDF Error: {e}")
+                ingest_progress.advance(filename, failed=True)
+    ingest_progress.finish()
+
+    if cache:
+        try:
+            cache.save()
+        except OSError as e:
+            print(f"   ⚠️ Could not write KB cache: {e}")
+
+    # One fingerprint for the whole knowledge base (changes if any file changes)
+    knowledge_context["kb_version"] = hashlib.sha256(
+        json.dumps(knowledge_context["file_hashes"], sort_keys=True).encode()
+    ).hexdigest()[:16]
+
+    # Prompt template and page index are built here once, not per question
+    solver_runtime.register(knowledge_context["kb_version"], knowledge_context["excel_text"], pdf_index)
 
     return knowledge_context
 
-# --- 5. THE AGENT (Updated with Date/Time Awareness) --- ✅ UPDATED
+# --- 6. THE AGENT (Updated with Date/Time Awareness) --- ✅ UPDATED
+def _load_pdf_index(kb_version=None):
+    """
+    Page index of the knowledge base version (built during ingestion), or one
+    over PDF_FILES extracted on the spot; None if it cannot be built.
+    """
+    pdf_index = solver_runtime.pdf_index(kb_version)
+    if pdf_index is not None:
+        return pdf_index
+    paths = [os.path.join(DOCS_FOLDER, f) for f in PDF_FILES if os.path.exists(os.path.join(DOCS_FOLDER, f))]
+    if not paths:
+        return None
+    try:
+        return get_pdf_index(paths)
+    except Exception as e:
+        print(f"   ⚠️ PDF page index unavailable, attaching whole files: {e}")
+        return None
+
+def _try_fast_path(question):
+    """
+    Returns a local answer from the structured query engine, or None to use the LLM.
+    """
+    try:
+        engine = get_query_engine(os.path.join(DOCS_FOLDER, EXCEL_FILE))
+        return engine.answer(question) if engine else None
+    except Exception as e:
+        print(f"   ⚠️ Fast path skipped: {e}")
+        return None
+
+def _select_excel_context(question, full_text, budget_tokens=RETRIEVAL_TOKEN_BUDGET, sheets=None):
+    """
+    Returns (excel_context, included_rows), optionally only from `sheets`.
+    Falls back to full_text when retrieval is off, fails, or finds nothing relevant.
+    """
+    if not RETRIEVAL_ENABLED:
+        return full_text, None
+    try:
+        engine = get_query_engine(os.path.join(DOCS_FOLDER, EXCEL_FILE))
+        if engine is None:
+            return full_text, None
+        text, included = retrieve_context(engine, question, budget_tokens, encoding=EXCEL_ENCODING, sheets=sheets)
+        if not included:
+            return full_text, None
+        return text, included
+    except Exception as e:
+        print(f"   ⚠️ Retrieval skipped, using full workbook: {e}")
+        return full_text, None
+
+def _bind_model(prefix, suffix, context_files, kb_version=None, model_name=MODEL_NAME):
+    """
+    Returns (bound_model, prompt_parts). With a prompt cache the prefix and PDFs
+    live provider-side and only the suffix is sent (bound_model is tied to the
+    cache); otherwise bound_model is None and everything is sent in
+    prefix -> attachments -> suffix order (also for prefixes too small to cache).
+    """
+    prompt_cache = get_prompt_cache(PROMPT_CACHE_BACKEND)
+    if prompt_cache is not None:
+        try:
+            model = prompt_cache.get_model(model_name, prefix, context_files, kb_version)
+            if model is not None:
+                return model, [suffix]
+        except Exception as e:
+            print(f"   ⚠️ Prompt cache unavailable, sending full prompt: {e}")
+    return None, [prefix, *context_files, suffix]
+
+def get_cache_stats():
+    """
+    Hit/miss statistics of the answer cache (and prompt prefix cache, if enabled).
+    """
+    prompt_cache = get_prompt_cache(PROMPT_CACHE_BACKEND)
+    return {
+        "answers": answer_cache.stats(),
+        "prompt_prefix": prompt_cache.stats() if prompt_cache is not None else None
+    }
+
+def _entity_engine():
+    # Product/supplier indexes for conversation entities (None without the workbook)
+    try:
+        return get_query_engine(os.path.join(DOCS_FOLDER, EXCEL_FILE))
+    except Exception as e:
+        print(f"   ⚠️ Conversation entities unavailable: {e}")
+        return None
+
+def conversation_fields(conversation, question):
+    """
+    State fields for a question asked inside a chat session (conversation.py):
+    a follow-up resolved to a standalone question, plus the bounded context.
+    """
+    resolved = conversation.resolve(question, _entity_engine())
+    if resolved != question:
+        print(f"   💬 Follow-up read as: {resolved}")
+    return {"question": resolved, "conversation": conversation.context()}
+
+def remember_turn(conversation, state):
+    """
+    Folds the answered question into the conversation (after every answer).
+    """
+    conversation.add_turn(state['question'], state.get('final_answer') or {}, _entity_engine())
+
+def _calendar_inputs(time_context):
+    """
+    (query engine, order date) for calendar_engine; engine is None if the workbook is unavailable.
+    """
+    order_date = datetime.strptime(time_context['date'], "%Y-%m-%d").date()
+    try:
+        return get_query_engine(os.path.join(DOCS_FOLDER, EXCEL_FILE)), order_date
+    except Exception as e:
+        print(f"   ⚠️ Calendar skipped: {e}")
+        return None, order_date
+
+def _dates_context(question, time_context):
+    """
+    Locally computed delivery dates for the prompt ("" if not a date question).
+    """
+    if not CALENDAR_ENABLED:
+        return ""
+    engine, order_date = _calendar_inputs(time_context)
+    try:
+        return _calendar().dates_context(engine, question, order_date) if engine else ""
+    except Exception as e:
+        print(f"   ⚠️ Delivery dates skipped: {e}")
+        return ""
+
+def _answer_locally(state, trace, time_context, now):
+    """
+    Fast path and answer cache. Returns (answered, cache_key); when
+    answered, state["final_answer"] is filled in.
+    """
+    # ⚡ FAST PATH: exact lookups straight from the workbook, no tokens spent
+    if FAST_PATH_ENABLED:
+        fast_answer = _try_fast_path(state['question'])
+        if fast_answer is not None:
+            fast_answer["timestamp"] = time_context['full_datetime']
+            state["final_answer"] = attach_rows(fast_answer)
+            print(f"   ⚡ Answered locally from {', '.join(fast_answer['citations'])}")
+            trace.local_answer("fast_path")
+            return True, None
+
+    # 📅 CALENDAR: delivery dates counted locally in business days
+    if CALENDAR_ENABLED:
+        engine, order_date = _calendar_inputs(time_context)
+        date_answer = _calendar().answer_delivery(engine, state['question'], order_date) if engine else None
+        if date_answer is not None:
+            date_answer["timestamp"] = time_context['full_datetime']
+            state["final_answer"] = attach_rows(date_answer)
+            print(f"   📅 Delivery dates computed locally")
+            trace.local_answer("calendar")
+            return True, None
+
+    # ♻️ ANSWER CACHE: identical question against the same knowledge base
+    cache_key = None
+    if ANSWER_CACHE_ENABLED:
+        cache_key = _answer_cache_key(state, _answer_model(state['question']))
+        cached_answer = answer_cache.get(cache_key, now)
+        if cached_answer is not None:
+            cached_answer["route"] = "answer_cache"
+            state["final_answer"] = cached_answer
+            print(f"   ♻️ Served from answer cache")
+            trace.local_answer("answer_cache")
+            return True, cache_key
+    return False, cache_key
+
+def _answer_model(question):
+    """
+    Model the question would be answered by: the routed tier's model, or MODEL_NAME.
+    """
+    if not MODEL_ROUTING_ENABLED:
+        return MODEL_NAME
+    router = get_model_router()
+    return router.tiers[router.choose_tier(question)]["model"]
+
+def _answer_cache_key(state, model_name):
+    kb_version = state.get('kb_version') or hashlib.sha256(state['context_text'].encode()).hexdigest()[:16]
+    # The chat context is part of the prompt: "and from DSM?" means something else in another session
+    return AnswerCache.make_key(state['question'], kb_version, PROMPT_VERSION, model_name,
+                                state.get('conversation') or "")
+
+def _prepare_request(state, trace):
+    """
+    Runs the local stages (fast path, answer cache, retrieval, prompt building).
+    Returns None when state["final_answer"] was filled locally, otherwise the
+    model request: {"prefix", "suffix", "cache_key", "now"}.
+    """
+    # ✅ NEW: Get current date/time context (one clock reading per question)
+    now = current_time()
+    time_context = get_business_context(now)
+
+    answered, cache_key = _answer_locally(state, trace, time_context, now)
+    if answered:
+        return None
+    
+    build_started = time.perf_counter()
+    excel_context, context_rows = _select_excel_context(state['question'], state['context_text'])
+    state["context_rows"] = context_rows or {}
+    if context_rows:
+        row_count = sum(len(rows) for rows in context_rows.values())
+        print(f"   🔎 Retrieved {row_count} rows from {len(context_rows)} sheets")
+
+    pdf_context, pdf_pages, pdfs_attached = "", [], True
+    if PDF_MODE == "text":
+        pdf_index = _load_pdf_index(state.get('kb_version'))
+        if pdf_index is not None:
+            pdf_context, pdf_pages = pdf_index.select(state['question'])
+            pdfs_attached = bool(pdf_index.unindexed)
+    state["pdf_pages"] = pdf_pages
+    if pdf_pages:
+        print(f"   📑 Selected {len(pdf_pages)} PDF passages")
+
+    delivery_dates = _dates_context(state['question'], time_context)
+    if delivery_dates:
+        print(f"   🗓️ Delivery dates pre-computed")
+
+    # Stable prefix first (cacheable, precompiled per KB version), per-request suffix last
+    template = solver_runtime.template(state.get('kb_version'), state['context_text'])
+    if context_rows:
+        prefix = template.prefix(full_workbook=False, pdfs_attached=pdfs_attached)
+        suffix = build_suffix(state['question'], time_context, retrieved_context=excel_context, pdf_context=pdf_context,
+                              dates_context=delivery_dates, conversation=state.get('conversation'))
+    else:
+        # No relevant rows found (or retrieval off): the whole workbook goes in the prefix
+        prefix = template.prefix(full_workbook=True, pdfs_attached=pdfs_attached)
+        suffix = build_suffix(state['question'], time_context, pdf_context=pdf_context, dates_context=delivery_dates,
+                              conversation=state.get('conversation'))
+    trace.prompt_built(build_started, excel_context, (prefix, suffix), bool(state.get('context_files')), pdf_context)
+    return {"prefix": prefix, "suffix": suffix, "cache_key": cache_key, "now": now}
+
+GENERATION_CONFIG = {"response_mime_type": "application/json", "response_schema": RESPONSE_SCHEMA}
+
+def _model_call_args(state, request, model_name=MODEL_NAME):
+    bound_model, prompt_parts = _bind_model(
+        request["prefix"], request["suffix"], state.get('context_files') or [], state.get('kb_version'), model_name
+    )
+    return {
+        "model_name": model_name,
+        "contents": prompt_parts,
+        "generation_config": GENERATION_CONFIG,
+        # The prompt embeds the clock, so recordings are keyed on the question instead
+        "key_hint": f"{PROMPT_VERSION}|{normalize_question(state['question'])}",
+        "bound_model": bound_model,
+    }
+
+def _generate(question, call_args_for, tier=None):
+    """
+    One non-streamed model call. call_args_for(model_name) -> backend.generate
+    kwargs. Goes through the model router (tier for the question unless given,
+    hedging, fallback) or straight to MODEL_NAME. Returns (response, routed);
+    routed is None without routing.
+    """
+    if not MODEL_ROUTING_ENABLED:
+        return solver_runtime.backend.generate(**call_args_for(MODEL_NAME)), None
+    router = get_model_router()
+    return router.generate(tier or router.choose_tier(question), call_args_for)
+
+def _stream_plan(question):
+    """
+    [(tier, model)] to try in order for a streamed answer (tier None without routing).
+    """
+    if not MODEL_ROUTING_ENABLED:
+        return [(None, MODEL_NAME)]
+    router = get_model_router()
+    return [(tier, router.tiers[tier]["model"]) for tier in router.plan(router.choose_tier(question))]
+
+def _finish_request(state, request, text, trace, model_name):
+    parse_started = time.perf_counter()
+    state["final_answer"] = attach_rows(json.loads(text))
+    trace.parsed(parse_started)
+    if request["cache_key"] is not None and "error" not in state["final_answer"]:
+        # Stored under the model that answered: a fallback answer is not served as the planned tier's
+        cache_key = _answer_cache_key(state, model_name)
+        answer_cache.put(cache_key, state["final_answer"], answer_expiry(state['question'], request["now"]))
+
+def _new_trace(state, streamed):
+    return QueryTrace(
+        state.get('question_id', ''), state['question'], MODEL_NAME, state.get('kb_version', ''), streamed
+    )
+
+def _record_trace(state, trace):
+    """
+    Logs the trace (telemetry.py) and exposes its timings on the state.
+    """
+    entry = trace.finish()
+    if TELEMETRY_ENABLED:
+        telemetry.record(entry)
+    state["timings"] = {
+        # Local answers have no model call: their first byte is the whole answer
+        "ttft_sec": round(entry["ttft_sec"] if entry["ttft_sec"] is not None else entry["total_sec"], 3),
+        "total_sec": round(entry["total_sec"], 3),
+        "streamed": entry["streamed"] and entry["route"] == "model",
+    }
+    state["telemetry"] = entry
+
 def solver_agent(state: DistribIQState):
     print(f"\n⚙️ [DistribIQ] Thinking about: {state['question']}...")
-    
-    # ✅ NEW: Get current date/time context
-    time_context = get_business_context()
-    
+    trace = _new_trace(state, streamed=False)
+
+    request = _prepare_request(state, trace)
+    if request is not None:
+        try:
+            trace.model_started()
+            response, routed = _generate(state['question'], lambda model: _model_call_args(state, request, model))
+            if routed:
+                trace.routed(routed)
+            # Non-streaming: the first byte is only seen with the full response
+            trace.first_byte()
+            trace.model_finished(getattr(response, "usage_metadata", None))
+            _finish_request(state, request, response.text, trace, routed["model"] if routed else MODEL_NAME)
+
+        except Exception as e:
+            print(f"   ❌ AI Error: {e}")
+            state["final_answer"] = {"error": str(e)}
+            trace.failed(e)
+
+    _record_trace(state, trace)
+    return state
+
+def stream_solver(state: DistribIQState):
+    """
+    Streaming variant of solver_agent for the chat UI. Yields raw response text
+    chunks as they arrive; when the generator is exhausted, state["final_answer"]
+    and state["timings"] (time to first token vs. total) are filled in. Local
+    answers (fast path, answer cache) are yielded as one chunk.
+    """
+    if FAN_OUT_ENABLED and RETRIEVAL_ENABLED and should_fan_out(classify_question(state['question'])):
+        # Parallel domain branches: the merged answer arrives in one piece
+        state.update(get_graph().invoke(dict(state)))
+        yield json.dumps(state["final_answer"])
+        print(f"   ⏱️ Merged answer in {state['timings']['total_sec']}s")
+        return
+
+    print(f"\n⚙️ [DistribIQ] Streaming answer for: {state['question']}...")
+    trace = _new_trace(state, streamed=True)
+
+    request = _prepare_request(state, trace)
+    if request is None:
+        yield json.dumps(state["final_answer"])
+    else:
+        chunks = []
+        usage = None
+        try:
+            trace.model_started()
+            plan = _stream_plan(state['question'])
+            for attempt, (tier, model) in enumerate(plan):
+                call_args = _model_call_args(state, request, model)
+                if tier is None:
+                    stream = solver_runtime.backend.generate_stream(**call_args)
+                else:
+                    # Tier timeout on the first chunk and between chunks
+                    stream = get_model_router().stream(tier, call_args)
+                try:
+                    for chunk in stream:
+                        usage = getattr(chunk, "usage_metadata", None) or usage    # Totals arrive on the last chunk
+                        text = chunk_text(chunk)
+                        if not text:
+                            continue
+                        trace.first_byte()
+                        chunks.append(text)
+                        yield text
+                except Exception as e:
+                    # Only a stream that has not shown anything yet can switch tiers;
+                    # a stall after the first chunk ends the answer with an error
+                    if chunks or attempt == len(plan) - 1:
+                        raise
+                    print(f"   ↪️ {tier} tier failed ({e}), trying the next tier")
+                    continue
+                if tier is not None:
+                    trace.routed({"tier": tier, "model": model, "hedged": False,
+                                  "fallbacks": [t for t, _ in plan[:attempt]]})
+                break
+            trace.model_finished(usage)
+            _finish_request(state, request, "".join(chunks), trace, model)
+
+        except Exception as e:
+            print(f"   ❌ AI Error: {e}")
+            state["final_answer"] = {"error": str(e)}
+            trace.failed(e)
+
+    _record_trace(state, trace)
+    print(f"   ⏱️ First token {state['timings']['ttft_sec']}s, total {state['timings']['total_sec']}s")
+
+# --- 7. THE GRAPH (router -> parallel domain branches -> merge) ---
+def route_question(state: DistribIQState):
+    """
+    Router node. Questions touching one domain (or none) go to the single
+    solver; multi-domain questions are answered locally if possible,
+    otherwise fanned out to one domain_agent per domain.
+    """
+    domains = classify_question(state['question']) if FAN_OUT_ENABLED and RETRIEVAL_ENABLED else []
+    if not should_fan_out(domains):
+        return {"domains": [], "run": {}}
+
+    print(f"\n⚙️ [DistribIQ] Splitting over {', '.join(domains)}: {state['question']}...")
+    trace = _new_trace(state, streamed=False)
+    now = current_time()
+    time_context = get_business_context(now)
+    answered, cache_key = _answer_locally(state, trace, time_context, now)
+    if answered:
+        _record_trace(state, trace)
+        return {"domains": domains, "run": {"answered": True}, "final_answer": state["final_answer"],
+                "timings": state["timings"], "telemetry": state["telemetry"]}
+
+    trace.fanned_out(domains)
+    trace.model_started()
+    return {"domains": domains, "run": {"trace": trace, "time_context": time_context, "cache_key": cache_key, "now": now}}
+
+def _after_router(state: DistribIQState):
+    from langgraph.graph import END
+    from langgraph.types import Send
+    if not state.get('domains'):
+        return "solver"
+    if state['run'].get('answered'):
+        return END
+    return [Send("domain", {**state, "domain": domain}) for domain in state['domains']]
+
+def domain_agent(state: DistribIQState):
+    """
+    One fan-out branch: the question against its domain's sheets and PDFs
+    only, with a smaller prompt. Returns its partial answer.
+    """
+    name = state['domain']
+    domain = DOMAINS[name]
+    run = state['run']
+    question = state['question']
+    build_started = time.perf_counter()
+
+    excel_context, context_rows = _select_excel_context(question, "", DOMAIN_TOKEN_BUDGET, sheets=domain["sheets"])
+    pdf_context, pdf_pages, attachments = "", [], []
+    if domain["pdfs"]:
+        pdf_index = _load_pdf_index(state.get('kb_version')) if PDF_MODE == "text" else None
+        if pdf_index is not None:
+            pdf_context, pdf_pages = pdf_index.select(question, files=domain["pdfs"])
+        if pdf_index is None or pdf_index.unindexed:
+            attachments = state.get('context_files') or []
+
+    # Delivery dates belong to the logistics part of a question
+    delivery_dates = _dates_context(question, run['time_context']) if name == "logistics" else ""
+
+    prefix = solver_runtime.template(state.get('kb_version'), state['context_text']).prefix(False, bool(attachments))
+    suffix = build_suffix(question, run['time_context'], retrieved_context=excel_context or None,
+                          pdf_context=pdf_context, scope=domain["label"], dates_context=delivery_dates,
+                          conversation=state.get('conversation'))
+    build_sec = time.perf_counter() - build_started
+
+    partial = {"domain": name, "context_rows": context_rows or {}, "pdf_pages": pdf_pages}
+    def call_args(model_name):
+        bound_model, prompt_parts = _bind_model(prefix, suffix, attachments, state.get('kb_version'), model_name)
+        return {
+            "model_name": model_name,
+            "contents": prompt_parts,
+            "generation_config": GENERATION_CONFIG,
+            "key_hint": f"{PROMPT_VERSION}|{name}|{normalize_question(question)}",
+            "bound_model": bound_model,
+        }
+
+    tier = None
+    if MODEL_ROUTING_ENABLED:
+        router = get_model_router()
+        tier = router.cap_tier(router.choose_tier(question), BRANCH_MAX_TIER)
+
+    usage, routed, model_started = None, None, time.perf_counter()
     try:
-        model = genai.GenerativeModel(MODEL_NAME)
-        
-        # ✅ UPDATED PROMPT: Now includes real-time awareness
-        prompt_parts = [
-            f"""
-            You are DistribIQ, an expert AI assistant for Barentz specializing in supply chain, 
-            product information, logistics, and regulatory compliance.
-            
-            ═══════════════════════════════════════════════════════════════
-            📅 CURRENT DATE & TIME CONTEXT
-            ═══════════════════════════════════════════════════════════════
-            Today is: {time_context['full_datetime']}
-            Day: {time_context['day_of_week']}
-            Week: {time_context['week_number']} of {time_context['year']}
-            Quarter: {time_context['quarter']}
-            Business Hours: {time_context['business_status']}
-            
-            USE THIS DATE FOR:
-            - Calculating lead times and delivery dates
-            - Determining shipping schedules (exclude weekends if needed)
-            - Checking if tariffs/regulations are current
-            - Estimating arrival dates based on transit times
-            - Any date-related calculations
-            
-            ═══════════════════════════════════════════════════════════════
-            📊 CONTEXT 1: PRODUCT & PRICING DATA (Excel)
-            ═══════════════════════════════════════════════════════════════
-            {state['context_text']}
-            
-            ═══════════════════════════════════════════════════════════════
-            📄 CONTEXT 2: ATTACHED PDF DOCUMENTS
-            ═══════════════════════════════════════════════════════════════
-            (See attached files for Shipping Tariffs and Compliance Guide)
-            
-            ═══════════════════════════════════════════════════════════════
-            ❓ USER QUESTION
-            ═══════════════════════════════════════════════════════════════
-            {state['question']}
-            
-            ═══════════════════════════════════════════════════════════════
-            📋 RESPONSE INSTRUCTIONS
-            ═══════════════════════════════════════════════════════════════
-            1. Answer precisely using the provided data
-            2. For lead times: Calculate actual delivery dates from TODAY ({time_context['date']})
-            3. For shipping: Consider business days only (Mon-Fri)
-            4. Show your calculations step-by-step
-            5. Cite specific sources (sheet names, PDF sections)
-            
-            Output format (JSON):
-            {{
-                "answer": "The direct answer to the user's question. If calculating dates, show the actual calendar date.",
-                "explanation": "Step-by-step explanation. For date calculations, show: Today ({time_context['date']}) + X days = [calculated date]",
-                "citations": ["Sheet Name or PDF Section"],
-                "confidence": 0.95,
-                "timestamp": "{time_context['full_datetime']}"
-            }}
-            """
-        ]
-        
-        if state['context_files']:
-            prompt_parts.extend(state['context_files'])
-        
-        response = model.generate_content(
-            prompt_parts,
-            generation_config={"response_mime_type": "application/json"}
-        )
-        state["final_answer"] = json.loads(response.text)
-        
+        response, routed = _generate(question, call_args, tier=tier)
+        usage = getattr(response, "usage_metadata", None)
+        partial["answer"] = json.loads(response.text)
+        print(f"   🧩 {domain['label']} answered ({sum(len(r) for r in partial['context_rows'].values())} rows, {len(pdf_pages)} PDF passages)")
     except Exception as e:
-        print(f"   ❌ AI Error: {e}")
-        state["final_answer"] = {"error": str(e)}
-        
-    return state
+        print(f"   ❌ {domain['label']} branch failed: {e}")
+        partial["answer"] = {"error": str(e)}
+        run['trace'].router_attempts(getattr(e, "attempts", None))
+
+    run['trace'].branch_finished(
+        name, build_sec, time.perf_counter() - model_started, usage,
+        (excel_context, (prefix, suffix), bool(attachments), pdf_context), partial["answer"].get("error"), routed
+    )
+    return {"partials": [partial]}
+
+def merge_answers(state: DistribIQState):
+    """
+    Merge node: combines the branch answers (MERGE_MODE "model": one short
+    call over the partial answers; "concat", or if that call fails: labelled
+    concatenation) and finishes the question like solver_agent.
+    """
+    run = state['run']
+    trace = run['trace']
+    order = list(DOMAINS)
+    partials = sorted(state['partials'], key=lambda p: order.index(p['domain']))
+    timestamp = run['time_context']['full_datetime']
+
+    final = concat_answers(partials, timestamp)
+    answered = [p for p in partials if "error" not in p["answer"]]
+    if MERGE_MODE == "model" and len(answered) > 1:
+        prompt = build_merge_prompt(
+            state['question'], run['time_context'], [(DOMAINS[p['domain']]["label"], p["answer"]) for p in answered]
+        )
+        try:
+            trace.merge_started(prompt)
+            response, routed = _generate(state['question'], lambda model: {
+                "model_name": model,
+                "contents": [prompt],
+                "generation_config": GENERATION_CONFIG,
+                "key_hint": f"{PROMPT_VERSION}|merge|{normalize_question(state['question'])}",
+            }, tier=MERGE_TIER)
+            trace.model_finished(getattr(response, "usage_metadata", None), routed["model"] if routed else None)
+            if routed:
+                trace.router_attempts(routed["attempts"])
+            final = json.loads(response.text)
+        except Exception as e:
+            print(f"   ⚠️ Merge call failed, concatenating partial answers: {e}")
+            trace.router_attempts(getattr(e, "attempts", None))
+
+    trace.first_byte()
+    parse_started = time.perf_counter()
+    final = attach_rows(final)
+    trace.parsed(parse_started)
+    if "error" in final:
+        trace.failed(final["error"])
+    elif run['cache_key'] is not None:
+        answer_cache.put(run['cache_key'], final, answer_expiry(state['question'], run['now']))
+
+    context_rows = {}
+    for partial in partials:
+        for sheet, rows in partial["context_rows"].items():
+            context_rows[sheet] = sorted(set(context_rows.get(sheet, [])) | set(rows))
+    result = {
+        "final_answer": final,
+        "context_rows": context_rows,
+        "pdf_pages": [page for p in partials for page in p["pdf_pages"]],
+    }
+    _record_trace(result, trace)
+    return result
+
+def build_graph():
+    """
+    router -> solver (single prompt) | parallel domain branches -> merge.
+    """
+    from langgraph.graph import StateGraph, END
+    workflow = StateGraph(DistribIQState)
+    workflow.add_node("router", route_question)
+    workflow.add_node("solver", solver_agent)
+    workflow.add_node("domain", domain_agent)
+    workflow.add_node("merge", merge_answers)
+    workflow.set_entry_point("router")
+    workflow.add_conditional_edges("router", _after_router, ["solver", "domain", END])
+    workflow.add_edge("domain", "merge")
+    workflow.add_edge("solver", END)
+    workflow.add_edge("merge", END)
+    return workflow.compile()
+
+_graph = None
+
+def get_graph():
+    global _graph
+    if _graph is None:
+        _graph = build_graph()
+    return _graph
 
-# --- 6. RUNNER ---
+# --- 8. RUNNER ---
 if __name__ == "__main__":
     # Show current time context
     print("\n🕐 Current Time Context:")
@@ -225,11 +961,7 @@ if __name__ == "__main__":
     kb_data = prepare_knowledge_base()
     
     # 2. Build Graph
-    workflow = StateGraph(DistribIQState)
-    workflow.add_node("solver", solver_agent)
-    workflow.set_entry_point("solver")
-    workflow.add_edge("solver", END)
-    app = workflow.compile()
+    app = build_graph()
     
     # 3. Ask Question (S001)
     if kb_data["excel_text"] or kb_data["pdf_handles"]:
@@ -238,7 +970,8 @@ if __name__ == "__main__":
             "question_id": "S001",
             "question": "What is the lead time for Citric Acid from Jungbunzlauer? When would it arrive if I order today?",
             "context_files": kb_data["pdf_handles"],
-            "context_text": kb_data["excel_text"]
+            "context_text": kb_data["excel_text"],
+            "kb_version": kb_data["kb_version"]
         })
         
         print("\n📢 ANSWER:")
@@ -0,0 +1,131 @@
+import re
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+# --- 1. CONFIGURATION ---
+ANSWER_CACHE_MAX_ENTRIES = 512
+BUSINESS_OPEN_HOUR = 8          # Same 8:00-18:00 window as get_business_context()
+BUSINESS_CLOSE_HOUR = 18
+
+# Questions whose answer depends on today's date (delivery dates, audits due, overdue reviews...)
+_DATE_DEPENDENT = re.compile(
+    r"\b(today|tomorrow|yesterday|now|arrive|arrival|deliver\w*|when|due|overdue|"
+    r"next \d+ (days?|weeks?|months?)|this (week|month|quarter|year)|date|expir\w*|current\w*)\b"
+)
+# Questions whose answer depends on whether we are inside business hours
+_HOURS_DEPENDENT = re.compile(r"\b(open|closed|business hours|right now|office hours|same day)\b")
+
+
+def normalize_question(question):
+    """
+    Case/whitespace/punctuation-insensitive form of a question, used as cache key.
+    """
+    text = re.sub(r"\s+", " ", str(question).lower()).strip()
+    return text.rstrip("?!. ")
+
+
+def _next_business_boundary(now):
+    """
+    Next time the business-hours status flips (opening or closing time).
+    """
+    open_today = now.replace(hour=BUSINESS_OPEN_HOUR, minute=0, second=0, microsecond=0)
+    close_today = now.replace(hour=BUSINESS_CLOSE_HOUR, minute=0, second=0, microsecond=0)
+    if now < open_today:
+        return open_today
+    if now < close_today:
+        return close_today
+    return open_today + timedelta(days=1)
+
+
+def _end_of_day(now):
+    return now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+
+def answer_expiry(question, now):
+    """
+    Returns when a cached answer to `question` stops being valid (None = only
+    when the knowledge base changes). `now` must be timezone-aware in the
+    business timezone so day boundaries match get_business_context().
+    """
+    q = normalize_question(question)
+    if _HOURS_DEPENDENT.search(q):
+        return min(_next_business_boundary(now), _end_of_day(now))
+    if _DATE_DEPENDENT.search(q):
+        return _end_of_day(now)
+    return None
+
+
+# --- 2. THE CACHE ---
+class AnswerCache:
+    """
+    LRU cache of final answers keyed by normalized question + knowledge-base
+    version + prompt version + model name + a digest of the chat context the
+    prompt carried (follow-ups are only shared within the same context).
+    Date-sensitive answers expire at the next day (or business-hours)
+    boundary; the rest live until the KB changes, which changes the key.
+    """
+
+    def __init__(self, max_entries=ANSWER_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()       # key -> (answer, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def make_key(question, kb_version, prompt_version, model_name, context=""):
+        context_digest = hashlib.sha256(context.encode("utf-8")).hexdigest()[:16] if context else ""
+        return (normalize_question(question), kb_version, prompt_version, model_name, context_digest)
+
+    def get(self, key, now):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            answer, expires_at = item
+            if expires_at is not None and now >= expires_at:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(answer)
+
+    def put(self, key, answer, expires_at=None):
+        with self._lock:
+            self._entries[key] = (copy.deepcopy(answer), expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Hit/miss counters for sizing the cache.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+# --- 3. SHARED INSTANCE ---
+answer_cache = AnswerCache()
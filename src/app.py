@@ -1,10 +1,6 @@
 import streamlit as st
 import time
-import json
 import uuid
-import pandas as pd
-import ast
-import re
 
 # 1. PAGE CONFIG
 st.set_page_config(
@@ -15,9 +11,30 @@ st.set_page_config(
 
 # 2. IMPORTS
 try:
-    from agent import prepare_knowledge_base, solver_agent
+    from agent import prepare_knowledge_base, stream_solver, get_cache_stats, conversation_fields, remember_turn
+    from conversation import Conversation
+    from json_stream import StreamingJSONObject
+    from render_model import message_from_answer, ensure_render_model
+    from kb_registry import get_kb_registry
+    from doc_pipeline import get_ingest_progress
 except ImportError:
-    from src.agent import prepare_knowledge_base, solver_agent
+    from src.agent import prepare_knowledge_base, stream_solver, get_cache_stats, conversation_fields, remember_turn
+    from src.conversation import Conversation
+    from src.json_stream import StreamingJSONObject
+    from src.render_model import message_from_answer, ensure_render_model
+    from src.kb_registry import get_kb_registry
+    from src.doc_pipeline import get_ingest_progress
+
+@st.cache_resource
+def get_shared_kb():
+    """
+    One knowledge-base registry per server process, shared by all sessions
+    (uploads and the Excel text are not duplicated per browser tab).
+    """
+    return get_kb_registry(prepare_knowledge_base)
+
+HISTORY_WINDOW = 20     # Chat messages rendered on each rerun
+HISTORY_PAGE = 20       # Extra messages revealed by "Show earlier"
 
 # 3. CSS STYLING (Improved Readability)
 st.markdown("""
@@ -32,98 +49,56 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# --- 🛠️ HELPER 1: UNIVERSAL TABLE PARSER ---
-def extract_and_display_table(input_data):
+# --- 🛠️ HELPER 1: TABLE RENDERER ---
+def display_table(df):
     """
-    Handles both raw Lists and text Strings to generate a table.
+    Shows the pre-built answer table (see render_model.build_table).
     """
-    data_list = []
-
-    # CASE 1: It is ALREADY a list
-    if isinstance(input_data, list):
-        data_list = input_data
-
-    # CASE 2: It is a String (needs scanning)
-    elif isinstance(input_data, str):
-        clean_text = input_data.replace("```json", "").replace("```python", "").replace("```", "").strip()
-        buffer = ""
-        depth = 0
-        recording = False
-        
-        for char in clean_text:
-            if char == '{':
-                if depth == 0:
-                    recording = True
-                    buffer = ""
-                depth += 1
-            if recording:
-                buffer += char
-            if char == '}':
-                depth -= 1
-                if depth == 0:
-                    recording = False
-                    try:
-                        obj = ast.literal_eval(buffer)
-                        if isinstance(obj, dict):
-                            data_list.append(obj)
-                    except:
-                        pass
-                    buffer = ""
-    
-    # --- RENDER TABLE ---
-    if data_list and len(data_list) > 0:
-        df = pd.DataFrame(data_list)
-        
-        # Smart Column Sorting
-        cols = list(df.columns)
-        priority = ['PharmaCo SKU', 'Product Name', 'EU Compliance', 'EU Compliance Status']
-        sorted_cols = [c for c in priority if c in cols] + [c for c in cols if c not in priority]
-        
-        df = df[sorted_cols]
-        df = df.rename(columns={'PharmaCo SKU': 'SKU', 'Product Name': 'Product'})
-
-        st.success(f"✅ Found {len(df)} products:")
-        st.dataframe(df, use_container_width=True, hide_index=True)
-        return True 
-
-    return False
+    if df is None:
+        return False
+    st.success(f"✅ Found {len(df)} products:")
+    st.dataframe(df, use_container_width=True, hide_index=True)
+    return True
 
 # --- 🎨 HELPER 2: EXPLANATION BEAUTIFIER ---
-def display_pretty_explanation(text):
+def display_pretty_explanation(steps):
     """
-    Formats the explanation text in a visually distinct way.
+    Formats the classified explanation steps in a visually distinct way.
     """
-    if text:
+    if steps:
         # Use Streamlit's info box for visual distinction
         with st.expander("🧮 **How I Calculated This**", expanded=False):
-            # Split into steps
-            lines = text.split('\n')
             step_number = 1
-            
-            for line in lines:
-                line = line.strip()
-                if not line:
-                    continue
-                
-                # If line starts with number, it's a main step
-                if line and line[0].isdigit() and '.' in line[:3]:
+            for kind, line in steps:
+                if kind == "step":
                     st.markdown(f"#### 📌 Step {step_number}")
-                    st.markdown(f"{line[line.index('.')+1:].strip()}")
+                    st.markdown(line)
                     step_number += 1
                     st.markdown("")  # spacing
-                
-                # Action words = indented bullet
-                elif any(word in line.lower() for word in ['filtered', 'looked', 'identified', 'compiled', 'reviewed', 'extracted', 'cross-referenced']):
+                elif kind == "action":
                     st.markdown(f"&nbsp;&nbsp;&nbsp;&nbsp;➤ {line}")
-                
-                # Sheet names = data source
-                elif "'" in line and 'sheet' in line.lower():
+                elif kind == "source":
                     st.markdown(f"*📊 {line}*")
-                
-                # Regular line
                 else:
                     st.markdown(f"&nbsp;&nbsp;&nbsp;&nbsp;{line}")
 
+# --- 🧾 HELPER 3: ONE ANSWER ---
+def display_answer(model):
+    """
+    Draws an assistant answer from its render model (no parsing here).
+    """
+    if model["error"]:
+        st.error(f"AI Error: {model['error']}")
+    if model["text"] is not None and not model["error"]:
+        st.markdown(model["text"])
+    display_table(model["table"])
+    display_pretty_explanation(model["steps"])
+    if model["citations"]:
+        st.caption(f"📚 Sources: {', '.join(map(str, model['citations']))}")
+    timings = model.get("timings") or {}
+    if timings:
+        st.caption(f"⏱️ First token {timings['ttft_sec']:.2f}s · total {timings['total_sec']:.2f}s")
+
 # --- SIDEBAR ---
 with st.sidebar:
     import os
@@ -138,37 +113,63 @@ with st.sidebar:
     st.title("Control Panel")
     st.divider()
     
-    # KNOWLEDGE BASE STATE
-    if "kb_loaded" not in st.session_state:
-        st.session_state.kb_loaded = False
-        st.session_state.kb_data = None
+    # KNOWLEDGE BASE STATE (shared by every session in this process)
+    kb_registry = get_shared_kb()
+    kb_snapshot = kb_registry.current()
+    kb_stats = kb_registry.stats()
 
-    if not st.session_state.kb_loaded:
+    if kb_stats["rebuilding"]:
+        # Ingestion runs in the background: poll its progress until the new version is live
+        progress = get_ingest_progress()
+        label = f"{progress['phase'].capitalize()} {progress['done']}/{progress['total']}"
+        if progress["current"]:
+            label += f" · {progress['current']}"
+        if progress["eta_sec"]:
+            label += f" · ~{progress['eta_sec']:.0f}s left"
+        st.progress(min(1.0, progress["fraction"]), text=label)
+
+    if kb_snapshot is None:
         st.warning("⚠️ Data not loaded")
-        if st.button("🔄 Load Knowledge Base", type="primary"):
-            with st.spinner("Ingesting Excel & PDFs..."):
-                try:
-                    data = prepare_knowledge_base()
-                    if data["excel_text"] or data["pdf_handles"]:
-                        st.session_state.kb_data = data
-                        st.session_state.kb_loaded = True
-                        st.rerun()
-                    else:
-                        st.error("❌ No data found")
-                except Exception as e:
-                    st.error(f"Error: {e}")
+        if kb_stats["last_error"]:
+            st.error(f"❌ {kb_stats['last_error']}")
+        if st.button("🔄 Load Knowledge Base", type="primary", disabled=kb_stats["rebuilding"]):
+            kb_registry.reload()
+            st.rerun()
     else:
         st.success("✅ Knowledge Base Active")
-        st.info("""
-        **Files Loaded:**
-        * 📄 Product Master (Excel)
-        * 🚛 Shipping Tariffs (PDF)
-        * ⚖️ Compliance Guide (PDF)
-        """)
+        file_names = sorted(kb_snapshot.data.get("file_hashes", {})) if kb_snapshot.data else []
+        st.info("**Files Loaded:**\n" + "\n".join(f"* {'📄' if name.lower().endswith(('.xlsx', '.xls')) else '📑'} {name}" for name in file_names))
+        st.caption(
+            f"🗃️ Version {kb_stats['version']} · {kb_stats['active_questions']} questions in flight"
+            + (" · 🔁 rebuilding..." if kb_stats["rebuilding"] else "")
+        )
+        cache_stats = get_cache_stats()["answers"]
+        st.caption(
+            f"♻️ Answer cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+            f"({cache_stats['hit_rate']:.0%}), {cache_stats['size']}/{cache_stats['max_entries']} entries"
+        )
         if st.button("Reload Data"):
-            st.session_state.kb_loaded = False
+            # Rebuilds in the background; questions keep using the current version until the swap
+            kb_registry.reload()
             st.rerun()
 
+    if "conversation" in st.session_state:
+        conversation_stats = st.session_state.conversation.stats()
+        st.caption(
+            f"💬 {conversation_stats['turns']} turns · context {conversation_stats['context_tokens']} tokens "
+            f"({conversation_stats['verbatim']} verbatim, {conversation_stats['summarized']} summarized)"
+        )
+    if st.button("New Conversation"):
+        st.session_state.pop("messages", None)
+        st.session_state.pop("conversation", None)
+        st.session_state.pop("history_window", None)
+        st.rerun()
+
+    if kb_snapshot is None and kb_stats["rebuilding"]:
+        # First load: nothing to chat with yet, so keep polling (a reload leaves the chat usable)
+        time.sleep(0.5)
+        st.rerun()
+
 # --- MAIN CHAT ---
 st.markdown('<div class="main-header">🧬 DistribIQ</div>', unsafe_allow_html=True)
 st.markdown('<div class="sub-header">AI Decision Support for Ingredient Distribution</div>', unsafe_allow_html=True)
@@ -179,66 +180,82 @@ if "messages" not in st.session_state:
         {"role": "assistant", "content": "Hello! I am DistribIQ. I have access to the Product Master, Pricing Tiers, and Logistics data. How can I help?"}
     ]
 
-# Display Chat History
-for msg in st.session_state.messages:
+# What the model sees of this chat: recent turns + rolling summary + entities, fixed token budget
+if "conversation" not in st.session_state:
+    st.session_state.conversation = Conversation()
+
+# Display Chat History (only the most recent window; older turns are paged in on demand)
+if "history_window" not in st.session_state:
+    st.session_state.history_window = HISTORY_WINDOW
+
+messages = st.session_state.messages
+hidden = max(0, len(messages) - st.session_state.history_window)
+if hidden:
+    col_info, col_more = st.columns([3, 1])
+    col_info.caption(f"🗂️ {hidden} earlier messages hidden")
+    if col_more.button("Show earlier"):
+        st.session_state.history_window += HISTORY_PAGE
+        st.rerun()
+
+for msg in messages[hidden:]:
     with st.chat_message(msg["role"]):
-        if isinstance(msg["content"], str) and msg["content"].strip().startswith("{") and '"answer":' in msg["content"]:
-            try:
-                data = json.loads(msg["content"])
-                
-                # 1. Table
-                if not extract_and_display_table(data.get("answer", "")):
-                    st.markdown(str(data.get("answer", "")))
-                
-                # 2. Pretty Explanation
-                display_pretty_explanation(data.get("explanation"))
-                
-                # 3. Citations
-                if data.get("citations"):
-                    st.caption(f"📚 Sources: {', '.join(data['citations'])}")
-            except:
-                st.markdown(msg["content"])
+        model = ensure_render_model(msg).get("render")
+        if model is not None:
+            display_answer(model)
         else:
             st.markdown(msg["content"])
 
 # --- USER INPUT ---
 if prompt := st.chat_input("Ask about products, shipping, or regulations..."):
-    if not st.session_state.kb_loaded:
+    if kb_registry.current() is None:
         st.error("⚠️ Please click 'Load Knowledge Base' in the sidebar first!")
         st.stop()
 
     st.session_state.messages.append({"role": "user", "content": prompt})
+    # A new turn goes back to the bounded window, however far the user paged back
+    st.session_state.history_window = HISTORY_WINDOW
     with st.chat_message("user"):
         st.markdown(prompt)
 
     with st.chat_message("assistant"):
-        with st.spinner("🧠 Analyzing Decision Matrices..."):
-            
-            # API Key Check
-            if "GOOGLE_API_KEY" not in os.environ:
-                 st.warning("⚠️ No API Key found. Results might be empty (Mock Mode).")
+        # API Key Check
+        if "GOOGLE_API_KEY" not in os.environ:
+             st.warning("⚠️ No API Key found. Results might be empty (Mock Mode).")
 
+        # Hold the snapshot for the whole question: a hot reload can swap in a
+        # new version meanwhile without pulling this one out from under us
+        with kb_registry.acquire() as kb_snapshot:
+            kb_data = kb_snapshot.data
+            conversation = st.session_state.conversation
             state = {
                 "question_id": str(uuid.uuid4())[:8],
-                "question": prompt,
-                "context_files": st.session_state.kb_data["pdf_handles"],
-                "context_text": st.session_state.kb_data["excel_text"],
-                "final_answer": {}
+                "context_files": kb_data["pdf_handles"],
+                "context_text": kb_data["excel_text"],
+                "kb_version": kb_data.get("kb_version", ""),
+                "final_answer": {},
+                # "question" is the standalone form of a follow-up ("and from DSM?" -> which product)
+                **conversation_fields(conversation, prompt),
             }
-            
+
             try:
-                result_state = solver_agent(state)
-                final = result_state["final_answer"]
-                
-                # 1. RENDER TABLE
-                if not extract_and_display_table(final.get("answer", "")):
-                    st.markdown(str(final.get("answer", "")))
-
-                # 2. RENDER PRETTY EXPLANATION
-                display_pretty_explanation(final.get("explanation"))
-                
-                # 3. SAVE HISTORY
-                st.session_state.messages.append({"role": "assistant", "content": json.dumps(final)})
-                
+                # 1. STREAM: show the "answer" field while the model is still writing
+                answer_slot = st.empty()
+                answer_slot.markdown("🧠 *Analyzing Decision Matrices...*")
+                parser = StreamingJSONObject()
+                for chunk in stream_solver(state):
+                    if "answer" in parser.feed(chunk):
+                        partial = parser.value("answer")
+                        if isinstance(partial, str):
+                            answer_slot.markdown(partial + " ▌")
+                answer_slot.empty()
+
+                # 2. RENDER: parse once into a render model, draw it, keep it for reruns
+                message = message_from_answer(state["final_answer"], state.get("timings"))
+                display_answer(message["render"])
+
+                # 3. SAVE HISTORY (the conversation summary updates incrementally)
+                st.session_state.messages.append(message)
+                remember_turn(conversation, state)
+
             except Exception as e:
                 st.error(f"System Error: {e}")
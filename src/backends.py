@@ -0,0 +1,456 @@
+import os
+import json
+import time
+import math
+import random
+import hashlib
+import threading
+from types import SimpleNamespace
+
+# --- 1. CONFIGURATION ---
+# Which backend serves model calls: "gemini" (live API), "record" (live API +
+# write cassettes), "replay" (serve cassettes, no network, no API key) or
+# "mock" (synthetic answers with simulated latency, for load and API tests)
+MODEL_BACKEND = os.environ.get("DISTRIBIQ_BACKEND", "gemini")
+CASSETTE_DIR = os.environ.get(
+    "DISTRIBIQ_CASSETTES",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests", "cassettes")
+)
+# Replay latency: "recorded" (sleep as long as the real call took), "none",
+# or a number of seconds
+REPLAY_LATENCY = os.environ.get("DISTRIBIQ_REPLAY_LATENCY", "recorded")
+REPLAY_CHUNK_CHARS = 40         # Chunk size when a cassette was recorded without streaming
+REPLAY_TTFT_SHARE = 0.3         # Share of the latency spent before the first chunk (non-streamed cassettes)
+
+# Mock latency: log-normal around a median (seconds); sigma 0.5 puts p95 at ~2.3x the median
+MOCK_LATENCY_MEDIAN = float(os.environ.get("DISTRIBIQ_MOCK_LATENCY", "1.5"))
+MOCK_LATENCY_SIGMA = 0.5
+MOCK_TTFT_SHARE = 0.3          # Share of the mock latency spent before the first streamed chunk
+MOCK_ERROR_RATE = float(os.environ.get("DISTRIBIQ_MOCK_ERROR_RATE", "0"))   # Share of calls that raise
+
+USAGE_FIELDS = ("prompt_token_count", "candidates_token_count", "total_token_count", "cached_content_token_count")
+
+
+class CassetteMiss(KeyError):
+    """Raised by the replay backend when no recording matches a request."""
+
+
+def usage_to_dict(usage):
+    """
+    Plain-dict copy of a response's usage_metadata (missing fields -> 0).
+    """
+    if usage is None:
+        return {}
+    if isinstance(usage, dict):
+        return {field: int(usage.get(field, 0) or 0) for field in USAGE_FIELDS}
+    return {field: int(getattr(usage, field, 0) or 0) for field in USAGE_FIELDS}
+
+
+def chunk_text(chunk):
+    """
+    Text of a streamed chunk ("" for chunks that only carry metadata; the
+    Gemini SDK raises instead of returning an empty string).
+    """
+    try:
+        return chunk.text or ""
+    except (AttributeError, ValueError):
+        return ""
+
+
+def request_key(model_name, contents, key_hint=None):
+    """
+    Stable identifier of a model request. Callers pass key_hint (e.g. question +
+    prompt version) because the prompt itself embeds the current time and
+    would never match between runs.
+    """
+    digest = hashlib.sha256(str(model_name).encode("utf-8"))
+    if key_hint is not None:
+        digest.update(b"\0hint\0" + str(key_hint).encode("utf-8"))
+        return digest.hexdigest()[:24]
+    for part in contents if isinstance(contents, (list, tuple)) else [contents]:
+        label = part if isinstance(part, str) else getattr(part, "display_name", None) or getattr(part, "name", "")
+        digest.update(b"\0" + str(label).encode("utf-8"))
+    return digest.hexdigest()[:24]
+
+
+# --- 2. THE INTERFACE ---
+class ModelBackend:
+    """
+    Everything DistribIQ needs from a model provider. Responses expose `.text`
+    and `.usage_metadata` like google.generativeai responses.
+    """
+    name = "base"
+
+    def generate(self, model_name, contents, generation_config=None, key_hint=None, bound_model=None):
+        raise NotImplementedError
+
+    def generate_stream(self, model_name, contents, generation_config=None, key_hint=None, bound_model=None):
+        """
+        Yields response chunks (`.text`, `.usage_metadata`). Backends without
+        native streaming yield the whole response as a single chunk.
+        """
+        yield self.generate(model_name, contents, generation_config, key_hint, bound_model)
+
+    def upload_file(self, path):
+        raise NotImplementedError
+
+    def get_file(self, name):
+        raise NotImplementedError
+
+    def list_models(self):
+        raise NotImplementedError
+
+
+# --- 3. LIVE GEMINI ---
+_genai = None
+_genai_lock = threading.Lock()
+
+def gemini_sdk():
+    """
+    The google.generativeai module, imported and configured (GOOGLE_API_KEY)
+    on first use: processes that never call Gemini (replay, mock, tooling)
+    do not pay for importing it.
+    """
+    global _genai
+    with _genai_lock:
+        if _genai is None:
+            import google.generativeai as genai
+            if os.environ.get("GOOGLE_API_KEY"):
+                genai.configure(api_key=os.environ["GOOGLE_API_KEY"])
+            _genai = genai
+        return _genai
+
+
+class GeminiBackend(ModelBackend):
+    name = "gemini"
+
+    def __init__(self):
+        self.genai = gemini_sdk()
+        self._models = {}           # model name -> GenerativeModel, reused by every call
+
+    def _model(self, model_name, bound_model=None):
+        # bound_model: a GenerativeModel tied to cached content (see prompt_cache.py)
+        if bound_model is not None:
+            return bound_model
+        model = self._models.get(model_name)
+        if model is None:
+            model = self._models.setdefault(model_name, self.genai.GenerativeModel(model_name))
+        return model
+
+    def generate(self, model_name, contents, generation_config=None, key_hint=None, bound_model=None):
+        model = self._model(model_name, bound_model)
+        return model.generate_content(contents, generation_config=generation_config)
+
+    def generate_stream(self, model_name, contents, generation_config=None, key_hint=None, bound_model=None):
+        model = self._model(model_name, bound_model)
+        for chunk in model.generate_content(contents, generation_config=generation_config, stream=True):
+            yield chunk
+
+    def upload_file(self, path):
+        return self.genai.upload_file(path)
+
+    def get_file(self, name):
+        return self.genai.get_file(name)
+
+    def list_models(self):
+        return [
+            m.name for m in self.genai.list_models()
+            if 'generateContent' in m.supported_generation_methods
+        ]
+
+
+# --- 4. RECORD / REPLAY ---
+class RecordingBackend(ModelBackend):
+    """
+    Delegates to a live backend and writes every generate() call (request
+    summary, response text, usage_metadata, latency) to a cassette file.
+    Streamed calls also store the chunks and the time to first token.
+    """
+    name = "record"
+
+    def __init__(self, inner, cassette_dir=CASSETTE_DIR):
+        self.inner = inner
+        self.cassette_dir = os.path.abspath(cassette_dir)
+        self._lock = threading.Lock()
+        os.makedirs(self.cassette_dir, exist_ok=True)
+
+    def generate(self, model_name, contents, generation_config=None, key_hint=None, bound_model=None):
+        start = time.perf_counter()
+        response = self.inner.generate(model_name, contents, generation_config, key_hint, bound_model)
+        latency = time.perf_counter() - start
+        self._write(model_name, contents, key_hint, response.text, getattr(response, "usage_metadata", None), latency)
+        return response
+
+    def generate_stream(self, model_name, contents, generation_config=None, key_hint=None, bound_model=None):
+        start = time.perf_counter()
+        ttft = None
+        chunks = []
+        usage = None
+        for chunk in self.inner.generate_stream(model_name, contents, generation_config, key_hint, bound_model):
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            chunks.append(chunk_text(chunk))
+            usage = getattr(chunk, "usage_metadata", None) or usage     # Last chunk carries the totals
+            yield chunk
+        latency = time.perf_counter() - start
+        self._write(model_name, contents, key_hint, "".join(chunks), usage, latency, chunks=chunks, ttft=ttft)
+
+    def _write(self, model_name, contents, key_hint, text, usage, latency, chunks=None, ttft=None):
+        key = request_key(model_name, contents, key_hint)
+        parts = contents if isinstance(contents, (list, tuple)) else [contents]
+        cassette = {
+            "key": key,
+            "model": model_name,
+            "key_hint": key_hint,
+            "request": {
+                "prompt_chars": sum(len(p) for p in parts if isinstance(p, str)),
+                "files": [getattr(p, "display_name", None) or getattr(p, "name", "") for p in parts if not isinstance(p, str)],
+            },
+            "response": {"text": text, "usage_metadata": usage_to_dict(usage)},
+            "latency_sec": round(latency, 4),
+            "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        if chunks is not None:
+            cassette["response"]["chunks"] = chunks
+            cassette["ttft_sec"] = round(ttft if ttft is not None else latency, 4)
+        path = os.path.join(self.cassette_dir, f"{key}.json")
+        with self._lock:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(cassette, f, indent=2, ensure_ascii=False)
+
+    def upload_file(self, path):
+        return self.inner.upload_file(path)
+
+    def get_file(self, name):
+        return self.inner.get_file(name)
+
+    def list_models(self):
+        return self.inner.list_models()
+
+
+class ReplayBackend(ModelBackend):
+    """
+    Serves recorded responses with simulated latency. Needs no network and no
+    API key, so prompt building, parsing and rendering can be timed on their own.
+    """
+    name = "replay"
+
+    def __init__(self, cassette_dir=CASSETTE_DIR, latency=REPLAY_LATENCY, fallback=None):
+        self.cassette_dir = os.path.abspath(cassette_dir)
+        self.latency = latency
+        self.fallback = fallback        # Optional dict answer for requests without a cassette
+        self._cassettes = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self, key):
+        with self._lock:
+            if key not in self._cassettes:
+                path = os.path.join(self.cassette_dir, f"{key}.json")
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        self._cassettes[key] = json.load(f)
+                except OSError:
+                    self._cassettes[key] = None
+            return self._cassettes[key]
+
+    def _delay(self, cassette):
+        if callable(self.latency):
+            return float(self.latency(cassette))
+        if self.latency in (None, "none", 0):
+            return 0.0
+        if self.latency == "recorded":
+            return float(cassette.get("latency_sec", 0.0)) if cassette else 0.0
+        return float(self.latency)
+
+    def _lookup(self, model_name, contents, key_hint):
+        key = request_key(model_name, contents, key_hint)
+        cassette = self._load(key)
+        if cassette is None:
+            self.misses += 1
+            if self.fallback is None:
+                raise CassetteMiss(f"No cassette for request {key} (hint: {key_hint!r}) in {self.cassette_dir}")
+            return {"response": {"text": json.dumps(self.fallback), "usage_metadata": {}}}
+        self.hits += 1
+        return cassette
+
+    def generate(self, model_name, contents, generation_config=None, key_hint=None, bound_model=None):
+        cassette = self._lookup(model_name, contents, key_hint)
+        time.sleep(self._delay(cassette))
+        return SimpleNamespace(
+            text=cassette["response"]["text"],
+            usage_metadata=SimpleNamespace(**usage_to_dict(cassette["response"].get("usage_metadata"))),
+        )
+
+    def generate_stream(self, model_name, contents, generation_config=None, key_hint=None, bound_model=None):
+        """
+        Replays recorded chunks (or the full text split into REPLAY_CHUNK_CHARS
+        pieces), waiting the recorded time to first token and spreading the
+        rest of the latency over the remaining chunks.
+        """
+        cassette = self._lookup(model_name, contents, key_hint)
+        response = cassette["response"]
+        text = response["text"]
+        chunks = response.get("chunks") or [
+            text[i:i + REPLAY_CHUNK_CHARS] for i in range(0, len(text), REPLAY_CHUNK_CHARS)
+        ] or [""]
+        delay = self._delay(cassette)
+        recorded_latency = float(cassette.get("latency_sec", 0.0) or 0.0)
+        recorded_ttft = cassette.get("ttft_sec")
+        ttft_share = (
+            min(1.0, float(recorded_ttft) / recorded_latency)
+            if recorded_ttft is not None and recorded_latency > 0 else REPLAY_TTFT_SHARE
+        )
+        step = delay * (1 - ttft_share) / max(1, len(chunks) - 1)
+        usage = SimpleNamespace(**usage_to_dict(response.get("usage_metadata")))
+        for i, chunk in enumerate(chunks):
+            time.sleep(delay * ttft_share if i == 0 else step)
+            yield SimpleNamespace(text=chunk, usage_metadata=usage if i == len(chunks) - 1 else None)
+
+    def upload_file(self, path):
+        return _offline_file(path, self.name)
+
+    def get_file(self, name):
+        return SimpleNamespace(name=name, display_name=name, state=SimpleNamespace(name="ACTIVE"), expiration_time=None)
+
+    def list_models(self):
+        models = set()
+        if os.path.isdir(self.cassette_dir):
+            for filename in os.listdir(self.cassette_dir):
+                if filename.endswith(".json"):
+                    cassette = self._load(filename[:-5])
+                    if cassette and cassette.get("model"):
+                        models.add(f"models/{cassette['model']}")
+        return sorted(models)
+
+
+def _offline_file(path, prefix):
+    # Stand-in for an uploaded file handle (offline backends never upload)
+    name = os.path.basename(path)
+    return SimpleNamespace(
+        name=f"files/{prefix}-{hashlib.sha256(name.encode()).hexdigest()[:12]}",
+        display_name=name,
+        state=SimpleNamespace(name="ACTIVE"),
+        expiration_time=None,
+    )
+
+
+# --- 5. MOCK ---
+class MockBackend(ModelBackend):
+    """
+    Synthetic answers after a random (log-normal) latency, with token counts
+    estimated from the prompt size. For API, load and UI tests without
+    cassettes, network or API key; the answers carry no information.
+
+    Faults can be injected: `model_latency` ({model name: median seconds})
+    makes some models slower, `error_rate` (overall or per model, same shape)
+    is the share of calls that raise after their latency.
+    """
+    name = "mock"
+
+    def __init__(self, latency_median=MOCK_LATENCY_MEDIAN, latency_sigma=MOCK_LATENCY_SIGMA, seed=None,
+                 error_rate=MOCK_ERROR_RATE, model_latency=None):
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.model_latency = dict(model_latency or {})
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.calls_by_model = {}
+
+    def sample_latency(self, model_name=None):
+        median = self.model_latency.get(model_name, self.latency_median)
+        with self._lock:
+            self.calls += 1
+            self.calls_by_model[model_name] = self.calls_by_model.get(model_name, 0) + 1
+            if median <= 0:
+                return 0.0
+            return self._random.lognormvariate(math.log(median), self.latency_sigma)
+
+    def _maybe_fail(self, model_name):
+        rate = self.error_rate.get(model_name, 0.0) if isinstance(self.error_rate, dict) else self.error_rate
+        with self._lock:
+            failed = rate > 0 and self._random.random() < rate
+        if failed:
+            raise RuntimeError(f"mock backend: injected error ({model_name})")
+
+    def _response(self, contents, key_hint):
+        question = str(key_hint).split("|")[-1] if key_hint else "the question"
+        text = json.dumps({
+            "answer": f"[mock] Answer to: {question}",
+            "table": None,
+            "explanation": "1. Synthetic answer from the mock backend.",
+            "citations": [],
+            "confidence": 0.5,
+        })
+        prompt_chars = sum(len(part) for part in (contents if isinstance(contents, (list, tuple)) else [contents])
+                           if isinstance(part, str))
+        usage = {"prompt_token_count": prompt_chars // 4, "candidates_token_count": len(text) // 4}
+        usage["total_token_count"] = usage["prompt_token_count"] + usage["candidates_token_count"]
+        return text, SimpleNamespace(**usage_to_dict(usage))
+
+    def generate(self, model_name, contents, generation_config=None, key_hint=None, bound_model=None):
+        time.sleep(self.sample_latency(model_name))
+        self._maybe_fail(model_name)
+        text, usage = self._response(contents, key_hint)
+        return SimpleNamespace(text=text, usage_metadata=usage)
+
+    def generate_stream(self, model_name, contents, generation_config=None, key_hint=None, bound_model=None):
+        latency = self.sample_latency(model_name)
+        text, usage = self._response(contents, key_hint)
+        # A failing stream fails before its first chunk
+        time.sleep(latency * MOCK_TTFT_SHARE)
+        self._maybe_fail(model_name)
+        chunks = [text[i:i + REPLAY_CHUNK_CHARS] for i in range(0, len(text), REPLAY_CHUNK_CHARS)]
+        step = latency * (1 - MOCK_TTFT_SHARE) / max(1, len(chunks) - 1)
+        for i, chunk in enumerate(chunks):
+            if i:
+                time.sleep(step)
+            yield SimpleNamespace(text=chunk, usage_metadata=usage if i == len(chunks) - 1 else None)
+
+    def upload_file(self, path):
+        return _offline_file(path, self.name)
+
+    def get_file(self, name):
+        return SimpleNamespace(name=name, display_name=name, state=SimpleNamespace(name="ACTIVE"), expiration_time=None)
+
+    def list_models(self):
+        return ["models/mock"]
+
+
+# --- 6. SHARED INSTANCE ---
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend():
+    """
+    Returns the process-wide backend selected by MODEL_BACKEND.
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = make_backend(MODEL_BACKEND)
+        return _backend
+
+
+def set_backend(backend):
+    """
+    Swaps the process-wide backend (benchmarks, offline runs).
+    """
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+def make_backend(kind, cassette_dir=CASSETTE_DIR):
+    if kind == "gemini":
+        return GeminiBackend()
+    if kind == "record":
+        return RecordingBackend(GeminiBackend(), cassette_dir)
+    if kind == "replay":
+        return ReplayBackend(cassette_dir)
+    if kind == "mock":
+        return MockBackend()
+    raise ValueError(f"Unknown model backend '{kind}' (expected gemini, record, replay or mock)")
@@ -0,0 +1,323 @@
+import re
+import threading
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+
+try:
+    from query_engine import normalize, _range_bounds, SKU_COLUMN
+except ImportError:
+    from src.query_engine import normalize, _range_bounds, SKU_COLUMN
+
+# --- 1. CONFIGURATION ---
+HOME_COUNTRY = "Netherlands"        # Calendar used when a product has no route in the Logistics Matrix
+WORKDAYS_PER_WEEK = 5               # Lead times in weeks are converted to business days
+WEEKMASK = "1111100"                # Mon-Fri
+
+# Public holidays per country: fixed "MM-DD" dates, offsets from Easter
+# Sunday (-2 Good Friday, 1 Easter Monday, 39 Ascension, 50 Whit Monday)
+# and (month, weekday, n) rules (n=-1: last). Holidays without a rule
+# (lunar calendars, one-off bridge days) go into EXTRA_HOLIDAYS.
+HOLIDAY_CALENDARS = {
+    "Netherlands": {"fixed": ["01-01", "04-27", "12-25", "12-26"], "easter": [-2, 1, 39, 50]},
+    "Germany": {"fixed": ["01-01", "05-01", "10-03", "12-25", "12-26"], "easter": [-2, 1, 39, 50]},
+    "Switzerland": {"fixed": ["01-01", "01-02", "08-01", "12-25", "12-26"], "easter": [-2, 1, 39, 50]},
+    "France": {"fixed": ["01-01", "05-01", "05-08", "07-14", "08-15", "11-01", "11-11", "12-25"], "easter": [1, 39, 50]},
+    "Belgium": {"fixed": ["01-01", "05-01", "07-21", "08-15", "11-01", "11-11", "12-25"], "easter": [1, 39, 50]},
+    "Italy": {"fixed": ["01-01", "01-06", "04-25", "05-01", "06-02", "08-15", "11-01", "12-08", "12-25", "12-26"], "easter": [1]},
+    "Spain": {"fixed": ["01-01", "01-06", "05-01", "08-15", "10-12", "11-01", "12-06", "12-08", "12-25"], "easter": [-2]},
+    "Austria": {"fixed": ["01-01", "01-06", "05-01", "08-15", "10-26", "11-01", "12-08", "12-25", "12-26"], "easter": [1, 39, 50, 60]},
+    "UK": {"fixed": ["01-01", "12-25", "12-26"], "easter": [-2, 1], "weekday": [(5, 0, 1), (5, 0, -1), (8, 0, -1)]},
+    "USA": {"fixed": ["01-01", "06-19", "07-04", "11-11", "12-25"],
+            "weekday": [(1, 0, 3), (2, 0, 3), (5, 0, -1), (9, 0, 1), (10, 0, 2), (11, 3, 4)]},
+    "Singapore": {"fixed": ["01-01", "05-01", "08-09", "12-25"], "easter": [-2]},
+    "China": {"fixed": ["01-01", "05-01", "10-01", "10-02", "10-03"]},
+}
+EXTRA_HOLIDAYS = {}                 # country -> ["YYYY-MM-DD", ...]
+
+# Logistics Matrix location -> country (anything else: the name minus " DC")
+LOCATION_COUNTRIES = {
+    "USA - East Coast": "USA",
+    "Rotterdam Port": "Netherlands",
+    "Shanghai": "China",
+    "Singapore": "Singapore",
+}
+
+_DATE_QUESTION = re.compile(
+    r"\b(arrive|arrives|arrival|deliver|delivered|delivery|eta|dispatch|ship date"
+    r"|when (?:can|could|would|will|do) (?:we|i|it|they) (?:get|receive|have|expect))\b", re.I
+)
+_NOT_A_DATE_LOOKUP = (
+    "price", "cost", "cheapest", "compare", " vs ", "versus", "document", "customs", "complian",
+    "regulat", "why", "recommend", "should", "calculate total",
+)
+
+
+# --- 2. HOLIDAYS ---
+def easter_sunday(year):
+    """
+    Gregorian Easter Sunday (anonymous Gregorian algorithm).
+    """
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = b // 4, b % 4
+    g = (8 * b + 13) // 25
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month = (h + l - 7 * m + 114) // 31
+    day = (h + l - 7 * m + 114) % 31 + 1
+    return date(year, month, day)
+
+
+def _nth_weekday(year, month, weekday, n):
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = (date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1))
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def holidays_for(country, years):
+    """
+    Public holidays of a country in the given years, as datetime64[D].
+    """
+    rules = HOLIDAY_CALENDARS.get(country, {})
+    days = []
+    for year in years:
+        days += [date(year, int(md[:2]), int(md[3:])) for md in rules.get("fixed", [])]
+        easter = easter_sunday(year)
+        days += [easter + timedelta(days=offset) for offset in rules.get("easter", [])]
+        days += [_nth_weekday(year, *rule) for rule in rules.get("weekday", [])]
+    days += [date.fromisoformat(d) for d in EXTRA_HOLIDAYS.get(country, [])]
+    return np.array(sorted(set(days)), dtype="datetime64[D]")
+
+
+_calendars = {}
+_calendars_lock = threading.Lock()
+
+def business_calendar(country, years):
+    """
+    np.busdaycalendar for a country (Mon-Fri minus its holidays), cached.
+    """
+    key = (country, tuple(years))
+    with _calendars_lock:
+        calendar = _calendars.get(key)
+        if calendar is None:
+            calendar = np.busdaycalendar(weekmask=WEEKMASK, holidays=holidays_for(country, years))
+            _calendars[key] = calendar
+        return calendar
+
+
+def location_country(location):
+    location = str(location).strip()
+    return LOCATION_COUNTRIES.get(location, location[:-3] if location.endswith(" DC") else location)
+
+
+def add_business_days(start, days, countries, years):
+    """
+    Vectorized busday_offset: start (date or array) + days (array) business
+    days, each row on its own country's calendar. Starts on a non-working
+    day roll forward to the next working day first.
+    """
+    days = np.asarray(days, dtype="int64")
+    start = np.broadcast_to(np.asarray(start, dtype="datetime64[D]"), days.shape)
+    countries = np.asarray(countries)
+    result = np.empty(days.shape, dtype="datetime64[D]")
+    for country in np.unique(countries):
+        mask = countries == country
+        calendar = business_calendar(country, years)
+        result[mask] = np.busday_offset(start[mask], days[mask], roll="forward", busdaycal=calendar)
+    return result
+
+
+# --- 3. THE DELIVERY SCHEDULE ---
+def delivery_schedule(sheets, order_date):
+    """
+    Earliest/latest dispatch and arrival dates of every product route when
+    ordered on `order_date`, computed in one batch:
+        dispatch = order + lead time (weeks x 5 business days, origin calendar)
+        arrival  = dispatch + quality hold + transit (business days, destination calendar)
+    Products without a route in the Logistics Matrix get dispatch dates only.
+    `sheets` are the typed sheets of a StructuredQueryEngine.
+    """
+    master = sheets["Product Master Data"]
+    logistics = sheets.get("Logistics Matrix")
+    quality = sheets.get("Quality Requirements")
+
+    holds = {}
+    if quality is not None and "Quality Hold (days)" in quality.columns:
+        holds = dict(zip(quality[SKU_COLUMN], pd.to_numeric(quality["Quality Hold (days)"], errors="coerce").fillna(0)))
+
+    routes = []
+    routed = set()
+    if logistics is not None:
+        for pos, row in enumerate(logistics.to_dict("records")):
+            routed.add(row[SKU_COLUMN])
+            routes.append({
+                SKU_COLUMN: row[SKU_COLUMN],
+                "Origin": f"{row['Origin City']}, {row['Origin Country']}",
+                "Destination": row["Destination City"],
+                "Method": row["Shipping Method"],
+                "origin_country": str(row["Origin Country"]).strip(),
+                "destination_country": location_country(row["Destination City"]),
+                "transit": _range_bounds(row["Transit Time (days)"]),
+                "Transit (days)": str(row["Transit Time (days)"]),
+                "logistics_row": pos + 2,
+            })
+    for sku in master[SKU_COLUMN]:
+        if sku not in routed:
+            routes.append({
+                SKU_COLUMN: sku, "Origin": "", "Destination": "", "Method": "",
+                "origin_country": HOME_COUNTRY, "destination_country": HOME_COUNTRY,
+                "transit": (0.0, 0.0), "Transit (days)": "", "logistics_row": None,
+            })
+
+    df = pd.DataFrame(routes)
+    indexed = master.set_index(SKU_COLUMN)
+    skus = df[SKU_COLUMN]
+    df["Product Name"] = skus.map(indexed["Product Name"])
+    df["Lead Time (weeks)"] = skus.map(indexed["Lead Time (weeks)"])
+    df["master_row"] = skus.map({sku: pos + 2 for pos, sku in enumerate(master[SKU_COLUMN])})
+    lead_min = np.nan_to_num(skus.map(indexed["_lead_min"]).to_numpy(dtype="float64"))
+    lead_max = np.nan_to_num(skus.map(indexed["_lead_max"]).to_numpy(dtype="float64"))
+    hold = skus.map(holds).fillna(0).to_numpy(dtype="float64")
+    transit = np.array([[t[0] or 0, t[1] or 0] for t in df["transit"]], dtype="float64").reshape(-1, 2)
+    transit_min, transit_max = transit[:, 0], transit[:, 1]
+
+    order_day = np.datetime64(order_date, "D")
+    # Holidays of every year the longest route can reach
+    horizon = int((lead_max.max(initial=0) * WORKDAYS_PER_WEEK + hold.max(initial=0) + transit_max.max(initial=0)) * 2) + 14
+    years = range(order_date.year, (order_date + timedelta(days=horizon)).year + 1)
+
+    order = add_business_days(order_day, np.zeros(len(df)), df["origin_country"], years)
+    ship_early = add_business_days(order, np.ceil(lead_min * WORKDAYS_PER_WEEK), df["origin_country"], years)
+    ship_late = add_business_days(order, np.ceil(lead_max * WORKDAYS_PER_WEEK), df["origin_country"], years)
+    arrive_early = add_business_days(ship_early, np.ceil(hold + transit_min), df["destination_country"], years)
+    arrive_late = add_business_days(ship_late, np.ceil(hold + transit_max), df["destination_country"], years)
+
+    df["Quality Hold (days)"] = hold.astype(int)
+    df["Dispatch Earliest"] = ship_early
+    df["Dispatch Latest"] = ship_late
+    df["Arrival Earliest"] = arrive_early
+    df["Arrival Latest"] = arrive_late
+    return df.drop(columns=["transit"])
+
+
+_schedules = {}
+_schedules_lock = threading.Lock()
+
+def get_delivery_schedule(engine, order_date):
+    """
+    delivery_schedule for a StructuredQueryEngine, computed once per engine and order date.
+    """
+    key = (id(engine), order_date)
+    with _schedules_lock:
+        entry = _schedules.get(key)
+        if entry is None or entry[0] is not engine:
+            _schedules.clear()
+            entry = (engine, delivery_schedule(engine.sheets, order_date))
+            _schedules[key] = entry
+        return entry[1]
+
+
+# --- 4. USING THE DATES ---
+def is_date_question(question):
+    return bool(_DATE_QUESTION.search(str(question)))
+
+
+def _fmt(day):
+    return pd.Timestamp(day).strftime("%a %Y-%m-%d")
+
+
+def _routes_for(engine, question, order_date):
+    skus = engine.match_products(question)
+    if not skus:
+        return None, skus
+    schedule = get_delivery_schedule(engine, order_date)
+    routes = schedule[schedule[SKU_COLUMN].isin(skus)]
+    q = normalize(question)
+    named = routes[[normalize(location_country(d)).strip() in q or normalize(d).strip() in q
+                    for d in routes["Destination"]]]
+    return (named if not named.empty else routes), skus
+
+
+def dates_context(engine, question, order_date):
+    """
+    Pre-computed dates for the products named in a date question, as a
+    prompt block; "" when the question is not about dates or names no product.
+    """
+    if not is_date_question(question):
+        return ""
+    routes, _ = _routes_for(engine, question, order_date)
+    if routes is None or routes.empty:
+        return ""
+    lines = [
+        "| SKU | Product | Route | Lead Time (weeks) | Quality Hold (days) | Transit (days) | Dispatch | Arrival |",
+        "|---|---|---|---|---|---|---|---|",
+    ]
+    for row in routes.to_dict("records"):
+        route = f"{row['Origin']} → {row['Destination']} ({row['Method']})" if row["Method"] else "ex works"
+        lines.append(
+            f"| {row[SKU_COLUMN]} | {row['Product Name']} | {route} | {row['Lead Time (weeks)']} | "
+            f"{row['Quality Hold (days)']} | {row['Transit (days)'] or '-'} | "
+            f"{_fmt(row['Dispatch Earliest'])} – {_fmt(row['Dispatch Latest'])} | "
+            f"{_fmt(row['Arrival Earliest'])} – {_fmt(row['Arrival Latest'])} |"
+        )
+    return "\n".join(lines)
+
+
+def answer_delivery(engine, question, order_date):
+    """
+    Answers "when would X arrive if I order today?" locally for a single
+    product, or returns None (several products, or the question also needs
+    prices, documents or reasoning).
+    """
+    q = normalize(question)
+    if not is_date_question(question) or any(marker in q for marker in _NOT_A_DATE_LOOKUP):
+        return None
+    routes, skus = _routes_for(engine, question, order_date)
+    if routes is None or len(skus) != 1 or routes.empty:
+        return None
+
+    first = routes.iloc[0]
+    product = f"{first['Product Name']} ({first[SKU_COLUMN]})"
+    columns = ["Route", "Method", "Transit (days)", "Dispatch", "Arrival"]
+    rows, summary = [], []
+    for row in routes.to_dict("records"):
+        dispatch = f"{_fmt(row['Dispatch Earliest'])} – {_fmt(row['Dispatch Latest'])}"
+        arrival = f"{_fmt(row['Arrival Earliest'])} – {_fmt(row['Arrival Latest'])}"
+        between = f"between {_fmt(row['Arrival Earliest'])} and {_fmt(row['Arrival Latest'])}"
+        if row["Method"]:
+            rows.append([f"{row['Origin']} → {row['Destination']}", row["Method"], row["Transit (days)"], dispatch, arrival])
+            summary.append(f"{row['Destination']} by {row['Method'].lower()} {between}")
+        else:
+            # No route: "arrival" is when the goods are released at the supplier
+            rows.append(["Ex works (no route in Logistics Matrix)", "", "", dispatch, arrival])
+            summary.append(f"ready for collection {between}")
+
+    hold = int(first["Quality Hold (days)"])
+    hold_step = f" + {hold} quality-hold days" if hold else ""
+    citations = [f"Product Master Data (Row {first['master_row']})"]
+    citations += [f"Logistics Matrix (Row {int(r)})" for r in routes["logistics_row"].dropna()]
+    if hold:
+        citations.append("Quality Requirements")
+    return {
+        "answer": (
+            f"{product} has a lead time of {first['Lead Time (weeks)']} weeks. "
+            f"Ordered on {_fmt(order_date)}, it arrives at " + "; ".join(summary) + "."
+            if first["Method"] else
+            f"{product} has a lead time of {first['Lead Time (weeks)']} weeks. "
+            f"Ordered on {_fmt(order_date)}, it is " + "; ".join(summary) + "."
+        ),
+        "table": {"columns": columns, "rows": rows},
+        "explanation": (
+            f"1. Matched the question to {product}; lead time {first['Lead Time (weeks)']} weeks "
+            f"= {WORKDAYS_PER_WEEK} business days per week from {_fmt(order_date)} on the origin country's calendar.\n"
+            f"2. Arrival = dispatch{hold_step} + transit days, counted in business days (Mon-Fri) "
+            f"excluding public holidays of the destination country.\n"
+            f"3. Dates computed locally from the Logistics Matrix routes."
+        ),
+        "citations": citations,
+        "confidence": 1.0,
+    }
@@ -0,0 +1,133 @@
+import math
+from collections import Counter
+
+# --- 1. CONFIGURATION ---
+# "markdown": tabulate pipe tables (original format)
+# "compact":  header-once tab-separated rows, no padding, long repeated
+#             cell values replaced by short @N codes with one legend
+ENCODINGS = ("markdown", "compact")
+DICT_MIN_LENGTH = 12        # Only values at least this long are worth a code
+DICT_MIN_COUNT = 2          # ...and only if they repeat
+CHARS_PER_TOKEN = 4         # Rough Gemini tokenizer ratio for tabular text
+
+# Identifiers the model has to quote back verbatim are never coded
+DICT_EXCLUDED_COLUMNS = {"PharmaCo SKU", "Product Name", "Scenario ID", "Rule ID"}
+
+
+def estimate_tokens(text):
+    """
+    Rough token count of a text, or of a list/tuple of prompt parts (counted
+    without joining them).
+    """
+    if isinstance(text, (list, tuple)):
+        return sum(len(part) for part in text) // CHARS_PER_TOKEN + 1
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def format_cell(value):
+    """
+    Renders one cell the way a person would type it (no NaN, no trailing .0).
+    """
+    import pandas as pd     # Already loaded by whoever read the cells
+    if isinstance(value, pd.Timestamp):
+        return value.strftime("%Y-%m-%d")
+    if isinstance(value, float):
+        if math.isnan(value):
+            return ""
+        if value.is_integer():
+            return str(int(value))
+    return str(value).replace("\t", " ").replace("\n", " ").strip()
+
+
+# --- 2. DICTIONARY ENCODING ---
+def build_dictionary(sheets):
+    """
+    Maps long, repeated cell values (supplier names, grades, compliance
+    statuses, ...) to short codes. Most frequent values get the shortest codes.
+    """
+    counts = Counter()
+    for df in sheets.values():
+        columns = [
+            c for c in df.columns
+            if not str(c).startswith("_") and c not in DICT_EXCLUDED_COLUMNS
+        ]
+        for values in df[columns].itertuples(index=False, name=None):
+            for value in values:
+                cell = format_cell(value)
+                if len(cell) >= DICT_MIN_LENGTH:
+                    counts[cell] += 1
+
+    dictionary = {}
+    for value, count in counts.most_common():
+        if count < DICT_MIN_COUNT:
+            break
+        code = f"@{len(dictionary) + 1}"
+        # A code must actually save characters across all its uses
+        if (len(value) - len(code)) * count > len(value) + len(code) + 4:
+            dictionary[value] = code
+    return dictionary
+
+
+def encode_cells(cells, columns, dictionary):
+    return "\t".join(
+        cell if column in DICT_EXCLUDED_COLUMNS else dictionary.get(cell, cell)
+        for cell, column in zip(cells, columns)
+    )
+
+
+def legend(dictionary, used_codes=None):
+    """
+    Renders the code table (optionally only the codes that were used).
+    """
+    entries = [
+        f"{code}\t{value}" for value, code in dictionary.items()
+        if used_codes is None or code in used_codes
+    ]
+    if not entries:
+        return ""
+    return "\n### DICTIONARY (cells written as @N stand for these values)\n" + "\n".join(entries) + "\n"
+
+
+def used_codes(lines):
+    return {token for line in lines for token in line.split("\t") if token.startswith("@")}
+
+
+# --- 3. WORKBOOK ENCODERS ---
+def encode_workbook(sheets, source_file, encoding="markdown"):
+    """
+    Renders every sheet of the workbook in the selected encoding.
+    """
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown encoding '{encoding}', expected one of {ENCODINGS}")
+
+    full_text = f"--- SOURCE FILE: {source_file} ---\n"
+    if encoding == "markdown":
+        for sheet_name, df in sheets.items():
+            full_text += f"\n### SHEET: {sheet_name}\n{df.to_markdown(index=False)}\n"
+        return full_text
+
+    dictionary = build_dictionary(sheets)
+    body = ""
+    lines = []
+    for sheet_name, df in sheets.items():
+        columns = [c for c in df.columns if not str(c).startswith("_")]
+        rows = [
+            encode_cells([format_cell(v) for v in values], columns, dictionary)
+            for values in df[columns].itertuples(index=False, name=None)
+        ]
+        lines.extend(rows)
+        body += f"\n### SHEET: {sheet_name} (tab-separated)\n" + "\t".join(map(str, columns)) + "\n"
+        body += "\n".join(rows) + "\n"
+    return full_text + legend(dictionary, used_codes(lines)) + body
+
+
+def compare_encodings(sheets, source_file):
+    """
+    Returns estimated token counts for each encoding and the compact saving.
+    """
+    report = {
+        encoding: estimate_tokens(encode_workbook(sheets, source_file, encoding))
+        for encoding in ENCODINGS
+    }
+    report["reduction_pct"] = round(100 * (1 - report["compact"] / report["markdown"]), 1)
+    return report
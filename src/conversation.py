@@ -0,0 +1,209 @@
+import re
+
+try:
+    from context_encoder import estimate_tokens
+    from query_engine import normalize, SKU_PATTERN
+except ImportError:
+    from src.context_encoder import estimate_tokens
+    from src.query_engine import normalize, SKU_PATTERN
+
+# --- 1. CONFIGURATION ---
+CONVERSATION_TOKEN_BUDGET = 600     # Max (estimated) tokens of conversation context per prompt
+RECENT_TURNS = 3                    # Latest turns kept verbatim (question + clipped answer)
+ANSWER_CLIP_CHARS = 300             # Verbatim answers are cut to this length
+SUMMARY_LINE_CHARS = 160            # Each older turn is folded into one summary line of at most this length
+MAX_ENTITIES = 8                    # Per kind, most recently mentioned first
+FOLLOW_UP_MAX_WORDS = 6             # Shorter questions naming no product are treated as follow-ups
+
+ENTITY_KINDS = ("products", "skus", "suppliers", "countries")
+CARRIED_KINDS = ("products", "suppliers", "countries")     # SKUs travel as product names
+
+# "and what about ...", "is it ...", "those ones": the question leans on an earlier turn
+_FOLLOW_UP = re.compile(
+    r"^\s*(?:and|also|what about|how about|same|then|but|or)\b"
+    r"|\b(?:it|its|it's|they|them|their|that one|this one|those|these|the same|that supplier|that product)\b",
+    re.I,
+)
+_country_pattern = None
+
+
+def _countries():
+    """
+    Pattern of the countries calendar_engine.py has holidays for, built on
+    first use (calendar_engine loads numpy and pandas).
+    """
+    global _country_pattern
+    if _country_pattern is None:
+        try:
+            from calendar_engine import HOLIDAY_CALENDARS
+        except ImportError:
+            from src.calendar_engine import HOLIDAY_CALENDARS
+        _country_pattern = re.compile(r"\b(" + "|".join(re.escape(c) for c in HOLIDAY_CALENDARS) + r")\b")
+    return _country_pattern
+
+
+# --- 2. ENTITIES ---
+def extract_entities(text, engine=None):
+    """
+    {"products", "skus", "suppliers", "countries"} mentioned in `text`.
+    Products and suppliers are resolved with the query engine's indexes
+    (query_engine.py); without an engine only SKUs and countries are found.
+    """
+    found = {kind: [] for kind in ENTITY_KINDS}
+    text = str(text)
+    if engine is not None:
+        skus = sorted(_mentioned_skus(engine, text))
+        found["skus"] = skus
+        found["products"] = [engine.products[sku].get("Product Name", sku) for sku in skus]
+        q = normalize(text)
+        suppliers = set()
+        for alias, supplier_skus in engine.supplier_index.items():
+            if f" {alias} " in q:
+                suppliers |= {engine.products[sku].get("Supplier Name", "") for sku in supplier_skus}
+        found["suppliers"] = sorted(s for s in suppliers if s)
+    else:
+        found["skus"] = sorted(set(SKU_PATTERN.findall(text)))
+    found["countries"] = sorted(set(_countries().findall(text)))
+    return {kind: _unique(values) for kind, values in found.items()}
+
+
+def _mentioned_skus(engine, text):
+    skus = engine.match_products(text)
+    if skus:
+        return skus
+    # match_products narrows by supplier ("citric acid ... DSM" -> none); a
+    # mention of the product still counts here
+    q = normalize(text)
+    aliases = [a for a in engine.alias_index if f" {a} " in q]
+    return {sku for a in aliases if not any(a != b and a in b for b in aliases) for sku in engine.alias_index[a]}
+
+
+def _unique(values):
+    seen = []
+    for value in values:
+        if value and value not in seen:
+            seen.append(value)
+    return seen
+
+
+def answer_text(final_answer):
+    """
+    The answer sentence of a final answer dict ("" for errors).
+    """
+    if not isinstance(final_answer, dict) or "error" in final_answer:
+        return ""
+    return re.sub(r"\s+", " ", str(final_answer.get("answer", ""))).strip()
+
+
+def _clip(text, limit):
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + "…"
+
+
+# --- 3. THE CONVERSATION ---
+class Conversation:
+    """
+    Bounded context of one chat session: the last RECENT_TURNS turns
+    verbatim, one summary line per older turn and the entities (products,
+    SKUs, suppliers, countries) discussed so far. Updated incrementally
+    after each answer (no model call); context() always fits the token
+    budget, however long the session gets.
+    """
+
+    def __init__(self, recent_turns=RECENT_TURNS, token_budget=CONVERSATION_TOKEN_BUDGET):
+        self.recent_turns = recent_turns
+        self.token_budget = token_budget
+        self.turns = []                 # [{"question", "answer"}], oldest first
+        self.summary = []               # One line per turn that left the verbatim window
+        self.entities = {kind: [] for kind in ENTITY_KINDS}    # Most recent first
+        self.focus = {kind: [] for kind in ENTITY_KINDS}       # What the latest turn was about
+        self.turn_count = 0
+
+    # --- Updating ---
+    def add_turn(self, question, final_answer, engine=None):
+        """
+        Folds one answered question in. `question` should be the resolved
+        form (see resolve()) so chained follow-ups keep their subject.
+        """
+        answer = answer_text(final_answer)
+        asked = extract_entities(question, engine)
+        told = extract_entities(answer, engine)
+        for kind in ENTITY_KINDS:
+            self.entities[kind] = _unique(asked[kind] + told[kind] + self.entities[kind])[:MAX_ENTITIES]
+        # A follow-up refers to what the last question was about: a question
+        # naming a product starts a new subject, one naming only a supplier or
+        # country refines the current one; a question naming nothing takes
+        # its subject from the answer
+        if asked["products"]:
+            self.focus = asked
+        elif any(asked[kind] for kind in CARRIED_KINDS):
+            self.focus = {kind: asked[kind] or self.focus[kind] for kind in ENTITY_KINDS}
+        elif any(told[kind] for kind in CARRIED_KINDS):
+            self.focus = {kind: values[:2] for kind, values in told.items()}
+
+        self.turns.append({"question": question, "answer": _clip(answer or "(no answer)", ANSWER_CLIP_CHARS)})
+        self.turn_count += 1
+        while len(self.turns) > self.recent_turns:
+            old = self.turns.pop(0)
+            self.summary.append(_clip(f"{old['question']} → {old['answer']}", SUMMARY_LINE_CHARS))
+        self._fit()
+
+    def _fit(self):
+        # Oldest summary lines go first, then verbatim turns shrink to summary lines
+        while self.summary and estimate_tokens(self.context()) > self.token_budget:
+            self.summary.pop(0)
+        while len(self.turns) > 1 and estimate_tokens(self.context()) > self.token_budget:
+            old = self.turns.pop(0)
+            self.summary = [_clip(f"{old['question']} → {old['answer']}", SUMMARY_LINE_CHARS)]
+            if estimate_tokens(self.context()) > self.token_budget:
+                self.summary = []
+
+    # --- Reading ---
+    def is_follow_up(self, question, engine=None):
+        if not self.turns:
+            return False
+        if _FOLLOW_UP.search(str(question)):
+            return True
+        own = extract_entities(question, engine)
+        return len(str(question).split()) <= FOLLOW_UP_MAX_WORDS and not (own["products"] or own["skus"])
+
+    def resolve(self, question, engine=None):
+        """
+        Standalone form of a follow-up: the products, suppliers and countries
+        it refers back to are appended, e.g. "and what about from DSM?" ->
+        "and what about from DSM? (about: Citric Acid Anhydrous BP/USP/FCC)".
+        Kinds the question names itself are not carried over. Other
+        questions are returned unchanged.
+        """
+        if not self.is_follow_up(question, engine):
+            return question
+        own = extract_entities(question, engine)
+        carried = []
+        for kind in CARRIED_KINDS:
+            if own[kind] or (kind == "products" and own["skus"]):
+                continue
+            carried.extend(self.focus[kind])
+        if not carried:
+            return question
+        return f"{str(question).rstrip()} (about: {', '.join(carried)})"
+
+    def context(self):
+        """
+        Conversation block for the prompt ("" before the first answer).
+        """
+        if not self.turns:
+            return ""
+        lines = []
+        if self.summary:
+            lines.append("Earlier (summary):")
+            lines += [f"- {line}" for line in self.summary]
+        lines.append("Recent turns:")
+        for turn in self.turns:
+            lines += [f"Q: {turn['question']}", f"A: {turn['answer']}"]
+        discussed = [f"{kind}: {', '.join(values)}" for kind, values in self.entities.items() if values]
+        if discussed:
+            lines.append("Already discussed: " + "; ".join(discussed))
+        return "\n".join(lines)
+
+    def stats(self):
+        return {"turns": self.turn_count, "summarized": len(self.summary), "verbatim": len(self.turns),
+                "context_tokens": estimate_tokens(self.context()) if self.turns else 0}
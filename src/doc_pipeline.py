@@ -0,0 +1,352 @@
+import os
+import json
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+try:
+    from kb_cache import CACHE_DIR, file_hash
+    from pdf_index import extract_pages, PdfTextUnavailable
+except ImportError:
+    from src.kb_cache import CACHE_DIR, file_hash
+    from src.pdf_index import extract_pages, PdfTextUnavailable
+
+# --- 1. CONFIGURATION ---
+DOCUMENTS_MANIFEST = "documents.json"
+ARTIFACT_DIR = "artifacts"
+SNAPSHOT_SUBDIR = "snapshots"   # Workbook snapshots under the cache dir (snapshot.SNAPSHOT_DIR by default)
+PARSE_WORKERS = max(1, min(8, (os.cpu_count() or 2) - 1))   # Parsing is CPU-bound: one process per core
+INLINE_PARSE_LIMIT = 1          # Parse this many files or fewer in-process (pool start-up costs ~1s)
+
+EXCEL_EXTENSIONS = (".xlsx", ".xls")
+PDF_EXTENSIONS = (".pdf",)
+
+STATUS_READY = "ready"
+STATUS_ERROR = "error"
+
+
+def document_kind(filename):
+    name = filename.lower()
+    if name.endswith(EXCEL_EXTENSIONS):
+        return "excel"
+    if name.endswith(PDF_EXTENSIONS):
+        return "pdf"
+    return None
+
+
+def scan_documents(folder, include=None):
+    """
+    Returns {relative path: absolute path} of every Excel/PDF file under
+    `folder` (hidden files and folders, e.g. the cache, are skipped). With
+    `include`, only those relative paths are kept.
+    """
+    found = {}
+    folder = os.path.abspath(folder)
+    for root, dirs, files in os.walk(folder):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for filename in sorted(files):
+            if filename.startswith(".") or filename.startswith("~$") or document_kind(filename) is None:
+                continue
+            path = os.path.join(root, filename)
+            rel = os.path.relpath(path, folder).replace(os.sep, "/")
+            if include is None or rel in include:
+                found[rel] = path
+    return found
+
+
+# --- 2. PARSE WORKERS (run in child processes: top-level and picklable) ---
+def parse_excel(path, encoding, snapshot_dir, force=False):
+    try:
+        from context_encoder import encode_workbook, compare_encodings
+        from snapshot import read_workbook
+    except ImportError:
+        from src.context_encoder import encode_workbook, compare_encodings
+        from src.snapshot import read_workbook
+    # Also leaves the columnar snapshot behind for the query engine
+    sheets = read_workbook(path, snapshot_dir, force=force)
+    source_file = os.path.basename(path)
+    return {
+        "kind": "excel",
+        "text": encode_workbook(sheets, source_file, encoding),
+        "encoding_report": compare_encodings(sheets, source_file),
+    }
+
+
+def parse_pdf(path):
+    pages = extract_pages(path)
+    return {"kind": "pdf", "pages": pages, "has_text": any(page.strip() for page in pages)}
+
+
+def parse_document(path, kind, excel_encoding, snapshot_dir, force=False):
+    """
+    Worker entry point. Returns (artifact, error); never raises, so one bad
+    file does not take down the batch. force: rebuild the workbook snapshot.
+    """
+    try:
+        if kind == "excel":
+            return parse_excel(path, excel_encoding, snapshot_dir, force), None
+        return parse_pdf(path), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+# --- 3. PROGRESS ---
+class IngestProgress:
+    """
+    Thread-safe progress of the current ingestion run, polled by the UI.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = {"phase": "idle", "total": 0, "done": 0, "failed": 0,
+                       "current": None, "started_at": None, "finished_at": None}
+
+    def start(self, phase, total):
+        with self._lock:
+            self._state.update(phase=phase, total=total, done=0, failed=0, current=None,
+                               started_at=time.time(), finished_at=None)
+
+    def advance(self, current=None, failed=False):
+        with self._lock:
+            self._state["done"] += 1
+            self._state["failed"] += int(failed)
+            self._state["current"] = current
+
+    def finish(self):
+        with self._lock:
+            self._state.update(phase="idle", current=None, finished_at=time.time())
+
+    def snapshot(self):
+        """
+        {"phase", "total", "done", "failed", "current", "fraction", "eta_sec", ...}
+        """
+        with self._lock:
+            state = dict(self._state)
+        total, done = state["total"], state["done"]
+        state["fraction"] = (done / total) if total else (1.0 if state["phase"] == "idle" else 0.0)
+        state["eta_sec"] = None
+        if state["started_at"] and 0 < done < total:
+            elapsed = time.time() - state["started_at"]
+            state["eta_sec"] = round(elapsed / done * (total - done), 1)
+        return state
+
+
+ingest_progress = IngestProgress()
+
+def get_ingest_progress():
+    return ingest_progress.snapshot()
+
+
+# --- 4. THE PIPELINE ---
+class DocumentPipeline:
+    """
+    Incremental, manifest-driven ingestion of a documents folder.
+
+    documents.json: {relative path: {"kind", "hash", "size", "mtime_ns",
+    "status", "artifact", "error", "parsed_at", "has_text" (PDFs)}}. Unchanged files (same size
+    and mtime, or same content hash) are skipped, new or changed ones are
+    parsed on a process pool, deleted ones are dropped together with their
+    artifacts.
+    """
+
+    def __init__(self, folder, cache_dir=CACHE_DIR, workers=PARSE_WORKERS, excel_encoding="markdown",
+                 progress=ingest_progress):
+        self.folder = os.path.abspath(folder)
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.artifact_dir = os.path.join(self.cache_dir, ARTIFACT_DIR)
+        self.snapshot_dir = os.path.join(self.cache_dir, SNAPSHOT_SUBDIR)
+        self.manifest_path = os.path.join(self.cache_dir, DOCUMENTS_MANIFEST)
+        self.workers = workers
+        self.excel_encoding = excel_encoding
+        self.progress = progress
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _artifact_name(self, kind, content_hash):
+        variant = self.excel_encoding if kind == "excel" else "pages"
+        return f"{kind}-{content_hash[:24]}-{variant}.json"
+
+    def _artifact_ok(self, entry):
+        return (
+            entry.get("status") == STATUS_READY
+            and entry.get("artifact") == self._artifact_name(entry["kind"], entry["hash"])
+            and os.path.exists(os.path.join(self.artifact_dir, entry["artifact"]))
+        )
+
+    def sync(self, include=None, force=False):
+        """
+        Brings the manifest in line with the folder. Returns a summary
+        {"added", "changed", "removed", "unchanged", "failed"} of relative paths.
+        force: parse every file again (cold load), reusing no artifact or snapshot.
+        """
+        found = scan_documents(self.folder, include)
+        summary = {"added": [], "changed": [], "removed": [], "unchanged": [], "failed": []}
+
+        # 1. Decide what needs parsing (stat first, hash only if the stat changed)
+        self.progress.start("scanning", len(found))
+        jobs = []
+        for rel, path in found.items():
+            stat = os.stat(path)
+            entry = self.manifest.get(rel)
+            same_stat = entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns
+            if not force and same_stat and (self._artifact_ok(entry) or entry["status"] == STATUS_ERROR):
+                # Failed files are retried only once they change
+                summary["unchanged"].append(rel)
+                self.progress.advance(rel)
+                continue
+            content_hash = file_hash(path)
+            if not force and entry and entry["hash"] == content_hash and self._artifact_ok(entry):
+                entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)     # Touched, not changed
+                summary["unchanged"].append(rel)
+                self.progress.advance(rel)
+                continue
+            kind = document_kind(rel)
+            new_entry = {"kind": kind, "hash": content_hash, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                         "status": "pending", "artifact": None, "error": None, "parsed_at": None}
+            artifact = self._artifact_name(kind, content_hash)
+            if not force and os.path.exists(os.path.join(self.artifact_dir, artifact)):
+                # Same content already parsed under another name (copied/renamed file)
+                new_entry.update(status=STATUS_READY, artifact=artifact, parsed_at=time.time())
+                twin = next((e for e in self.manifest.values() if e.get("artifact") == artifact), {})
+                if "has_text" in twin:
+                    new_entry["has_text"] = twin["has_text"]
+            else:
+                jobs.append((rel, path, kind))
+            (summary["changed"] if entry else summary["added"]).append(rel)
+            old_artifact = entry.get("artifact") if entry else None
+            self.manifest[rel] = new_entry
+            self._collect_artifact(old_artifact)
+            self.progress.advance(rel)
+
+        # 2. Deleted files (after the scan: a renamed file has already taken over their artifact)
+        for rel in [rel for rel in self.manifest if rel not in found]:
+            self._drop(rel)
+            summary["removed"].append(rel)
+
+        # 3. Parse (CPU-bound) on a process pool
+        self.progress.start("parsing", len(jobs))
+        for rel, artifact, error in self._parse(jobs, force):
+            entry = self.manifest[rel]
+            if error is None:
+                name = self._artifact_name(entry["kind"], entry["hash"])
+                self._write_artifact(name, artifact)
+                entry.update(status=STATUS_READY, artifact=name, error=None, parsed_at=time.time())
+                if entry["kind"] == "pdf":
+                    entry["has_text"] = artifact["has_text"]
+            else:
+                entry.update(status=STATUS_ERROR, artifact=None, error=error, parsed_at=time.time())
+                summary["failed"].append(rel)
+            self.progress.advance(rel, failed=error is not None)
+
+        self.save()
+        self.progress.finish()
+        return summary
+
+    def _parse(self, jobs, force=False):
+        if len(jobs) <= INLINE_PARSE_LIMIT or self.workers <= 1:
+            for rel, path, kind in jobs:
+                yield (rel, *parse_document(path, kind, self.excel_encoding, self.snapshot_dir, force))
+            return
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(jobs))) as pool:
+            futures = {
+                pool.submit(parse_document, path, kind, self.excel_encoding, self.snapshot_dir, force): rel
+                for rel, path, kind in jobs
+            }
+            for future in as_completed(futures):
+                rel = futures[future]
+                try:
+                    artifact, error = future.result()
+                except Exception as e:      # Worker crashed (e.g. out of memory)
+                    artifact, error = None, f"{type(e).__name__}: {e}"
+                yield rel, artifact, error
+
+    def _write_artifact(self, name, artifact):
+        os.makedirs(self.artifact_dir, exist_ok=True)
+        path = os.path.join(self.artifact_dir, name)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(artifact, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    def _drop(self, rel):
+        entry = self.manifest.pop(rel, None)
+        if entry:
+            self._collect_artifact(entry.get("artifact"))
+
+    def _collect_artifact(self, name):
+        # Delete an artifact no manifest entry points at any more
+        if not name or any(e.get("artifact") == name for e in self.manifest.values()):
+            return
+        try:
+            os.remove(os.path.join(self.artifact_dir, name))
+        except OSError:
+            pass
+
+    # --- Reading results ---
+    def documents(self, kind=None, status=None):
+        """
+        {relative path: manifest entry}, optionally filtered by kind/status.
+        """
+        return {
+            rel: entry for rel, entry in self.manifest.items()
+            if (kind is None or entry["kind"] == kind) and (status is None or entry["status"] == status)
+        }
+
+    def pdfs_to_attach(self, include=None, all_pdfs=False):
+        """
+        {relative path: content hash} of PDFs known to be attached whole,
+        before sync() runs: unchanged files that had no extractable text last
+        time (with all_pdfs, every PDF; new ones are hashed here). Callers
+        start uploading these while the parse runs.
+        """
+        found = {}
+        for rel, path in scan_documents(self.folder, include).items():
+            if document_kind(rel) != "pdf":
+                continue
+            entry = self.manifest.get(rel)
+            stat = os.stat(path)
+            unchanged = entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns
+            if all_pdfs:
+                found[rel] = entry["hash"] if unchanged else file_hash(path)
+            elif unchanged and not (entry["status"] == STATUS_READY and entry.get("has_text", True)):
+                found[rel] = entry["hash"]
+        return found
+
+    def path(self, rel):
+        return os.path.join(self.folder, rel)
+
+    def load_artifact(self, rel):
+        entry = self.manifest.get(rel)
+        if not entry or entry.get("status") != STATUS_READY:
+            return None
+        try:
+            with open(os.path.join(self.artifact_dir, entry["artifact"]), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def pdf_pages(self, path):
+        """
+        Page texts of a parsed PDF (page_source for pdf_index.PageIndex).
+        """
+        rel = os.path.relpath(os.path.abspath(path), self.folder).replace(os.sep, "/")
+        entry = self.manifest.get(rel)
+        artifact = self.load_artifact(rel)
+        if artifact is None:
+            raise PdfTextUnavailable((entry or {}).get("error") or "not parsed")
+        return artifact["pages"]
+
+    def file_hashes(self):
+        return {rel: entry["hash"] for rel, entry in sorted(self.manifest.items())}
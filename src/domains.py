@@ -0,0 +1,102 @@
+import re
+
+# --- 1. CONFIGURATION ---
+# Knowledge-base domains a question can touch. Each fan-out branch only sees
+# its own sheets and PDFs. "Product Master Data" is shared with logistics
+# (lead time, hazard class) and "Business Rules" with every domain.
+DOMAINS = {
+    "product": {
+        "label": "Product, quality & pricing",
+        "sheets": ("Product Master Data", "Quality Requirements", "Pricing Tiers", "Business Rules"),
+        "pdfs": (),
+        "keywords": (
+            "price", "prices", "pricing", "priced", "cost", "costs", "cheapest", "tier", "tiers",
+            "discount", "discounts", "rebate", "payment", "moq", "minimum order", "lead time",
+            "lead times", "supplier", "suppliers", "certification", "certifications", "certified",
+            "grade", "gmp", "halal", "kosher", "audit", "audits", "retest", "quality", "shelf life",
+            "cas", "storage", "excipient", "preservative", "application", "applications",
+        ),
+    },
+    "logistics": {
+        "label": "Logistics & shipping",
+        "sheets": ("Logistics Matrix", "Product Master Data", "Business Rules"),
+        "pdfs": ("Shipping_Tariffs_EMEA_Generic.pdf",),
+        "keywords": (
+            "ship", "ships", "shipped", "shipping", "shipment", "freight", "transit", "deliver",
+            "delivered", "delivery", "arrive", "arrives", "arrival", "transport", "road", "air",
+            "sea", "incoterm", "incoterms", "customs", "hazmat", "adr", "temperature control",
+            "cold chain", "landed", "tariff", "tariffs", "route", "destination", "origin",
+        ),
+    },
+    "compliance": {
+        "label": "Regulatory compliance",
+        "sheets": ("Compliance Matrix", "Business Rules"),
+        "pdfs": ("Regulatory_Compliance_Guide_Generic.pdf",),
+        "keywords": (
+            "compliance", "compliant", "regulation", "regulations", "regulatory", "reach", "fda",
+            "efsa", "restriction", "restrictions", "permitted", "max level", "registration",
+            "registered", "review", "reviews", "cfr", "e number", "allergen", "labelling", "labeling",
+        ),
+    },
+}
+
+FAN_OUT_MIN_DOMAINS = 2         # Fewer domains than this: one prompt is as fast as a fan-out
+
+_PATTERNS = {
+    name: re.compile(r"\b(?:" + "|".join(re.escape(k) for k in domain["keywords"]) + r")\b", re.I)
+    for name, domain in DOMAINS.items()
+}
+
+
+# --- 2. ROUTING ---
+def classify_question(question):
+    """
+    Domains the question touches, in DOMAINS order (keyword match, no model call).
+    """
+    return [name for name, pattern in _PATTERNS.items() if pattern.search(str(question))]
+
+
+def should_fan_out(domains):
+    return len(domains) >= FAN_OUT_MIN_DOMAINS
+
+
+# --- 3. MERGING ---
+def concat_answers(partials, timestamp=""):
+    """
+    Combines domain answers without a model call: one labelled line per
+    domain, explanations in sections, citations de-duplicated in order and
+    the lowest confidence. Tables with the same columns are stacked; a
+    table with different columns is dropped.
+    """
+    ok = [p for p in partials if "error" not in p["answer"]]
+    if not ok:
+        return {"error": "; ".join(f"{p['domain']}: {p['answer']['error']}" for p in partials)}
+
+    answers, explanations, citations, table = [], [], [], None
+    for partial in ok:
+        label = DOMAINS[partial["domain"]]["label"]
+        answer = partial["answer"]
+        answers.append(f"{label}: {answer.get('answer', '')}" if len(ok) > 1 else str(answer.get("answer", "")))
+        if answer.get("explanation"):
+            explanations.append(f"{label}:\n{answer['explanation']}")
+        for source in answer.get("citations") or []:
+            if source not in citations:
+                citations.append(source)
+        part_table = answer.get("table")
+        if part_table and part_table.get("columns"):
+            if table is None:
+                table = {"columns": list(part_table["columns"]), "rows": list(part_table.get("rows") or [])}
+            elif part_table["columns"] == table["columns"]:
+                table["rows"].extend(part_table.get("rows") or [])
+
+    failed = [p["domain"] for p in partials if "error" in p["answer"]]
+    if failed:
+        explanations.append(f"Not answered ({', '.join(failed)}): the data for these parts could not be queried.")
+    return {
+        "answer": "\n".join(answers),
+        "table": table,
+        "explanation": "\n\n".join(explanations),
+        "citations": citations,
+        "confidence": min(float(p["answer"].get("confidence", 0) or 0) for p in ok),
+        "timestamp": timestamp,
+    }
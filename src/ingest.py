@@ -0,0 +1,83 @@
+import time
+
+try:
+    from backends import get_backend
+except ImportError:
+    from src.backends import get_backend
+
+# --- 1. CONFIGURATION ---
+UPLOAD_CONCURRENCY = 4      # Max PDFs uploading/processing at the same time
+UPLOAD_TIMEOUT = 300        # Seconds one file may spend in PROCESSING
+UPLOAD_RETRIES = 2          # Extra attempts after a failed upload
+POLL_INITIAL = 0.5          # First wait between state checks (seconds)
+POLL_MAX = 8.0              # Backoff ceiling
+POLL_FACTOR = 2.0
+
+
+class UploadError(Exception):
+    """Raised when a file cannot be brought to ACTIVE state."""
+
+
+# --- 2. POLLING ---
+def wait_until_active(f, timeout=UPLOAD_TIMEOUT, poll_initial=POLL_INITIAL,
+                      poll_max=POLL_MAX, poll_factor=POLL_FACTOR):
+    """
+    Polls an uploaded file with exponential backoff until it leaves PROCESSING.
+    Small files are usually ready after the first short wait; big ones stop
+    hammering the API once the delay reaches poll_max.
+    """
+    deadline = time.monotonic() + timeout
+    delay = poll_initial
+    while f.state.name == "PROCESSING":
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise UploadError(f"Timed out after {timeout}s waiting for {f.name}")
+        time.sleep(min(delay, remaining))
+        delay = min(delay * poll_factor, poll_max)
+        f = get_backend().get_file(f.name)
+
+    if f.state.name != "ACTIVE":
+        raise UploadError(f"{f.name} ended in state {f.state.name}")
+    return f
+
+
+# --- 3. UPLOAD ---
+def upload_pdf(path, retries=UPLOAD_RETRIES, timeout=UPLOAD_TIMEOUT):
+    """
+    Uploads one file and waits for Gemini to finish processing it.
+    Retries the whole upload (with backoff) on errors or timeouts.
+    """
+    last_error = None
+    for attempt in range(retries + 1):
+        try:
+            f = get_backend().upload_file(path)
+            return wait_until_active(f, timeout=timeout)
+        except Exception as e:
+            last_error = e
+            if attempt < retries:
+                time.sleep(min(POLL_INITIAL * (POLL_FACTOR ** attempt), POLL_MAX))
+    raise UploadError(f"Upload failed after {retries + 1} attempts: {last_error}")
+
+
+def reuse_upload(remote_name):
+    """
+    Returns the handle of a previous upload if it is still ACTIVE, else None.
+    """
+    if not remote_name:
+        return None
+    try:
+        f = get_backend().get_file(remote_name)
+    except Exception:
+        return None
+    return f if f.state.name == "ACTIVE" else None
+
+
+def ingest_pdf(path, cached_remote_name=None, retries=UPLOAD_RETRIES, timeout=UPLOAD_TIMEOUT):
+    """
+    Worker for the ingestion pool: reuse a cached upload or upload fresh.
+    Returns (handle, reused).
+    """
+    f = reuse_upload(cached_remote_name)
+    if f is not None:
+        return f, True
+    return upload_pdf(path, retries=retries, timeout=timeout), False
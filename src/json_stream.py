@@ -0,0 +1,185 @@
+import json
+
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class StreamingJSONObject:
+    """
+    Incremental parser for one top-level JSON object arriving in chunks.
+
+    Each character is looked at once (linear in the total response size).
+    Top-level string values are exposed while they are still being written
+    (`partial`, refreshed once per chunk), other values (lists, numbers,
+    nested objects) once they are complete (`fields`). Used to render
+    "answer" before "explanation" and "citations" have arrived.
+    """
+
+    def __init__(self):
+        self.fields = {}            # Completed top-level values
+        self.partial = {}           # Top-level strings still being received
+        self._state = "start"       # start | key | colon | value | string | raw | nested | comma | done
+        self._key = None
+        self._buffer = []
+        self._escape = None         # None, "" (after backslash) or collected \\u hex digits
+        self._high_surrogate = None # First half of a \\uD83D\\uDE00 pair, waiting for the second
+        self._dirty = False         # The string being received grew since `partial` was refreshed
+        self._depth = 0
+        self._in_string = False
+        self._raw_escape = False
+
+    @property
+    def done(self):
+        return self._state == "done"
+
+    def value(self, key, default=None):
+        """
+        Completed value if available, otherwise the partial string so far.
+        """
+        if key in self.fields:
+            return self.fields[key]
+        return self.partial.get(key, default)
+
+    def feed(self, chunk):
+        """
+        Consumes the next chunk. Returns the set of keys that changed.
+        """
+        changed = set()
+        for char in chunk:
+            state = self._state
+            if state == "start":
+                if char == "{":
+                    self._state = "key"
+            elif state == "key":
+                if char == '"':
+                    self._buffer = []
+                    self._key = None
+                    self._state = "key_string"
+                elif char == "}":
+                    self._state = "done"
+            elif state == "key_string":
+                if self._read_string_char(char):
+                    self._key = "".join(self._buffer)
+                    self._state = "colon"
+            elif state == "colon":
+                if char == ":":
+                    self._state = "value"
+            elif state == "value":
+                if char.isspace():
+                    continue
+                self._buffer = []
+                if char == '"':
+                    self.partial[self._key] = ""
+                    self._state = "string"
+                elif char in "[{":
+                    self._buffer.append(char)
+                    self._depth = 1
+                    self._in_string = False
+                    self._raw_escape = False
+                    self._state = "nested"
+                else:
+                    self._buffer.append(char)
+                    self._state = "raw"
+            elif state == "string":
+                if self._read_string_char(char):
+                    self.fields[self._key] = "".join(self._buffer)
+                    self.partial.pop(self._key, None)
+                    self._dirty = False
+                    self._state = "comma"
+                else:
+                    self._dirty = True
+                changed.add(self._key)
+            elif state == "nested":
+                self._buffer.append(char)
+                if self._in_string:
+                    if self._raw_escape:
+                        self._raw_escape = False
+                    elif char == "\\":
+                        self._raw_escape = True
+                    elif char == '"':
+                        self._in_string = False
+                elif char == '"':
+                    self._in_string = True
+                elif char in "[{":
+                    self._depth += 1
+                elif char in "]}":
+                    self._depth -= 1
+                    if self._depth == 0:
+                        self._complete_raw()
+                        changed.add(self._key)
+                        self._state = "comma"
+            elif state == "raw":
+                if char in ",}" or char.isspace():
+                    self._complete_raw()
+                    changed.add(self._key)
+                    self._state = "done" if char == "}" else ("key" if char == "," else "comma")
+                else:
+                    self._buffer.append(char)
+            elif state == "comma":
+                if char == ",":
+                    self._state = "key"
+                elif char == "}":
+                    self._state = "done"
+        if self._dirty:
+            # Joined once per chunk, not per character
+            self.partial[self._key] = "".join(self._buffer)
+            self._dirty = False
+        return changed
+
+    def _complete_raw(self):
+        raw = "".join(self._buffer)
+        try:
+            self.fields[self._key] = json.loads(raw)
+        except ValueError:
+            self.fields[self._key] = raw
+        self._buffer = []
+
+    def _read_string_char(self, char):
+        """
+        Appends one decoded character to the buffer. Returns True at the closing quote.
+        """
+        if self._escape is None:
+            if char == "\\":
+                self._escape = ""
+                return False
+            self._flush_surrogate()
+            if char == '"':
+                return True
+            self._buffer.append(char)
+            return False
+        if self._escape == "":
+            if char == "u":
+                self._escape = "u"
+            else:
+                self._flush_surrogate()
+                self._buffer.append(_ESCAPES.get(char, char))
+                self._escape = None
+            return False
+        # Collecting \uXXXX
+        self._escape += char
+        if len(self._escape) == 5:
+            try:
+                self._append_code_point(int(self._escape[1:], 16))
+            except ValueError:
+                self._flush_surrogate()
+            self._escape = None
+        return False
+
+    def _append_code_point(self, code):
+        """
+        Characters outside the BMP arrive as two escapes (\\uD83D\\uDE00): joined into one.
+        """
+        if 0xDC00 <= code <= 0xDFFF and self._high_surrogate is not None:
+            high, self._high_surrogate = self._high_surrogate, None
+            self._buffer.append(chr(0x10000 + ((high - 0xD800) << 10) + (code - 0xDC00)))
+            return
+        self._flush_surrogate()
+        if 0xD800 <= code <= 0xDBFF:
+            self._high_surrogate = code
+        else:
+            self._buffer.append(chr(code))
+
+    def _flush_surrogate(self):
+        # A lone surrogate is kept as is, like json.loads does
+        if self._high_surrogate is not None:
+            self._buffer.append(chr(self._high_surrogate))
+            self._high_surrogate = None
@@ -0,0 +1,97 @@
+import os
+import json
+import hashlib
+from datetime import datetime, timedelta, timezone
+
+# --- 1. CONFIGURATION ---
+# Cache lives next to the source documents, outside of version control
+CACHE_DIR = os.environ.get(
+    "DISTRIBIQ_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", ".kb_cache")
+)
+MANIFEST_FILE = "manifest.json"
+
+# Gemini keeps uploaded files for 48h. Treat handles as stale a bit earlier
+# so a question never goes out with a file that expires mid-request.
+UPLOAD_TTL = timedelta(hours=48)
+EXPIRY_MARGIN = timedelta(minutes=30)
+
+
+# --- 2. HASHING ---
+def file_hash(path, chunk_size=1 << 20):
+    """
+    Returns the SHA-256 of a file's content (streamed, so large PDFs are fine).
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# --- 3. THE CACHE ---
+class KnowledgeBaseCache:
+    """
+    Content-addressed store of Gemini upload handles for the knowledge-base
+    PDFs. Parsed documents are cached by doc_pipeline.py, workbooks as
+    Parquet snapshots by snapshot.py.
+
+    manifest.json layout:
+        {"pdfs": {filename: {"hash", "remote_name", "expires_at"}}}
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.manifest_path = os.path.join(self.cache_dir, MANIFEST_FILE)
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {}
+        manifest.setdefault("pdfs", {})
+        return manifest
+
+    def save(self):
+        """
+        Writes the manifest atomically (tmp file + rename).
+        """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    # --- PDF upload handles ---
+    def get_pdf_remote_name(self, filename, content_hash, now=None):
+        """
+        Returns the remote file name of a previous upload of this exact content,
+        if it has not expired yet. The caller still has to confirm it via genai.get_file().
+        """
+        entry = self.manifest["pdfs"].get(filename)
+        if not entry or entry.get("hash") != content_hash:
+            return None
+        now = now or datetime.now(timezone.utc)
+        try:
+            expires_at = datetime.fromisoformat(entry["expires_at"])
+        except (KeyError, TypeError, ValueError):
+            return None
+        if expires_at - EXPIRY_MARGIN <= now:
+            return None
+        return entry.get("remote_name")
+
+    def put_pdf_handle(self, filename, content_hash, handle):
+        expires_at = getattr(handle, "expiration_time", None)
+        if not isinstance(expires_at, datetime):
+            expires_at = datetime.now(timezone.utc) + UPLOAD_TTL
+        elif expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        self.manifest["pdfs"][filename] = {
+            "hash": content_hash,
+            "remote_name": handle.name,
+            "expires_at": expires_at.isoformat(),
+        }
+
+    def forget_pdf(self, filename):
+        self.manifest["pdfs"].pop(filename, None)
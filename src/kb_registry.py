@@ -0,0 +1,245 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+# --- 1. CONFIGURATION ---
+WATCH_INTERVAL = 5.0        # Seconds between scans of the docs folder
+WATCH_SETTLE_POLLS = 1      # Extra unchanged scans required before rebuilding (files still being copied)
+
+
+class KnowledgeBaseSnapshot:
+    """
+    One immutable version of the knowledge base (the dict returned by
+    prepare_knowledge_base) plus the number of questions currently using it.
+    """
+
+    def __init__(self, data, source_signature):
+        self.data = data
+        self.version = data.get("kb_version", "")
+        self.source_signature = source_signature
+        self.created_at = time.time()
+        self.refs = 0
+        self.retired = False
+
+
+def folder_signature(folder):
+    """
+    Cheap change detector for the docs folder: (path, size, mtime_ns) of every
+    file, subfolders included (hidden files and folders are skipped).
+    """
+    entries = []
+    for root, dirs, files in os.walk(folder):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for name in files:
+            if name.startswith("."):
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((os.path.relpath(path, folder), stat.st_size, stat.st_mtime_ns))
+    return tuple(sorted(entries))
+
+
+# --- 2. THE REGISTRY ---
+class KnowledgeBaseRegistry:
+    """
+    Process-wide knowledge base shared by every chat session.
+
+    Sessions borrow the current snapshot with acquire(); a reload builds the
+    new snapshot in a background thread and swaps it in atomically, so
+    in-flight questions finish against the version they started with. A
+    retired snapshot drops its data once the last borrower releases it.
+    """
+
+    def __init__(self, loader, watch_dir, watch_interval=WATCH_INTERVAL):
+        self.loader = loader                # () -> knowledge-base dict
+        self.watch_dir = watch_dir
+        self.watch_interval = watch_interval
+        self._current = None
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()     # One build at a time
+        self._rebuild_thread = None
+        self._watcher = None
+        self._stop = threading.Event()
+        self.builds = 0
+        self.failed_builds = 0
+        self.last_error = None
+        self._failed_signature = None           # Don't retry a broken folder state until it changes again
+
+    # --- Reading ---
+    def current(self):
+        with self._lock:
+            return self._current
+
+    @contextmanager
+    def acquire(self):
+        """
+        Borrows the current snapshot for the duration of one question.
+        Yields None if nothing has been loaded yet.
+        """
+        snapshot = self.borrow()
+        try:
+            yield snapshot
+        finally:
+            self.release(snapshot)
+
+    def borrow(self):
+        """
+        acquire() for borrowers that outlive one block (e.g. an asyncio task):
+        every borrowed snapshot must be given back with release().
+        """
+        with self._lock:
+            snapshot = self._current
+            if snapshot is not None:
+                snapshot.refs += 1
+            return snapshot
+
+    def release(self, snapshot):
+        if snapshot is not None:
+            with self._lock:
+                snapshot.refs -= 1
+                self._release_if_unused(snapshot)
+
+    def _release_if_unused(self, snapshot):
+        # Caller holds self._lock
+        if snapshot.retired and snapshot.refs == 0:
+            snapshot.data = None
+
+    # --- Building ---
+    def ensure_loaded(self):
+        """
+        Loads the knowledge base if no snapshot exists yet (blocking). Concurrent
+        callers wait for the single build instead of starting their own.
+        """
+        if self.current() is None:
+            with self._build_lock:
+                if self.current() is None:
+                    self._build()
+        return self.current()
+
+    def reload(self, wait=False):
+        """
+        Rebuilds in the background and swaps the new snapshot in when ready.
+        Returns immediately unless wait=True; a reload already running is reused.
+        """
+        with self._lock:
+            thread = self._rebuild_thread
+            if thread is None or not thread.is_alive():
+                thread = threading.Thread(target=self._locked_build, name="kb-rebuild", daemon=True)
+                self._rebuild_thread = thread
+                thread.start()
+        if wait:
+            thread.join()
+        return thread
+
+    def _locked_build(self):
+        with self._build_lock:
+            self._build()
+
+    def _build(self):
+        # Caller holds self._build_lock
+        signature = folder_signature(self.watch_dir)
+        try:
+            data = self.loader()
+        except Exception as e:
+            self._failed_signature = signature
+            self.failed_builds += 1
+            self.last_error = str(e)
+            print(f"   ❌ Knowledge base rebuild failed, keeping current version: {e}")
+            return None
+        if not data.get("excel_text") and not data.get("pdf_handles"):
+            self._failed_signature = signature
+            self.failed_builds += 1
+            self.last_error = "No data found"
+            print(f"   ❌ Knowledge base rebuild found no data, keeping current version")
+            return None
+
+        snapshot = KnowledgeBaseSnapshot(data, signature)
+        with self._lock:
+            previous = self._current
+            self._current = snapshot
+            self.builds += 1
+            self.last_error = None
+            if previous is not None:
+                previous.retired = True
+                self._release_if_unused(previous)
+        print(f"   🔁 Knowledge base version {snapshot.version} is live")
+        return snapshot
+
+    # --- Watching ---
+    def start_watcher(self):
+        """
+        Starts the background thread that polls watch_dir and reloads on change.
+        """
+        with self._lock:
+            if self._watcher is not None and self._watcher.is_alive():
+                return self._watcher
+            self._stop.clear()
+            self._watcher = threading.Thread(target=self._watch, name="kb-watcher", daemon=True)
+            self._watcher.start()
+            return self._watcher
+
+    def stop_watcher(self):
+        self._stop.set()
+
+    def _watch(self):
+        pending = None
+        settled = 0
+        while not self._stop.wait(self.watch_interval):
+            snapshot = self.current()
+            if snapshot is None or self._build_lock.locked():
+                continue        # Nothing loaded yet (the first load is explicit) or a build is running
+            signature = folder_signature(self.watch_dir)
+            if signature in (snapshot.source_signature, self._failed_signature):
+                pending, settled = None, 0
+                continue
+            if signature != pending:
+                pending, settled = signature, 0
+                continue
+            settled += 1
+            if settled >= WATCH_SETTLE_POLLS:
+                print(f"   👀 Change detected in {self.watch_dir}, rebuilding knowledge base...")
+                pending, settled = None, 0
+                self.reload()
+
+    # --- Monitoring ---
+    def stats(self):
+        with self._lock:
+            snapshot = self._current
+            return {
+                "version": snapshot.version if snapshot else None,
+                "loaded_at": snapshot.created_at if snapshot else None,
+                "active_questions": snapshot.refs if snapshot else 0,
+                "rebuilding": bool(self._rebuild_thread and self._rebuild_thread.is_alive()),
+                "builds": self.builds,
+                "failed_builds": self.failed_builds,
+                "last_error": self.last_error,
+            }
+
+
+# --- 3. SHARED INSTANCE ---
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_kb_registry(loader=None, watch_dir=None, watch=True):
+    """
+    Returns the process-wide registry, creating it on first call (defaults to
+    agent.prepare_knowledge_base over agent.DOCS_FOLDER).
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            if loader is None or watch_dir is None:
+                try:
+                    from agent import prepare_knowledge_base, DOCS_FOLDER
+                except ImportError:
+                    from src.agent import prepare_knowledge_base, DOCS_FOLDER
+                loader = loader or prepare_knowledge_base
+                watch_dir = watch_dir or DOCS_FOLDER
+            _registry = KnowledgeBaseRegistry(loader, watch_dir)
+            if watch:
+                _registry.start_watcher()
+        return _registry
@@ -0,0 +1,476 @@
+import re
+import math
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+try:
+    from backends import get_backend, usage_to_dict
+    from domains import classify_question
+    from telemetry import LATENCY_BUCKETS, query_cost
+except ImportError:
+    from src.backends import get_backend, usage_to_dict
+    from src.domains import classify_question
+    from src.telemetry import LATENCY_BUCKETS, query_cost
+
+# --- 1. CONFIGURATION ---
+# Model tiers. timeout: latency budget (s) of one attempt on the tier (hedge
+# included); fallback: tier tried next when this one errors or times out.
+MODEL_TIERS = {
+    "fast": {"model": "gemini-2.5-flash-lite", "timeout": 20.0, "fallback": "standard"},
+    "standard": {"model": "gemini-2.5-flash", "timeout": 45.0, "fallback": "fast"},
+    "strong": {"model": "gemini-2.5-pro", "timeout": 90.0, "fallback": "standard"},
+}
+TIER_BY_COMPLEXITY = {"simple": "fast", "moderate": "standard", "complex": "strong"}
+DEFAULT_TIER = "standard"
+
+HEDGE_ENABLED = True
+HEDGE_PERCENTILE = 95           # Duplicate a call once it is slower than this percentile of its tier
+HEDGE_DEFAULT_SHARE = 0.5       # Until a tier has LATENCY_MIN_SAMPLES: hedge after this share of its timeout
+HEDGE_MAX_RATE = 0.10           # At most this many hedges per call (caps the extra load)
+SLO_PERCENTILE = 95             # A tier whose p95 is over SLO_SHARE of its timeout is out of SLO...
+SLO_SHARE = 0.8                 # ...and new questions are routed to its fallback instead
+LATENCY_WINDOW = 200            # Recent calls per tier the percentiles are computed from
+LATENCY_MIN_SAMPLES = 20        # Fewer calls than this: no percentile (static defaults apply)
+ROUTER_WORKERS = 32             # Model calls in flight at once; waiting for a slot does not use up a tier's timeout
+MAX_ABANDONED_CALLS = 16        # Timed-out calls left running outside those slots (extra threads)
+HEDGE_WORKERS = 8               # Separate threads for hedged duplicates: losers never queue primary calls
+
+# "Compare", "calculate", "cheapest"...: answers that need several lookups and arithmetic
+_MULTI_STEP = re.compile(
+    r"\b(compare|comparison|vs\.?|versus|calculate|total|landed cost|cost-effective|cheapest|"
+    r"best (?:price|option|supplier)|fastest|optimi[sz]e|recommend\w*|trade-?offs?|and what)\b",
+    re.I,
+)
+_MAX_SIMPLE_WORDS = 16
+
+
+class RoutingFailed(RuntimeError):
+    """Raised when a question's tier and every fallback tier failed."""
+
+    def __init__(self, message, attempts=()):
+        super().__init__(message)
+        self.attempts = list(attempts)      # See ModelRouter._attempts
+
+
+def percentile(values, pct):
+    """
+    Nearest-rank percentile.
+    """
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+_STREAM_END = object()
+
+def timed_stream(open_stream, timeout):
+    """
+    Iterates the chunk iterator returned by open_stream() on a helper thread,
+    raising TimeoutError when the first chunk, or any next one, takes longer
+    than `timeout` seconds. An abandoned stream is closed at its next chunk.
+    """
+    chunks, stop = queue.Queue(), threading.Event()
+
+    def pump():
+        stream = None
+        try:
+            stream = open_stream()
+            for chunk in stream:
+                if stop.is_set():
+                    break
+                chunks.put((chunk, None))
+            chunks.put((_STREAM_END, None))
+        except Exception as e:
+            chunks.put((None, e))
+        finally:
+            if stop.is_set() and hasattr(stream, "close"):
+                stream.close()
+
+    threading.Thread(target=pump, name="model-stream", daemon=True).start()
+    try:
+        while True:
+            try:
+                chunk, error = chunks.get(timeout=timeout)
+            except queue.Empty:
+                raise TimeoutError(f"no chunk within {timeout:g}s") from None
+            if error is not None:
+                raise error
+            if chunk is _STREAM_END:
+                return
+            yield chunk
+    finally:
+        stop.set()
+
+
+def question_complexity(question):
+    """
+    "simple" (one lookup), "moderate" or "complex" (multi-step: comparisons,
+    calculations, several domains and constraints). Heuristic, no model call.
+    """
+    text = str(question)
+    steps = len(_MULTI_STEP.findall(text))
+    domains = len(classify_question(text))
+    constraints = text.count(",") + len(re.findall(r"\b(?:with|within|and)\b", text, re.I))
+    if steps >= 2 or (steps and domains >= 2) or constraints >= 4:
+        return "complex"
+    if not steps and domains <= 1 and constraints <= 1 and len(text.split()) <= _MAX_SIMPLE_WORDS:
+        return "simple"
+    return "moderate"
+
+
+# --- 2. PER-TIER LATENCY ---
+class TierStats:
+    """
+    Latency histogram (Prometheus buckets) plus a window of recent latencies
+    for percentiles, call/error/hedge counters and the tokens and cost of
+    every call (hedge losers and abandoned calls included). Caller holds the
+    router lock.
+    """
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.recent = deque(maxlen=window)
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.queue_wait_sum = 0.0
+        self.queue_waits = 0
+        self.tokens = {"prompt": 0, "candidates": 0}
+        self.cost_usd = 0.0
+        self.counters = {"calls": 0, "errors": 0, "timeouts": 0, "queue_timeouts": 0, "hedges": 0, "hedge_wins": 0,
+                         "fallbacks": 0}
+
+    def observe(self, seconds):
+        self.recent.append(seconds)
+        index = next((i for i, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound), len(LATENCY_BUCKETS))
+        self.buckets[index] += 1
+        self.latency_sum += seconds
+
+    def add_usage(self, model, usage):
+        self.tokens["prompt"] += usage.get("prompt_token_count", 0)
+        self.tokens["candidates"] += usage.get("candidates_token_count", 0)
+        self.cost_usd += query_cost(model, usage)
+
+    def observe_queue_wait(self, seconds):
+        self.queue_wait_sum += seconds
+        self.queue_waits += 1
+
+    def percentile(self, pct):
+        if len(self.recent) < LATENCY_MIN_SAMPLES:
+            return None
+        return percentile(self.recent, pct)
+
+
+# --- 3. THE ROUTER ---
+class ModelRouter:
+    """
+    Picks a model tier per question and runs the call with a latency budget:
+    a call slower than its tier's p95 gets a hedged duplicate (first answer
+    wins), and a tier that errors or exceeds its timeout falls back to the
+    next tier. Tiers whose observed p95 is out of SLO are skipped at routing.
+
+    Calls are synchronous backend calls run on a thread pool; a losing or
+    timed-out call cannot be cancelled and finishes in the background (its
+    latency still feeds the tier statistics). A call holds one of `workers`
+    slots; once abandoned it moves to one of `max_abandoned` spare slots
+    (own threads), so new calls do not queue behind it. Waiting for a slot is
+    measured apart from the tier's timeout, which starts with the call.
+    Hedges run on their own small pool, only when one of its threads is free.
+    """
+
+    def __init__(self, tiers=MODEL_TIERS, default_tier=DEFAULT_TIER, hedging=HEDGE_ENABLED, workers=ROUTER_WORKERS,
+                 max_abandoned=MAX_ABANDONED_CALLS, hedge_workers=HEDGE_WORKERS):
+        self.tiers = tiers
+        self.default_tier = default_tier
+        self.hedging = hedging
+        self.stats = {name: TierStats() for name in tiers}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers + max_abandoned, thread_name_prefix="model-call")
+        self._call_slots = threading.Semaphore(workers)
+        self._abandoned_slots = threading.Semaphore(max_abandoned)
+        self._hedge_pool = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix="model-hedge")
+        self._hedge_slots = threading.Semaphore(hedge_workers)
+
+    # --- Routing ---
+    def tier_percentile(self, tier, pct):
+        with self._lock:
+            return self.stats[tier].percentile(pct)
+
+    def in_slo(self, tier):
+        p = self.tier_percentile(tier, SLO_PERCENTILE)
+        return p is None or p <= self.tiers[tier]["timeout"] * SLO_SHARE
+
+    def choose_tier(self, question):
+        """
+        Tier for the question's complexity, or the first fallback in SLO if
+        that tier is currently too slow.
+        """
+        tier = TIER_BY_COMPLEXITY.get(question_complexity(question), self.default_tier)
+        if tier not in self.tiers:
+            tier = self.default_tier
+        candidate, seen = tier, set()
+        while candidate is not None and candidate not in seen:
+            if self.in_slo(candidate):
+                return candidate
+            seen.add(candidate)
+            candidate = self.tiers[candidate].get("fallback")
+        return tier
+
+    def cap_tier(self, tier, ceiling):
+        """
+        The cheaper of `tier` and `ceiling` (tiers are listed cheapest first).
+        """
+        order = list(self.tiers)
+        return tier if order.index(tier) <= order.index(ceiling) else ceiling
+
+    def hedge_delay(self, tier):
+        p = self.tier_percentile(tier, HEDGE_PERCENTILE)
+        return p if p is not None else self.tiers[tier]["timeout"] * HEDGE_DEFAULT_SHARE
+
+    def plan(self, tier):
+        """
+        [tier, its fallback, ...] without repeats.
+        """
+        order = []
+        while tier is not None and tier not in order:
+            order.append(tier)
+            tier = self.tiers[tier].get("fallback")
+        return order
+
+    # --- Calling ---
+    def generate(self, tier, call_args_for):
+        """
+        Runs backend.generate(**call_args_for(model_name)) on `tier`, hedging
+        and falling back as needed. Returns (response, routed) with routed =
+        {"tier", "model", "hedged", "fallbacks": [failed tiers], "attempts":
+        the other calls made (see _attempts)}.
+        """
+        errors, failed, calls = [], [], []
+        for attempt_tier in self.plan(tier):
+            model = self.tiers[attempt_tier]["model"]
+            try:
+                response, hedged, winner = self._attempt(attempt_tier, call_args_for(model), calls)
+                return response, {"tier": attempt_tier, "model": model, "hedged": hedged, "fallbacks": failed,
+                                  "attempts": self._attempts(calls, winner)}
+            except Exception as e:
+                errors.append(f"{attempt_tier}: {e}")
+                failed.append(attempt_tier)
+                self._count(attempt_tier, "fallbacks")
+                print(f"   ↪️ {attempt_tier} tier failed ({e}), trying the next tier")
+        raise RoutingFailed("; ".join(errors), self._attempts(calls))
+
+    @staticmethod
+    def _attempts(calls, winner=None):
+        """
+        The calls other than `winner` as [{"tier", "model", "outcome", "usage"}]
+        for per-query cost: outcome "lost" (answered, not used), "error" or
+        "running" (no usage yet: priced in the tier totals once it returns).
+        """
+        attempts = []
+        for tier, model, future in calls:
+            if future is winner:
+                continue
+            if not future.done():
+                outcome, usage = "running", {}
+            elif future.exception() is not None:
+                outcome, usage = "error", {}
+            else:
+                outcome, usage = "lost", usage_to_dict(getattr(future.result(), "usage_metadata", None))
+            attempts.append({"tier": tier, "model": model, "outcome": outcome, "usage": usage})
+        return attempts
+
+    def _attempt(self, tier, call_args, calls):
+        """
+        One tier: the call, maybe a hedge. Appends (tier, model, future) of each
+        call to `calls`; returns (response, hedged, winning future).
+        """
+        backend = get_backend()
+        budget = self.tiers[tier]["timeout"]
+
+        # Queue wait: the budget starts once the call has a slot
+        queued_at = time.perf_counter()
+        if not self._call_slots.acquire(timeout=budget):
+            self._count(tier, "queue_timeouts")
+            raise TimeoutError(f"no free model-call slot within {budget:.0f}s")
+        started = time.perf_counter()
+        with self._lock:
+            self.stats[tier].observe_queue_wait(started - queued_at)
+        deadline = started + budget
+        primary = self._submit(tier, backend.generate, call_args, self._pool, self._call_slots)
+        model = self.tiers[tier]["model"]
+        tier_calls = [primary]
+        calls.append((tier, model, primary))
+
+        try:
+            if self.hedging:
+                delay = self.hedge_delay(tier)
+                if delay < budget and not wait([primary], timeout=delay).done and self._may_hedge(tier):
+                    print(f"   🪁 {tier} tier slower than {delay:.1f}s, sending a hedged request")
+                    hedge = self._submit(tier, backend.generate, call_args, self._hedge_pool, self._hedge_slots)
+                    tier_calls.append(hedge)
+                    calls.append((tier, model, hedge))
+
+            pending, last_error = set(tier_calls), None
+            while pending:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        response = future.result()
+                    except Exception as e:
+                        last_error = e
+                        continue
+                    if future is not primary:
+                        self._count(tier, "hedge_wins")
+                    return response, len(tier_calls) > 1, future
+            if not pending and last_error is not None:
+                raise last_error
+            self._count(tier, "timeouts")
+            raise TimeoutError(f"no answer within {budget:.0f}s")
+        finally:
+            self._abandon(primary)
+
+    def stream(self, tier, call_args):
+        """
+        Yields backend.generate_stream(**call_args) chunks on `tier`, with the
+        tier's timeout applied to the first chunk and between chunks
+        (TimeoutError). The call is recorded in the tier's statistics.
+        """
+        backend = get_backend()
+        started, usage = time.perf_counter(), None
+        try:
+            for chunk in timed_stream(lambda: backend.generate_stream(**call_args), self.tiers[tier]["timeout"]):
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                yield chunk
+        except TimeoutError:
+            self._count(tier, "timeouts")
+            self.observe(tier, time.perf_counter() - started, error=True)
+            raise
+        except Exception:
+            self.observe(tier, time.perf_counter() - started, error=True)
+            raise
+        self.observe(tier, time.perf_counter() - started, usage=usage_to_dict(usage))
+
+    def _submit(self, tier, fn, call_args, pool, slot):
+        """
+        Runs fn(**call_args) on `pool`. The caller holds `slot`; the call
+        releases future.slot (see _abandon) when it returns.
+        """
+        started = time.perf_counter()
+        future = pool.submit(fn, **call_args)
+        future.slot = slot
+        self._count(tier, "calls")
+
+        def finished(f):
+            with self._lock:
+                f.slot.release()
+                if f.exception() is None:
+                    self.stats[tier].observe(time.perf_counter() - started)
+                    usage = usage_to_dict(getattr(f.result(), "usage_metadata", None))
+                    self.stats[tier].add_usage(self.tiers[tier]["model"], usage)
+                else:
+                    self.stats[tier].counters["errors"] += 1
+        future.add_done_callback(finished)
+        return future
+
+    def _abandon(self, future):
+        """
+        A call nobody waits for any more gives its slot back if a spare slot
+        is free; otherwise it keeps holding it until it returns.
+        """
+        with self._lock:
+            if not future.done() and future.slot is self._call_slots and self._abandoned_slots.acquire(blocking=False):
+                future.slot = self._abandoned_slots
+                self._call_slots.release()
+
+    def _may_hedge(self, tier):
+        """
+        Within the hedge rate, and with a hedge thread free (takes its slot).
+        """
+        with self._lock:
+            counters = self.stats[tier].counters
+            if counters["hedges"] >= HEDGE_MAX_RATE * counters["calls"] + 1:
+                return False
+            if not self._hedge_slots.acquire(blocking=False):
+                return False
+            counters["hedges"] += 1
+            return True
+
+    def _count(self, tier, counter):
+        with self._lock:
+            self.stats[tier].counters[counter] += 1
+
+    def observe(self, tier, seconds, error=False, usage=None):
+        """
+        Records a call made outside generate() (e.g. a stream) in the tier's statistics.
+        """
+        with self._lock:
+            stats = self.stats[tier]
+            stats.counters["calls"] += 1
+            if error:
+                stats.counters["errors"] += 1
+            else:
+                stats.observe(seconds)
+                stats.add_usage(self.tiers[tier]["model"], usage or {})
+
+    # --- Monitoring ---
+    def snapshot(self):
+        with self._lock:
+            return {
+                name: {**stats.counters, "p50_sec": stats.percentile(50), "p95_sec": stats.percentile(95),
+                       "samples": len(stats.recent), "tokens": dict(stats.tokens), "cost_usd": round(stats.cost_usd, 8),
+                       "queue_wait_avg_sec": stats.queue_wait_sum / stats.queue_waits if stats.queue_waits else None}
+                for name, stats in self.stats.items()
+            }
+
+    def prometheus_text(self):
+        with self._lock:
+            lines = [
+                "# HELP distribiq_tier_latency_seconds Model call latency per routing tier.",
+                "# TYPE distribiq_tier_latency_seconds histogram",
+            ]
+            for name, stats in self.stats.items():
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, stats.buckets):
+                    cumulative += count
+                    lines.append(f'distribiq_tier_latency_seconds_bucket{{tier="{name}",le="{bound}"}} {cumulative}')
+                cumulative += stats.buckets[-1]
+                lines.append(f'distribiq_tier_latency_seconds_bucket{{tier="{name}",le="+Inf"}} {cumulative}')
+                lines.append(f'distribiq_tier_latency_seconds_sum{{tier="{name}"}} {stats.latency_sum:.4f}')
+                lines.append(f'distribiq_tier_latency_seconds_count{{tier="{name}"}} {cumulative}')
+            lines += [
+                "# HELP distribiq_tier_queue_wait_seconds Time model calls waited for a thread, per routing tier.",
+                "# TYPE distribiq_tier_queue_wait_seconds summary",
+            ]
+            for name, stats in self.stats.items():
+                lines.append(f'distribiq_tier_queue_wait_seconds_sum{{tier="{name}"}} {stats.queue_wait_sum:.4f}')
+                lines.append(f'distribiq_tier_queue_wait_seconds_count{{tier="{name}"}} {stats.queue_waits}')
+            lines += [
+                "# HELP distribiq_tier_cost_usd_total Cost of all model calls per routing tier, hedges included.",
+                "# TYPE distribiq_tier_cost_usd_total counter",
+            ]
+            for name, stats in self.stats.items():
+                lines.append(f'distribiq_tier_cost_usd_total{{tier="{name}"}} {stats.cost_usd:.8f}')
+            lines += [
+                "# HELP distribiq_tier_events_total Model calls, errors, timeouts, hedges and fallbacks per tier.",
+                "# TYPE distribiq_tier_events_total counter",
+            ]
+            for name, stats in self.stats.items():
+                for event, count in stats.counters.items():
+                    lines.append(f'distribiq_tier_events_total{{tier="{name}",event="{event}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+# --- 4. SHARED INSTANCE ---
+_router = None
+_router_lock = threading.Lock()
+
+def get_model_router():
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = ModelRouter()
+        return _router
@@ -0,0 +1,208 @@
+import os
+import re
+import math
+import threading
+
+try:
+    from retrieval import tokenize, BM25_K1, BM25_B
+    from context_encoder import estimate_tokens
+except ImportError:
+    from src.retrieval import tokenize, BM25_K1, BM25_B
+    from src.context_encoder import estimate_tokens
+
+# --- 1. CONFIGURATION ---
+PDF_TOKEN_BUDGET = 1500         # Max (estimated) tokens of PDF passages per prompt
+PDF_MIN_SCORE_RATIO = 0.5       # Drop passages scoring below this fraction of the best one
+PDF_MIN_SCORE = 1.0             # ...and passages that only share a common word with the question
+TABLE_CELL_MAX_CHARS = 40       # Runs of lines this short are table cells: joined onto one line
+
+# "1. Road Transport Rates (Intra-EU)", "2.3 FDA Prior Notice (Bioterrorism Act)"
+# (numbered "N." or "N.N", so table cells such as "21 CFR 184.1033" are not headings)
+_HEADING = re.compile(r"^(\d{1,2}\.(?:\d{1,2}\.?)*)\s+([A-Z][^|]{2,80})$")
+
+
+class PdfTextUnavailable(RuntimeError):
+    """Raised when PDF text cannot be extracted locally (pypdf missing or unreadable file)."""
+
+
+# --- 2. EXTRACTION ---
+def extract_pages(path):
+    """
+    Returns the text of each page. Needs the optional pypdf package.
+    """
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise PdfTextUnavailable("pypdf is not installed (pip install pypdf)")
+    try:
+        reader = PdfReader(path)
+        return [page.extract_text() or "" for page in reader.pages]
+    except Exception as e:
+        raise PdfTextUnavailable(f"Could not read {os.path.basename(path)}: {e}")
+
+
+def _compact_lines(lines):
+    """
+    Table extraction yields one cell per line; runs of short lines are joined
+    with " | " so a tariff row costs one line instead of six.
+    """
+    out, run = [], []
+    for line in lines:
+        if len(line) <= TABLE_CELL_MAX_CHARS and not _HEADING.match(line):
+            run.append(line)
+            continue
+        if run:
+            out.append(" | ".join(run))
+            run = []
+        out.append(line)
+    if run:
+        out.append(" | ".join(run))
+    return "\n".join(out)
+
+
+def split_passages(filename, pages):
+    """
+    Splits a document into passages: one per (page, numbered section). A
+    section that continues onto the next page keeps its title there.
+    Returns [{"file", "page", "section", "text"}].
+    """
+    passages = []
+    section = ""
+    for page_number, text in enumerate(pages, start=1):
+        lines = []
+        for raw in text.split("\n"):
+            line = raw.strip().lstrip("• ").strip()
+            if not line:
+                continue
+            heading = _HEADING.match(line)
+            if heading:
+                if lines:
+                    passages.append({"file": filename, "page": page_number, "section": section, "text": _compact_lines(lines)})
+                    lines = []
+                section = line
+            lines.append(line)
+        if lines:
+            passages.append({"file": filename, "page": page_number, "section": section, "text": _compact_lines(lines)})
+    return passages
+
+
+def citation(passage):
+    label = f"{passage['file']}, p. {passage['page']}"
+    return f"{label} ({passage['section']})" if passage["section"] else label
+
+
+# --- 3. THE INDEX ---
+class PageIndex:
+    """
+    BM25 index over PDF passages (page + section). Files whose text could not
+    be extracted are listed in `unindexed` so callers can attach them whole.
+    `page_source(path)` supplies page texts (default: extract now; the
+    ingestion pipeline passes its pre-parsed artifacts instead).
+    """
+
+    def __init__(self, paths, page_source=extract_pages):
+        self.passages = []
+        self.unindexed = []         # Paths to fall back to whole-file attachment
+        self.errors = {}
+        for path in paths:
+            filename = os.path.basename(path)
+            try:
+                pages = page_source(path)
+            except PdfTextUnavailable as e:
+                self.unindexed.append(path)
+                self.errors[filename] = str(e)
+                continue
+            passages = split_passages(filename, pages)
+            if not passages:
+                # Scanned PDF without a text layer
+                self.unindexed.append(path)
+                self.errors[filename] = "no extractable text"
+                continue
+            self.passages.extend(passages)
+
+        self.postings = {}
+        self.lengths = []
+        for doc_id, passage in enumerate(self.passages):
+            terms = tokenize(f"{passage['section']} {passage['text']}")
+            self.lengths.append(len(terms))
+            for term in terms:
+                bucket = self.postings.setdefault(term, {})
+                bucket[doc_id] = bucket.get(doc_id, 0) + 1
+        n = len(self.passages)
+        self.avg_length = (sum(self.lengths) / n) if n else 0.0
+        self.idf = {
+            term: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5))
+            for term, p in self.postings.items()
+        }
+
+    def search(self, question, files=None):
+        """
+        Returns [(score, passage)] best first, optionally only from `files` (file names).
+        """
+        scores = {}
+        for term in set(tokenize(question)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf[term]
+            for doc_id, tf in postings.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[doc_id] / (self.avg_length or 1))
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return [
+            (score, self.passages[doc_id]) for doc_id, score in ranked
+            if files is None or self.passages[doc_id]["file"] in files
+        ]
+
+    def select(self, question, budget_tokens=PDF_TOKEN_BUDGET, min_score_ratio=PDF_MIN_SCORE_RATIO, files=None):
+        """
+        Best passages that fit the token budget, in document order, each tagged
+        with its page citation. Returns (text, citations); ("", []) if nothing
+        in the PDFs (or in `files`) is relevant.
+        """
+        hits = self.search(question, files)
+        if not hits or hits[0][0] < PDF_MIN_SCORE:
+            return "", []
+        cutoff = hits[0][0] * min_score_ratio
+        chosen, used = [], 0
+        for score, passage in hits:
+            if score < cutoff:
+                break
+            block = f"[{citation(passage)}]\n{passage['text']}"
+            cost = estimate_tokens(block)
+            if used + cost > budget_tokens:
+                if chosen:
+                    continue
+                # Best passage alone is over budget: truncate rather than send nothing
+                block = block[:budget_tokens * 4]
+                cost = budget_tokens
+            chosen.append((passage, block))
+            used += cost
+        order = {id(p): i for i, p in enumerate(self.passages)}
+        chosen.sort(key=lambda item: order[id(item[0])])
+        return "\n\n".join(block for _, block in chosen), [citation(p) for p, _ in chosen]
+
+
+# --- 4. SHARED INSTANCES ---
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_pdf_index(paths):
+    """
+    PageIndex over `paths`, rebuilt only when one of the files changes.
+    """
+    key = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            key.append((path, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            continue
+    key = tuple(key)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = PageIndex([entry[0] for entry in key])
+            _indexes.clear()        # Only the current file set is kept
+            _indexes[key] = index
+        return index
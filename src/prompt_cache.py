@@ -0,0 +1,246 @@
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+try:
+    from prompts import PROMPT_VERSION
+    from backends import gemini_sdk
+    from context_encoder import estimate_tokens
+except ImportError:
+    from src.prompts import PROMPT_VERSION
+    from src.backends import gemini_sdk
+    from src.context_encoder import estimate_tokens
+
+# --- 1. CONFIGURATION ---
+PROMPT_CACHE_TTL = timedelta(hours=1)       # Server-side lifetime of one cached prefix
+PROMPT_CACHE_REFRESH_MARGIN = timedelta(minutes=5)
+PROMPT_CACHE_RETRY_AFTER = timedelta(minutes=10)   # A prefix the provider refused is tried again after this
+PROMPT_CACHE_MAX_ENTRIES = 2                # e.g. "full workbook" + "retrieval" prefixes
+# Gemini refuses cached content below a minimum size (1,024 tokens on 2.5
+# Flash, 4,096 on 2.5 Pro). Smaller prefixes, e.g. retrieval mode without
+# attachments, are sent in full without trying.
+PROMPT_CACHE_MIN_TOKENS = {"gemini-2.5-pro": 4096}
+PROMPT_CACHE_DEFAULT_MIN_TOKENS = 1024
+
+
+def prefix_key(model_name, prefix_text, handles, kb_version=None):
+    """
+    Identifies one cacheable prefix: same model, prompt version, KB version,
+    prefix text and attachments -> same key.
+    """
+    digest = hashlib.sha256()
+    for part in (model_name, PROMPT_VERSION, kb_version or "", prefix_text):
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    for handle in handles or []:
+        digest.update(str(getattr(handle, "name", handle)).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class _Entry:
+    def __init__(self, model, expires_at, handle=None):
+        self.model = model
+        self.expires_at = expires_at
+        self.handle = handle
+        self.uses = 0
+
+
+# --- 2. GEMINI CACHED CONTENT ---
+class GeminiPrefixCache:
+    """
+    Keeps the stable prompt prefix (role, Excel context, PDF attachments) in
+    Gemini cached content, one entry per knowledge-base version. Requests then
+    only send the per-request suffix.
+    """
+
+    def __init__(self, ttl=PROMPT_CACHE_TTL, max_entries=PROMPT_CACHE_MAX_ENTRIES,
+                 retry_after=PROMPT_CACHE_RETRY_AFTER):
+        self.genai = gemini_sdk()
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.retry_after = retry_after
+        self._entries = OrderedDict()
+        self._failed = {}               # key -> time of the last refused create call
+        self._creating = {}             # key -> Event, set once the cache for key is created (or failed)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+
+    @staticmethod
+    def cacheable(model_name, prefix_text, handles):
+        # Attached PDFs are always well above the minimum
+        minimum = PROMPT_CACHE_MIN_TOKENS.get(model_name, PROMPT_CACHE_DEFAULT_MIN_TOKENS)
+        return bool(handles) or estimate_tokens(prefix_text) >= minimum
+
+    def get_model(self, model_name, prefix_text, handles, kb_version=None):
+        """
+        Returns a model bound to the cached prefix, creating the cache on first use
+        or when the previous one is about to expire; None for prefixes below the
+        provider's minimum size. Raises if the provider refuses; callers then send
+        the plain prompt, and the prefix is not tried again for `retry_after`.
+
+        The create call runs outside the lock: other prefixes are served
+        meanwhile, and requests for the same prefix wait for that one call.
+        """
+        if not self.cacheable(model_name, prefix_text, handles):
+            with self._lock:
+                self.skipped += 1
+            return None
+        key = prefix_key(model_name, prefix_text, handles, kb_version)
+        while True:
+            now = datetime.now(timezone.utc)
+            with self._lock:
+                self._forget_failures(now)
+                if key in self._failed:
+                    raise RuntimeError("prefix not cacheable (previous attempt failed)")
+                entry = self._entries.get(key)
+                if entry and entry.expires_at - PROMPT_CACHE_REFRESH_MARGIN > now:
+                    self._entries.move_to_end(key)
+                    entry.uses += 1
+                    self.hits += 1
+                    return entry.model
+                in_flight = self._creating.get(key)
+                if in_flight is None:
+                    self.misses += 1
+                    self._creating[key] = threading.Event()
+                    break
+            in_flight.wait()
+
+        try:
+            cached = self.genai.caching.CachedContent.create(
+                model=f"models/{model_name}",
+                display_name=f"distribiq-{(kb_version or key)[:16]}",
+                contents=[prefix_text, *(handles or [])],
+                ttl=self.ttl,
+            )
+            model = self.genai.GenerativeModel.from_cached_content(cached)
+        except Exception:
+            with self._lock:
+                self._failed[key] = now
+                self._creating.pop(key).set()
+            raise
+        with self._lock:
+            self._store(key, _Entry(model, now + self.ttl, handle=cached))
+            self._creating.pop(key).set()
+        return model
+
+    def _forget_failures(self, now):
+        for key in [key for key, failed_at in self._failed.items() if now - failed_at >= self.retry_after]:
+            del self._failed[key]
+
+    def _store(self, key, entry):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._delete(old)
+        self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._delete(evicted)
+
+    @staticmethod
+    def _delete(entry):
+        # Best effort: an orphaned cache still expires on its own after the TTL
+        try:
+            if entry.handle is not None:
+                entry.handle.delete()
+        except Exception:
+            pass
+
+    def stats(self):
+        with self._lock:
+            return {"backend": "gemini", "hits": self.hits, "misses": self.misses, "skipped": self.skipped,
+                    "entries": len(self._entries)}
+
+
+# --- 3. LOCAL STAND-IN ---
+class _LocalCachedModel:
+    """
+    Minimal model double bound to one stored prefix. It never calls an API;
+    it reports which prefix served the request so reuse can be checked offline.
+    """
+
+    def __init__(self, key, owner):
+        self.key = key
+        self.owner = owner
+
+    def generate_content(self, contents, **kwargs):
+        with self.owner._lock:
+            entry = self.owner._entries.get(self.key)
+            if entry is not None:
+                entry.uses += 1
+            uses = entry.uses if entry is not None else 1
+        answer = {
+            "answer": "Local prompt-cache stand-in: no model was called.",
+            "explanation": f"Served from cached prefix {self.key[:12]} (use #{uses}).",
+            "citations": [],
+            "confidence": 0.0,
+        }
+        response = _LocalResponse(json.dumps(answer))
+        return [response] if kwargs.get("stream") else response
+
+
+class _LocalResponse:
+    def __init__(self, text):
+        self.text = text
+        self.usage_metadata = None
+
+
+class LocalPrefixCache(GeminiPrefixCache):
+    """
+    Offline stand-in with the same interface as GeminiPrefixCache: prefixes are
+    held in memory so tests and benchmarks can verify that consecutive requests
+    against the same knowledge base reuse one prefix. Every prefix is
+    stored, whatever its size; the Gemini SDK is never imported.
+    """
+
+    def __init__(self, ttl=PROMPT_CACHE_TTL, max_entries=PROMPT_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+
+    def get_model(self, model_name, prefix_text, handles, kb_version=None):
+        key = prefix_key(model_name, prefix_text, handles, kb_version)
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry.expires_at - PROMPT_CACHE_REFRESH_MARGIN > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.model
+            self.misses += 1
+            self._store(key, _Entry(_LocalCachedModel(key, self), now + self.ttl))
+            return self._entries[key].model
+
+    def stats(self):
+        stats = super().stats()
+        stats["backend"] = "local"
+        return stats
+
+
+# --- 4. SHARED INSTANCE ---
+_prompt_caches = {}
+_prompt_caches_lock = threading.Lock()
+
+def get_prompt_cache(backend):
+    """
+    Returns the process-wide prefix cache for "gemini" or "local" (None disables caching).
+    """
+    if not backend:
+        return None
+    with _prompt_caches_lock:
+        if backend not in _prompt_caches:
+            if backend == "gemini":
+                _prompt_caches[backend] = GeminiPrefixCache()
+            elif backend == "local":
+                _prompt_caches[backend] = LocalPrefixCache()
+            else:
+                raise ValueError(f"Unknown prompt cache backend '{backend}'")
+        return _prompt_caches[backend]
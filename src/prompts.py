@@ -0,0 +1,217 @@
+import json
+
+# --- PROMPT LAYOUT ---
+# The solver prompt is split in two so providers can reuse the expensive part:
+#   PREFIX (stable per knowledge-base version): role, full Excel context, PDF attachments
+#   SUFFIX (per request): retrieved rows, date/time context, question, instructions
+# Anything that changes per request must stay out of the prefix.
+
+PROMPT_VERSION = "5"
+
+# Typed response schema (Gemini response_schema). Tabular answers come back as
+# real column/row lists in "table" instead of dicts embedded in the answer text.
+RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "answer": {"type": "string"},
+        "table": {
+            "type": "object",
+            "nullable": True,
+            "properties": {
+                "columns": {"type": "array", "items": {"type": "string"}},
+                "rows": {"type": "array", "items": {"type": "array", "items": {"type": "string"}}},
+            },
+            "required": ["columns", "rows"],
+        },
+        "explanation": {"type": "string"},
+        "citations": {"type": "array", "items": {"type": "string"}},
+        "confidence": {"type": "number"},
+        "timestamp": {"type": "string"},
+    },
+    "required": ["answer", "explanation", "citations", "confidence"],
+}
+
+SYSTEM_ROLE = """
+            You are DistribIQ, an expert AI assistant for Barentz specializing in supply chain,
+            product information, logistics, and regulatory compliance.
+"""
+
+
+def build_prefix(excel_context=None, pdfs_attached=True):
+    """
+    Static part of the prompt. Pass excel_context=None when the workbook is
+    retrieved per question (it then lives in the suffix instead), and
+    pdfs_attached=False when PDF pages are sent as text with the question.
+    """
+    excel_block = excel_context if excel_context else (
+        "(The workbook rows relevant to each question are provided with the question below.)"
+    )
+    pdf_block = (
+        "(See attached files for Shipping Tariffs and Compliance Guide)" if pdfs_attached else
+        "(The Shipping Tariffs and Compliance Guide pages relevant to each question are provided with the question below.)"
+    )
+    return f"""{SYSTEM_ROLE}
+            ═══════════════════════════════════════════════════════════════
+            📊 CONTEXT 1: PRODUCT & PRICING DATA (Excel)
+            ═══════════════════════════════════════════════════════════════
+            {excel_block}
+
+            ═══════════════════════════════════════════════════════════════
+            📄 CONTEXT 2: ATTACHED PDF DOCUMENTS
+            ═══════════════════════════════════════════════════════════════
+            {pdf_block}
+            """
+
+
+class PromptTemplate:
+    """
+    The solver prompt of one knowledge-base version, precompiled: each prefix
+    variant (full workbook or retrieved rows, PDFs attached or sent as text)
+    is rendered once and the same string is reused by every request, so the
+    workbook text is not copied per question. Requests only build their
+    suffix; the parts are sent as a list (prefix, attachments, suffix).
+    """
+
+    def __init__(self, excel_text=""):
+        self.excel_text = excel_text
+        self._prefixes = {}
+
+    def prefix(self, full_workbook=False, pdfs_attached=True):
+        key = (bool(full_workbook and self.excel_text), pdfs_attached)
+        prefix = self._prefixes.get(key)
+        if prefix is None:
+            prefix = self._prefixes.setdefault(key, build_prefix(self.excel_text if key[0] else None, pdfs_attached))
+        return prefix
+
+
+def _output_format(time_context):
+    return f"""Output format (JSON):
+            {{
+                "answer": "The direct answer to the user's question. If calculating dates, show the actual calendar date.",
+                "table": {{"columns": ["PharmaCo SKU", "Product Name"], "rows": [["PC-XX-XX-001", "Example"]]}} or null,
+                "explanation": "Step-by-step explanation. For date calculations, show: Today ({time_context['date']}) + X days = [calculated date]",
+                "citations": ["Sheet Name or PDF Section"],
+                "confidence": 0.95,
+                "timestamp": "{time_context['full_datetime']}"
+            }}
+            """
+
+
+def build_suffix(question, time_context, retrieved_context=None, pdf_context=None, scope=None, dates_context=None,
+                 conversation=None):
+    """
+    Per-request part of the prompt: anything that depends on the question or
+    the clock. `scope` (a domain label) restricts a fan-out branch to its part
+    of the question; `dates_context` holds delivery dates computed locally
+    (calendar_engine.py), which the model then uses instead of counting days;
+    `conversation` is the bounded chat context (conversation.py).
+    """
+    conversation_block = ""
+    if conversation:
+        conversation_block = f"""
+
+            ═══════════════════════════════════════════════════════════════
+            💬 CONVERSATION SO FAR
+            ═══════════════════════════════════════════════════════════════
+            The question below may refer back to this ("it", "that supplier", "and from DSM?").
+            {conversation}"""
+    scope_block = ""
+    if scope:
+        scope_block = f"""
+            7. This question is answered in parts, one per data domain. Answer ONLY the
+               "{scope}" part from the data above and skip parts that need other data (they
+               are answered separately), but state every figure from your data that the
+               other parts need (unit prices, transit days, lead times, required documents)
+"""
+    retrieved_block = ""
+    if retrieved_context:
+        retrieved_block = f"""
+            ═══════════════════════════════════════════════════════════════
+            📊 RELEVANT EXCEL ROWS FOR THIS QUESTION
+            ═══════════════════════════════════════════════════════════════
+            Only the rows relevant to this question are included. The 'Row' column is the Excel row number.
+            {retrieved_context}
+            """
+    if pdf_context:
+        retrieved_block += f"""
+            ═══════════════════════════════════════════════════════════════
+            📄 RELEVANT PDF PAGES FOR THIS QUESTION
+            ═══════════════════════════════════════════════════════════════
+            Each passage starts with its [file, page (section)] citation; cite PDFs with it.
+            {pdf_context}
+            """
+    date_rule = f"2. For lead times: Calculate actual delivery dates from TODAY ({time_context['date']})"
+    if dates_context:
+        retrieved_block += f"""
+            ═══════════════════════════════════════════════════════════════
+            🗓️ PRE-COMPUTED DELIVERY DATES (order placed today)
+            ═══════════════════════════════════════════════════════════════
+            Business days (Mon-Fri) excluding public holidays of the origin/destination country:
+            dispatch = today + lead time, arrival = dispatch + quality hold + transit.
+            {dates_context}
+            """
+        date_rule = "2. For delivery dates: use the PRE-COMPUTED DELIVERY DATES above as they are; do not recount days"
+    return f"""{retrieved_block}
+            ═══════════════════════════════════════════════════════════════
+            📅 CURRENT DATE & TIME CONTEXT
+            ═══════════════════════════════════════════════════════════════
+            Today is: {time_context['full_datetime']}
+            Day: {time_context['day_of_week']}
+            Week: {time_context['week_number']} of {time_context['year']}
+            Quarter: {time_context['quarter']}
+            Business Hours: {time_context['business_status']}
+
+            USE THIS DATE FOR:
+            - Calculating lead times and delivery dates
+            - Determining shipping schedules (exclude weekends if needed)
+            - Checking if tariffs/regulations are current
+            - Estimating arrival dates based on transit times
+            - Any date-related calculations{conversation_block}
+
+            ═══════════════════════════════════════════════════════════════
+            ❓ USER QUESTION
+            ═══════════════════════════════════════════════════════════════
+            {question}
+
+            ═══════════════════════════════════════════════════════════════
+            📋 RESPONSE INSTRUCTIONS
+            ═══════════════════════════════════════════════════════════════
+            1. Answer precisely using the provided data
+            {date_rule}
+            3. For shipping: Consider business days only (Mon-Fri)
+            4. Show your calculations step-by-step
+            5. Cite specific sources (sheet names with row numbers where given, PDF sections)
+            6. If the answer lists several products or rows, put them in "table" (column names +
+               one list of cell values per row) and keep "answer" to a one-sentence summary
+{scope_block}
+            {_output_format(time_context)}"""
+
+def build_merge_prompt(question, time_context, partials):
+    """
+    Prompt for the merge step of a fan-out: the partial answers of each
+    domain (as JSON), no source data. partials: [(domain label, answer dict)].
+    """
+    parts = "\n".join(f"[{label}]\n{json.dumps(answer, ensure_ascii=False)}" for label, answer in partials)
+    return f"""{SYSTEM_ROLE}
+            ═══════════════════════════════════════════════════════════════
+            🧩 PARTIAL ANSWERS
+            ═══════════════════════════════════════════════════════════════
+            The question below was split by data domain and each part was answered from its own data:
+            {parts}
+
+            ═══════════════════════════════════════════════════════════════
+            ❓ USER QUESTION (today is {time_context['full_datetime']})
+            ═══════════════════════════════════════════════════════════════
+            {question}
+
+            ═══════════════════════════════════════════════════════════════
+            📋 RESPONSE INSTRUCTIONS
+            ═══════════════════════════════════════════════════════════════
+            1. Combine the partial answers into one answer to the whole question
+            2. Use only facts and figures from the partial answers; never add data
+            3. Do every calculation that needs figures from several parts (e.g. product
+               cost + freight = landed cost) and show it step-by-step
+            4. Keep the citations that support the final answer
+            5. If the answer lists several products or rows, put them in "table"
+
+            {_output_format(time_context)}"""
@@ -0,0 +1,351 @@
+import os
+import re
+import threading
+
+try:
+    from snapshot import read_workbook
+except ImportError:
+    from src.snapshot import read_workbook
+
+# --- 1. CONFIGURATION ---
+SKU_COLUMN = "PharmaCo SKU"
+SKU_PATTERN = re.compile(r"\b[A-Z]{2,4}-[A-Z]{2,4}-[A-Z]{2,5}-\d{3}\b")
+
+# Tokens that describe a grade/spec rather than the product itself
+# ("Citric Acid Anhydrous BP/USP/FCC" is asked about as "Citric Acid")
+_SPEC_TOKENS = {
+    "anhydrous", "bp", "usp", "fcc", "fg", "pg", "nf", "ep", "ph", "eur",
+    "food", "pharma", "grade", "granular", "mesh", "vegetable", "monohydrate",
+    "de", "l", "high", "density",
+}
+
+# Single-product attribute lookups: keyword -> (label, sheet, column, unit suffix)
+_ATTRIBUTE_LOOKUPS = [
+    ("lead time", "lead time", "Product Master Data", "Lead Time (weeks)", " weeks"),
+    ("moq", "MOQ", "Product Master Data", "MOQ (kg)", " kg"),
+    ("minimum order", "MOQ", "Product Master Data", "MOQ (kg)", " kg"),
+    ("shelf life", "shelf life", "Product Master Data", "Shelf Life (months)", " months"),
+    ("cas number", "CAS number", "Product Master Data", "CAS Number", ""),
+    ("hs code", "HS code", "Product Master Data", "HS Code", ""),
+    ("storage temp", "storage temperature", "Product Master Data", "Storage Temp (°C)", " °C"),
+    ("hazard", "hazard class", "Product Master Data", "Hazard Class", ""),
+    ("next audit", "next supplier audit", "Quality Requirements", "Next Audit Due", ""),
+    ("audit due", "next supplier audit", "Quality Requirements", "Next Audit Due", ""),
+    ("retest period", "retest period", "Quality Requirements", "Retest Period (months)", " months"),
+    ("quality hold", "quality hold", "Quality Requirements", "Quality Hold (days)", " days"),
+]
+
+# Phrases that mean the question needs reasoning beyond a single lookup
+_NEEDS_REASONING = (
+    "arrive", "arrival", "deliver", "today", "tomorrow", "compare", " vs ",
+    "versus", "ship", "freight", "landed", "transport", "why", "recommend",
+    "should", "calculate", "total cost",
+)
+
+
+# --- 2. TEXT HELPERS ---
+def normalize(text):
+    """
+    Lowercases and reduces text to space-separated alphanumeric tokens.
+    """
+    text = re.sub(r"(?<=\d),(?=\d{3})", "", str(text).lower()).replace("%", " % ")
+    return " " + " ".join(re.findall(r"[a-z0-9à-ÿ%]+", text)) + " "
+
+
+def _product_aliases(name):
+    """
+    Derives the short names people use for a product, e.g.
+    "Ascorbic Acid (Vitamin C) 97% FG/PG" -> {"ascorbic acid", "vitamin c"}.
+    """
+    aliases = set()
+    head, _, rest = str(name).partition("(")
+    paren = rest.split(")")[0] if rest else ""
+
+    tokens = normalize(head).split()
+    short = []
+    for token in tokens:
+        if token in _SPEC_TOKENS or token == "%" or token.isdigit():
+            break
+        short.append(token)
+    if short:
+        aliases.add(" ".join(short))
+    elif tokens:
+        aliases.add(tokens[0])
+
+    if paren:
+        paren_tokens = normalize(paren).split()
+        if paren_tokens:
+            aliases.add(" ".join(paren_tokens))
+    aliases.add(normalize(name).strip())
+    return {a for a in aliases if len(a) >= 3}
+
+
+def _range_bounds(value):
+    """
+    Parses "2-3" / "5" style ranges into (min, max) floats, or (None, None).
+    """
+    numbers = re.findall(r"\d+(?:\.\d+)?", str(value))
+    if not numbers:
+        return None, None
+    return float(numbers[0]), float(numbers[-1] if len(numbers) > 1 else numbers[0])
+
+
+def _plural(count, unit):
+    """
+    "1 week", "2 weeks".
+    """
+    return f"{count} {unit}" if count == 1 else f"{count} {unit}s"
+
+
+def _format_value(value):
+    import pandas as pd
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, pd.Timestamp):
+        return value.strftime("%Y-%m-%d")
+    return str(value)
+
+
+# --- 3. THE ENGINE ---
+class StructuredQueryEngine:
+    """
+    Typed, indexed view of the DM workbook that answers simple lookup and
+    filter questions locally, in the same JSON shape as the LLM solver.
+    """
+
+    def __init__(self, sheets, source_file="DM_Report_MASTER_Generic.xlsx"):
+        self.source_file = source_file
+        self.sheets = {name: self._type_sheet(name, df) for name, df in sheets.items()}
+        self._build_indexes()
+
+    @classmethod
+    def from_excel(cls, excel_path):
+        sheets = read_workbook(excel_path)
+        return cls(sheets, source_file=os.path.basename(excel_path))
+
+    # --- Typing ---
+    @staticmethod
+    def _type_sheet(name, df):
+        # pandas is imported where DataFrames are handled, not by importers of this module
+        import pandas as pd
+        df = df.copy()
+        df.columns = [str(c).strip() for c in df.columns]
+        for col in df.columns:
+            if df[col].dtype == object or str(df[col].dtype) in ("str", "string"):
+                df[col] = df[col].fillna("").astype(str).str.strip()
+        if "Lead Time (weeks)" in df.columns:
+            bounds = df["Lead Time (weeks)"].map(_range_bounds)
+            df["_lead_min"] = bounds.map(lambda b: b[0])
+            df["_lead_max"] = bounds.map(lambda b: b[1])
+        for col in ("Supplier Audit Date", "Next Audit Due", "Last Review", "Next Review"):
+            if col in df.columns:
+                df[col] = pd.to_datetime(df[col], errors="coerce")
+        return df
+
+    # --- Indexing ---
+    def _build_indexes(self):
+        # SKU -> row position, per sheet (lists for one-to-many sheets)
+        self.sku_index = {}
+        for name, df in self.sheets.items():
+            if SKU_COLUMN not in df.columns:
+                continue
+            index = {}
+            for pos, sku in enumerate(df[SKU_COLUMN]):
+                index.setdefault(sku, []).append(pos)
+            self.sku_index[name] = index
+
+        self.products = {}          # SKU -> master data row (dict)
+        self.alias_index = {}       # alias -> set of SKUs
+        self.supplier_index = {}    # supplier alias -> set of SKUs
+        master = self.sheets.get("Product Master Data")
+        if master is None:
+            return
+        for row in master.to_dict("records"):
+            sku = row[SKU_COLUMN]
+            self.products[sku] = row
+            for alias in _product_aliases(row.get("Product Name", "")):
+                self.alias_index.setdefault(alias, set()).add(sku)
+            supplier = normalize(row.get("Supplier Name", "")).strip()
+            supplier_aliases = {supplier, supplier.split(" ")[0]}
+            code = str(row.get("Supplier Code", "")).split("-")[0].lower()
+            supplier_aliases.add(code)
+            for alias in supplier_aliases:
+                if len(alias) >= 3:
+                    self.supplier_index.setdefault(alias, set()).add(sku)
+
+    def rows(self, sheet, sku):
+        """
+        Returns all rows of `sheet` for a SKU (index lookup, no scan).
+        """
+        positions = self.sku_index.get(sheet, {}).get(sku, [])
+        return self.sheets[sheet].iloc[positions].to_dict("records")
+
+    def match_products(self, question):
+        """
+        Resolves the SKUs a question refers to: explicit SKUs first, then
+        product aliases, narrowed by any supplier mentioned.
+        """
+        skus = {s for s in SKU_PATTERN.findall(question) if s in self.products}
+        if skus:
+            return skus
+
+        q = normalize(question)
+        by_alias = set()
+        matched_aliases = [a for a in self.alias_index if f" {a} " in q]
+        # Drop aliases contained in a longer matched alias ("acid" inside "citric acid")
+        for alias in matched_aliases:
+            if not any(alias != other and alias in other for other in matched_aliases):
+                by_alias |= self.alias_index[alias]
+
+        suppliers = set()
+        for alias, supplier_skus in self.supplier_index.items():
+            if f" {alias} " in q:
+                suppliers |= supplier_skus
+        if by_alias and suppliers:
+            # A named supplier that does not carry the product is not a lookup we can answer
+            return by_alias & suppliers
+        return by_alias
+
+    # --- Fast path ---
+    def answer(self, question):
+        """
+        Returns an answer dict for recognised lookup/filter intents, or None
+        when the question should go to the LLM.
+        """
+        q = normalize(question)
+        if any(marker in q for marker in _NEEDS_REASONING):
+            return None
+        skus = self.match_products(question)
+
+        for intent in (self._price_for_quantity, self._attribute_lookup,
+                       self._lead_time_filter, self._retest_filter):
+            result = intent(q, skus)
+            if result is not None:
+                result.setdefault("confidence", 1.0)
+                result["route"] = "fast_path"
+                return result
+        return None
+
+    def _attribute_lookup(self, q, skus):
+        import pandas as pd
+        if len(skus) != 1:
+            return None
+        sku = next(iter(skus))
+        for keyword, label, sheet, column, unit in _ATTRIBUTE_LOOKUPS:
+            if f" {keyword} " not in q or sheet not in self.sheets:
+                continue
+            rows = self.rows(sheet, sku)
+            if len(rows) != 1 or rows[0].get(column) in ("", None) or pd.isna(rows[0].get(column)):
+                return None
+            product = self.products[sku]
+            value = _format_value(rows[0][column]) + unit
+            supplier = f" from {product['Supplier Name']}" if sheet == "Product Master Data" else ""
+            return {
+                "answer": f"The {label} for {product['Product Name']} ({sku}){supplier} is {value}.",
+                "explanation": (
+                    f"1. Matched the question to {product['Product Name']} ({sku}).\n"
+                    f"2. Looked up '{column}' in the '{sheet}' sheet: {value}."
+                ),
+                "citations": [sheet],
+            }
+        return None
+
+    def _lead_time_filter(self, q, skus):
+        match = re.search(r" (?:within|under|less than|below|in) (\d+) weeks? ", q)
+        if skus or not match or " lead" not in q and " get " not in q:
+            return None
+        limit = int(match.group(1))
+        master = self.sheets["Product Master Data"]
+        hits = master[master["_lead_max"] <= limit]
+        # A "2-3 weeks" range against a 2-week limit may or may not make it, and
+        # "none" is not a safe confident answer either: both go to the model
+        straddling = master[(master["_lead_min"] <= limit) & (master["_lead_max"] > limit)]
+        if hits.empty or not straddling.empty:
+            return None
+        return {
+            "answer": hits[[SKU_COLUMN, "Product Name", "Lead Time (weeks)"]].to_dict("records"),
+            "explanation": (
+                f"1. Parsed each 'Lead Time (weeks)' range in 'Product Master Data'.\n"
+                f"2. Filtered for products whose maximum lead time is ≤ {_plural(limit, 'week')}: {len(hits)} found."
+            ),
+            "citations": ["Product Master Data"],
+        }
+
+    def _retest_filter(self, q, skus):
+        match = re.search(r" retest periods? (?:shorter|less|under|below) (?:than )?(\d+) months? ", q)
+        if skus or not match or "Quality Requirements" not in self.sheets:
+            return None
+        limit = int(match.group(1))
+        quality = self.sheets["Quality Requirements"]
+        hits = quality[quality["Retest Period (months)"] < limit].sort_values("Retest Period (months)")
+        rows = [
+            {
+                SKU_COLUMN: sku,
+                "Product Name": self.products.get(sku, {}).get("Product Name", ""),
+                "Retest Period (months)": int(months),
+            }
+            for sku, months in zip(hits[SKU_COLUMN], hits["Retest Period (months)"])
+        ]
+        return {
+            "answer": rows or f"No products have a retest period shorter than {_plural(limit, 'month')}.",
+            "explanation": (
+                f"1. Filtered 'Quality Requirements' for 'Retest Period (months)' < {limit}.\n"
+                f"2. Sorted the {len(rows)} matches shortest first and joined product names from 'Product Master Data'."
+            ),
+            "citations": ["Quality Requirements", "Product Master Data"],
+        }
+
+    def _price_for_quantity(self, q, skus):
+        match = re.search(r" (\d+(?:\.\d+)?) (kg|mt|t|tonnes?) ", q)
+        if len(skus) != 1 or not match or not (" price " in q or " cost " in q):
+            return None
+        quantity = float(match.group(1)) * (1000 if match.group(2) != "kg" else 1)
+        sku = next(iter(skus))
+        tiers = [
+            t for t in self.rows("Pricing Tiers", sku)
+            if t["Min Qty (kg)"] <= quantity <= t["Max Qty (kg)"]
+        ] if "Pricing Tiers" in self.sheets else []
+        if len(tiers) != 1:
+            return None
+        tier = tiers[0]
+        unit_price = float(tier["Unit Price (€/kg)"])
+        total = unit_price * quantity
+        qty_text = _format_value(quantity)
+        return {
+            "answer": (
+                f"For {qty_text} kg of {tier['Product Name']} ({sku}) the applicable tier is "
+                f"{tier['Volume Tier']}: €{unit_price:.2f}/kg ({tier['Discount %']} discount), "
+                f"total €{total:,.2f}."
+            ),
+            "explanation": (
+                f"1. Found the 'Pricing Tiers' rows for {sku}.\n"
+                f"2. {qty_text} kg falls in {tier['Volume Tier']} "
+                f"({tier['Min Qty (kg)']}-{tier['Max Qty (kg)']} kg).\n"
+                f"3. {qty_text} kg × €{unit_price:.2f}/kg = €{total:,.2f}. "
+                f"Payment terms: {tier['Payment Terms']}; volume rebate: {tier['Volume Rebate']}."
+            ),
+            "citations": ["Pricing Tiers"],
+        }
+
+
+# --- 4. SHARED INSTANCE ---
+_engines = {}
+_engines_lock = threading.Lock()
+
+def get_query_engine(excel_path):
+    """
+    Returns a StructuredQueryEngine for the workbook, built once per file
+    version (path + mtime + size) and shared by every caller.
+    """
+    try:
+        stat = os.stat(excel_path)
+    except OSError:
+        return None
+    key = (os.path.abspath(excel_path), stat.st_mtime_ns, stat.st_size)
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = StructuredQueryEngine.from_excel(excel_path)
+            _engines.clear()
+            _engines[key] = engine
+    return engine
@@ -0,0 +1,100 @@
+import json
+import pandas as pd
+
+try:
+    from table_extract import extract_rows
+except ImportError:
+    from src.table_extract import extract_rows
+
+# --- 1. CONFIGURATION ---
+PRIORITY_COLUMNS = ['PharmaCo SKU', 'Product Name', 'EU Compliance', 'EU Compliance Status']
+COLUMN_LABELS = {'PharmaCo SKU': 'SKU', 'Product Name': 'Product'}
+ACTION_WORDS = ('filtered', 'looked', 'identified', 'compiled', 'reviewed', 'extracted', 'cross-referenced')
+
+
+# --- 2. EXPLANATION STEPS ---
+def classify_explanation(text):
+    """
+    Splits an explanation into (kind, text) items once, so re-rendering is a
+    plain loop. kind is "step" (numbered main step), "action", "source" or "line".
+    """
+    items = []
+    if not text:
+        return items
+    for line in str(text).split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+        # If line starts with number, it's a main step
+        if line[0].isdigit() and '.' in line[:3]:
+            items.append(("step", line[line.index('.') + 1:].strip()))
+        # Action words = indented bullet
+        elif any(word in line.lower() for word in ACTION_WORDS):
+            items.append(("action", line))
+        # Sheet names = data source
+        elif "'" in line and 'sheet' in line.lower():
+            items.append(("source", line))
+        else:
+            items.append(("line", line))
+    return items
+
+
+# --- 3. TABLE ---
+def build_table(rows):
+    """
+    DataFrame for display: priority columns first, friendly labels. None if no rows.
+    """
+    if not rows:
+        return None
+    df = pd.DataFrame(rows)
+    cols = list(df.columns)
+    sorted_cols = [c for c in PRIORITY_COLUMNS if c in cols] + [c for c in cols if c not in PRIORITY_COLUMNS]
+    return df[sorted_cols].rename(columns=COLUMN_LABELS)
+
+
+# --- 4. THE RENDER MODEL ---
+def build_render_model(final, timings=None):
+    """
+    Everything the chat needs to draw one assistant answer, computed once when
+    the answer arrives: summary text, table DataFrame, classified explanation
+    steps, citations and timings.
+    """
+    rows = final.get("rows")
+    if rows is None:
+        rows = extract_rows(final)
+    table = build_table(rows)
+    answer = final.get("answer", "")
+    error = final.get("error") if "answer" not in final else None
+    return {
+        "error": error,
+        # With a table, the text is only shown when it is a separate summary
+        "text": None if table is not None and not (final.get("table") and isinstance(answer, str)) else str(answer),
+        "table": table,
+        "steps": classify_explanation(final.get("explanation")),
+        "citations": list(final.get("citations") or []),
+        "timings": timings or {},
+    }
+
+
+def message_from_answer(final, timings=None):
+    """
+    Chat-history entry for an assistant answer: raw JSON content plus its render model.
+    """
+    return {"role": "assistant", "content": json.dumps(final, default=str), "render": build_render_model(final, timings)}
+
+
+def ensure_render_model(message):
+    """
+    Adds a render model to a history entry that predates them (parsed once, then kept).
+    """
+    if "render" in message or message.get("role") != "assistant":
+        return message
+    content = message.get("content")
+    if isinstance(content, str) and content.strip().startswith("{") and '"answer":' in content:
+        try:
+            message["render"] = build_render_model(json.loads(content))
+        except ValueError:
+            message["render"] = None
+    else:
+        message["render"] = None
+    return message
@@ -0,0 +1,215 @@
+import re
+import math
+import threading
+
+try:
+    from context_encoder import format_cell, estimate_tokens, build_dictionary, encode_cells, legend, used_codes
+except ImportError:
+    from src.context_encoder import format_cell, estimate_tokens, build_dictionary, encode_cells, legend, used_codes
+
+# --- 1. CONFIGURATION ---
+RETRIEVAL_TOKEN_BUDGET = 3000     # Max (estimated) tokens of Excel rows per prompt
+BM25_K1 = 1.2
+BM25_B = 0.75
+MIN_SCORE_RATIO = 0.25            # Drop rows scoring below this fraction of the best row...
+AGGREGATE_SCORE_RATIO = 0.1       # ...looser for "which/list/compare" questions that span many rows
+_AGGREGATE_PATTERN = re.compile(r"\b(which|list|all|compare|rank|most|least|cheapest|fastest|any)\b", re.I)
+
+# Sheets that never go into answer prompts ("Decision Scenarios" is the
+# benchmark question set itself, not business data)
+EXCLUDED_SHEETS = {"Decision Scenarios"}
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-.][a-z0-9]+)*")
+_STOPWORDS = {
+    "a", "an", "the", "of", "for", "to", "in", "on", "and", "or", "is", "are",
+    "what", "which", "when", "how", "do", "does", "can", "we", "our", "with",
+    "from", "by", "it", "be", "all", "any", "list", "me", "i", "there", "have",
+    "has", "this", "that", "need", "needed", "get", "give", "show", "find",
+}
+
+
+def tokenize(text):
+    """
+    Lowercase word tokens. SKUs, CAS numbers and "ph.eur" style terms are kept
+    whole and also split into their parts, so "food-grade" still matches "Food".
+    """
+    tokens = []
+    for token in _TOKEN_PATTERN.findall(str(text).lower()):
+        if token in _STOPWORDS:
+            continue
+        tokens.append(token)
+        if "-" in token or "." in token:
+            tokens.extend(p for p in re.split(r"[-.]", token) if p and p not in _STOPWORDS)
+    return tokens
+
+
+# --- 2. THE INDEX ---
+class RowIndex:
+    """
+    BM25 inverted index over individual sheet rows. Each row is indexed with
+    its cell values plus the sheet's column headers, so a question naming a
+    column ("retest period") pulls in the whole sheet while a question naming
+    a product or SKU pulls in just that product's rows.
+    """
+
+    def __init__(self, sheets, source_file="DM_Report_MASTER_Generic.xlsx", encoding="markdown"):
+        self.source_file = source_file
+        self.encoding = encoding
+        self.headers = {}       # sheet -> list of column names
+        self.rendered = {}      # sheet -> list of rendered row lines
+        self.docs = []          # doc_id -> (sheet, position)
+        self.postings = {}      # term -> {doc_id: term frequency}
+        self.doc_lengths = []
+
+        for sheet, df in sheets.items():
+            if sheet in EXCLUDED_SHEETS:
+                continue
+            columns = [c for c in df.columns if not str(c).startswith("_")]
+            self.headers[sheet] = columns
+            header_terms = tokenize(" ".join(columns) + " " + sheet)
+            cell_rows = []
+            for pos, values in enumerate(df[columns].itertuples(index=False, name=None)):
+                cells = [format_cell(v) for v in values]
+                cell_rows.append(cells)
+                self._add_doc(sheet, pos, tokenize(" ".join(cells)) + header_terms)
+            self.rendered[sheet] = cell_rows
+
+        self.dictionary = {}
+        if encoding == "compact":
+            self.dictionary = build_dictionary(
+                {sheet: df for sheet, df in sheets.items() if sheet in self.headers}
+            )
+        self._code_values = {code: value for value, code in self.dictionary.items()}
+        for sheet, cell_rows in self.rendered.items():
+            self.rendered[sheet] = [self._render_row(sheet, cells) for cells in cell_rows]
+
+        self.avg_length = (sum(self.doc_lengths) / len(self.doc_lengths)) if self.doc_lengths else 0.0
+        n = len(self.docs)
+        self.idf = {
+            term: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5))
+            for term, p in self.postings.items()
+        }
+
+    def _add_doc(self, sheet, pos, terms):
+        doc_id = len(self.docs)
+        self.docs.append((sheet, pos))
+        self.doc_lengths.append(len(terms))
+        for term in terms:
+            bucket = self.postings.setdefault(term, {})
+            bucket[doc_id] = bucket.get(doc_id, 0) + 1
+
+    def search(self, query_terms):
+        """
+        Returns [(score, sheet, position)] for every row matching a query term, best first.
+        """
+        scores = {}
+        for term in set(query_terms):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf[term]
+            for doc_id, tf in postings.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[doc_id] / (self.avg_length or 1))
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        return [(score, *self.docs[doc_id]) for doc_id, score in ranked]
+
+    def _render_row(self, sheet, cells):
+        if self.encoding == "compact":
+            return encode_cells(cells, self.headers[sheet], self.dictionary)
+        return "| " + " | ".join(cells) + " |"
+
+    def _number_row(self, line, excel_row):
+        if self.encoding == "compact":
+            return f"{excel_row}\t{line}"
+        return f"| {excel_row} {line}"
+
+    def _header_line(self, sheet):
+        columns = [str(c) for c in self.headers[sheet]]
+        if self.encoding == "compact":
+            return "Row\t" + "\t".join(columns)
+        return "| Row | " + " | ".join(columns) + " |\n|" + "---|" * (len(columns) + 1)
+
+    def select(self, question, extra_terms=(), budget_tokens=RETRIEVAL_TOKEN_BUDGET,
+               min_score_ratio=None, sheets=None):
+        """
+        Picks the best-scoring rows that fit in the token budget, optionally
+        only from `sheets`. Returns (context_text, included) where included
+        maps sheet -> Excel row numbers.
+        """
+        hits = self.search(tokenize(question) + [t.lower() for t in extra_terms])
+        if sheets is not None:
+            hits = [hit for hit in hits if hit[1] in sheets]
+        if min_score_ratio is None:
+            aggregate = _AGGREGATE_PATTERN.search(question)
+            min_score_ratio = AGGREGATE_SCORE_RATIO if aggregate else MIN_SCORE_RATIO
+        if hits:
+            cutoff = hits[0][0] * min_score_ratio
+            hits = [hit for hit in hits if hit[0] >= cutoff]
+        used = estimate_tokens(f"--- SOURCE FILE: {self.source_file} ---\n")
+        chosen = {}
+        legend_codes = set()
+        for _, sheet, pos in hits:
+            line = self.rendered[sheet][pos]
+            cost = estimate_tokens(line)
+            if sheet not in chosen:
+                cost += estimate_tokens(f"\n### SHEET: {sheet}\n" + self._header_line(sheet))
+            new_codes = used_codes([line]) - legend_codes if self.dictionary else set()
+            if new_codes:
+                cost += sum(estimate_tokens(self._code_values[code]) + 1 for code in new_codes)
+            if used + cost > budget_tokens:
+                continue
+            used += cost
+            legend_codes |= new_codes
+            chosen.setdefault(sheet, []).append(pos)
+
+        body = ""
+        included = {}
+        selected_lines = []
+        for sheet in self.rendered:
+            if sheet not in chosen:
+                continue
+            positions = sorted(chosen[sheet])
+            # Excel row numbers: header is row 1, data starts at row 2
+            included[sheet] = [pos + 2 for pos in positions]
+            lines = [self.rendered[sheet][pos] for pos in positions]
+            selected_lines.extend(lines)
+            rows = "\n".join(self._number_row(line, pos + 2) for line, pos in zip(lines, positions))
+            body += (
+                f"\n### SHEET: {sheet} (rows {', '.join(map(str, included[sheet]))} "
+                f"of {len(self.rendered[sheet]) + 1})\n{self._header_line(sheet)}\n{rows}\n"
+            )
+        text = f"--- SOURCE FILE: {self.source_file} ---\n"
+        if self.dictionary:
+            text += legend(self.dictionary, used_codes(selected_lines))
+        return text + body, included
+
+
+# --- 3. SHARED INSTANCE ---
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def get_row_index(engine, encoding="markdown"):
+    """
+    Returns the RowIndex for a StructuredQueryEngine, built once per engine and encoding.
+    """
+    key = (id(engine), encoding)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None or index[0] is not engine:
+            if any(cached is not engine for cached, _ in _indexes.values()):
+                _indexes.clear()
+            index = (engine, RowIndex(engine.sheets, source_file=engine.source_file, encoding=encoding))
+            _indexes[key] = index
+    return index[1]
+
+
+def retrieve_context(engine, question, budget_tokens=RETRIEVAL_TOKEN_BUDGET, encoding="markdown", sheets=None):
+    """
+    Returns (context_text, included_rows) for one question. Products and
+    suppliers named in the question are expanded to their SKUs, so rows in
+    SKU-keyed sheets such as "Logistics Matrix" are found too.
+    """
+    index = get_row_index(engine, encoding)
+    skus = engine.match_products(question)
+    return index.select(question, extra_terms=sorted(skus), budget_tokens=budget_tokens, sheets=sheets)
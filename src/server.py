@@ -0,0 +1,359 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from agent import get_graph, prepare_knowledge_base, DOCS_FOLDER
+    from kb_registry import get_kb_registry
+    from answer_cache import normalize_question
+    from backends import get_backend, set_backend, make_backend
+    from telemetry import telemetry
+    from model_router import get_model_router
+except ImportError:
+    from src.agent import get_graph, prepare_knowledge_base, DOCS_FOLDER
+    from src.kb_registry import get_kb_registry
+    from src.answer_cache import normalize_question
+    from src.backends import get_backend, set_backend, make_backend
+    from src.telemetry import telemetry
+    from src.model_router import get_model_router
+
+# --- 1. CONFIGURATION ---
+HOST = os.environ.get("DISTRIBIQ_HOST", "127.0.0.1")
+PORT = int(os.environ.get("DISTRIBIQ_PORT", "8765"))
+MAX_CONCURRENCY = 8             # Questions solved at the same time (one worker thread each)
+MAX_QUEUE = 32                  # Questions waiting for a worker; beyond this new ones get 429
+REQUEST_TIMEOUT = 120.0         # Seconds a client waits for its answer before a 504
+RETRY_AFTER_SEC = 2             # Retry-After sent with 429/503
+MAX_BODY_BYTES = 64 * 1024
+KEEPALIVE_TIMEOUT = 15.0        # Idle seconds before a keep-alive connection is closed
+
+REASONS = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    413: "Payload Too Large", 429: "Too Many Requests", 500: "Internal Server Error",
+    502: "Bad Gateway", 503: "Service Unavailable", 504: "Gateway Timeout",
+}
+
+
+class Overloaded(RuntimeError):
+    """Raised when every worker is busy and the wait queue is full."""
+
+
+class NotReady(RuntimeError):
+    """Raised while the knowledge base has not been loaded yet."""
+
+
+# --- 2. THE SERVICE ---
+class SolverService:
+    """
+    Runs questions through the agent graph on a bounded worker pool.
+
+    At most `concurrency` questions are solved at once and at most
+    `max_queue` wait for a worker; past that, answer() raises Overloaded.
+    Identical questions (same normalized text, same KB version) that arrive
+    while one is already queued or running share its result instead of
+    making their own model call.
+    """
+
+    def __init__(self, registry, concurrency=MAX_CONCURRENCY, max_queue=MAX_QUEUE, timeout=REQUEST_TIMEOUT):
+        self.registry = registry
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="solver")
+        self._slots = asyncio.Semaphore(concurrency)
+        self._in_flight = {}                # (kb_version, normalized question) -> Task
+        self.running = 0
+        self.waiting = 0
+        self.counters = {"accepted": 0, "coalesced": 0, "rejected": 0, "timeouts": 0}
+
+    async def answer(self, question, question_id):
+        """
+        Returns {"question_id", "answer", "kb_version", "coalesced", "queue_sec", "timings"}.
+        """
+        # The version the question is keyed on is the one it is solved against:
+        # the borrowed snapshot stays alive until its task is done
+        snapshot = self.registry.borrow()
+        if snapshot is None:
+            raise NotReady("knowledge base is loading")
+        key = (snapshot.version, normalize_question(question))
+        task = self._in_flight.get(key)
+        coalesced = task is not None
+        if coalesced:
+            self.registry.release(snapshot)
+            self.counters["coalesced"] += 1
+        else:
+            if self.running + self.waiting >= self.concurrency + self.max_queue:
+                self.registry.release(snapshot)
+                self.counters["rejected"] += 1
+                raise Overloaded(f"{self.waiting} questions already waiting")
+            self.counters["accepted"] += 1
+            # Counted as waiting now, not when the task first runs, so a burst
+            # arriving within one loop iteration cannot overfill the queue
+            self.waiting += 1
+            task = asyncio.ensure_future(self._run(question, question_id, snapshot))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._finished(key, snapshot))
+        try:
+            # shield: a client that times out or disconnects must not cancel
+            # the shared call the other waiters depend on
+            result = await asyncio.wait_for(asyncio.shield(task), self.timeout)
+        except asyncio.TimeoutError:
+            self.counters["timeouts"] += 1
+            raise
+        return dict(result, coalesced=coalesced)
+
+    def _finished(self, key, snapshot):
+        self._in_flight.pop(key, None)
+        self.registry.release(snapshot)
+
+    async def _run(self, question, question_id, snapshot):
+        queued_at = time.perf_counter()
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        try:
+            queue_sec = round(time.perf_counter() - queued_at, 4)
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self.executor, self._solve, question, question_id, snapshot)
+            return dict(result, queue_sec=queue_sec)
+        finally:
+            self.running -= 1
+            self._slots.release()
+
+    def _solve(self, question, question_id, snapshot):
+        # Worker thread: the graph (and the model call) are synchronous
+        kb_data = snapshot.data
+        result = get_graph().invoke({
+            "question_id": question_id,
+            "question": question,
+            "context_files": kb_data["pdf_handles"],
+            "context_text": kb_data["excel_text"],
+            "kb_version": kb_data.get("kb_version", ""),
+            "final_answer": {},
+        })
+        return {
+            "question_id": question_id,
+            "answer": result.get("final_answer") or {},
+            "kb_version": snapshot.version,
+            "timings": result.get("timings"),
+        }
+
+    def stats(self):
+        return {"in_flight": self.running, "queued": self.waiting, "concurrency": self.concurrency,
+                "max_queue": self.max_queue, **self.counters}
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+# --- 3. HTTP ---
+class DistribIQServer:
+    """
+    Minimal HTTP/1.1 JSON API (stdlib asyncio, keep-alive):
+      POST /v1/answer  {"question": "...", "question_id": "..."}
+      GET  /health     KB, queue and backend status (503 until the KB is loaded)
+      GET  /metrics    Prometheus text: telemetry, model tiers, server gauges
+    """
+
+    def __init__(self, service, registry, host=HOST, port=PORT):
+        self.service = service
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.responses = {}                 # HTTP status -> count
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), KEEPALIVE_TIMEOUT)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                if request is None:
+                    break
+                if "error" in request:
+                    await self._respond(writer, request["status"], {"error": request["error"]}, keep_alive=False)
+                    break
+                status, body, headers = await self._dispatch(request)
+                await self._respond(writer, status, body, headers, request["keep_alive"])
+                if not request["keep_alive"]:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, version = line.decode("latin-1").split()
+        except ValueError:
+            return {"status": 400, "error": "malformed request line"}
+        headers = {}
+        while True:
+            header = await reader.readline()
+            if header in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = header.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length", "0") or 0)
+        except ValueError:
+            return {"status": 400, "error": "bad Content-Length"}
+        if length > MAX_BODY_BYTES:
+            return {"status": 413, "error": f"body over {MAX_BODY_BYTES} bytes"}
+        body = await reader.readexactly(length) if length else b""
+        connection = headers.get("connection", "").lower()
+        keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+        return {"method": method, "path": target.split("?", 1)[0], "body": body, "keep_alive": keep_alive}
+
+    async def _dispatch(self, request):
+        routes = {
+            "/v1/answer": ("POST", self._answer),
+            "/health": ("GET", self._health),
+            "/metrics": ("GET", self._metrics),
+        }
+        route = routes.get(request["path"])
+        if route is None:
+            return 404, {"error": f"no route {request['path']}"}, {}
+        if request["method"] != route[0]:
+            return 405, {"error": f"use {route[0]}"}, {"Allow": route[0]}
+        try:
+            return await route[1](request)
+        except Exception as e:
+            print(f"   ❌ Server error: {e}")
+            return 500, {"error": str(e)}, {}
+
+    async def _answer(self, request):
+        try:
+            payload = json.loads(request["body"] or b"{}")
+            question = str(payload["question"]).strip()
+        except (ValueError, KeyError, TypeError):
+            return 400, {"error": 'expected a JSON body {"question": "..."}'}, {}
+        if not question:
+            return 400, {"error": "empty question"}, {}
+        question_id = str(payload.get("question_id") or f"api-{time.time_ns() % 10**10}")
+        retry = {"Retry-After": str(RETRY_AFTER_SEC)}
+        try:
+            result = await self.service.answer(question, question_id)
+        except Overloaded as e:
+            return 429, {"error": f"server busy: {e}"}, retry
+        except NotReady as e:
+            return 503, {"error": str(e)}, retry
+        except asyncio.TimeoutError:
+            return 504, {"error": f"no answer within {self.service.timeout}s"}, {}
+        # The solver reports model failures inside the answer instead of raising
+        return (502 if "error" in result["answer"] else 200), result, {}
+
+    async def _health(self, request):
+        kb = self.registry.stats()
+        ready = kb["version"] is not None
+        body = {
+            "status": "ok" if ready else "loading",
+            "backend": get_backend().name,
+            "kb": kb,
+            "server": self.service.stats(),
+            "model_tiers": get_model_router().snapshot(),
+        }
+        return (200 if ready else 503), body, {}
+
+    async def _metrics(self, request):
+        stats = self.service.stats()
+        lines = [
+            "# HELP distribiq_server_in_flight Questions being solved right now.",
+            "# TYPE distribiq_server_in_flight gauge",
+            f"distribiq_server_in_flight {stats['in_flight']}",
+            "# HELP distribiq_server_queued Questions waiting for a worker.",
+            "# TYPE distribiq_server_queued gauge",
+            f"distribiq_server_queued {stats['queued']}",
+            "# HELP distribiq_server_admissions_total Answer requests by admission outcome.",
+            "# TYPE distribiq_server_admissions_total counter",
+        ]
+        for outcome in ("accepted", "coalesced", "rejected", "timeouts"):
+            lines.append(f'distribiq_server_admissions_total{{outcome="{outcome}"}} {stats[outcome]}')
+        lines += [
+            "# HELP distribiq_server_responses_total HTTP responses by status code.",
+            "# TYPE distribiq_server_responses_total counter",
+        ]
+        for status, count in sorted(self.responses.items()):
+            lines.append(f'distribiq_server_responses_total{{status="{status}"}} {count}')
+        text = telemetry.prometheus_text() + get_model_router().prometheus_text() + "\n".join(lines) + "\n"
+        return 200, text, {}
+
+    async def _respond(self, writer, status, body, headers=None, keep_alive=True):
+        self.responses[status] = self.responses.get(status, 0) + 1
+        if isinstance(body, str):
+            payload, content_type = body.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            payload = json.dumps(body, ensure_ascii=False, default=str).encode("utf-8")
+            content_type = "application/json"
+        head = [
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(payload)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        head += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + payload)
+        await writer.drain()
+
+
+# --- 4. ENTRY POINT ---
+async def serve(host=HOST, port=PORT, concurrency=MAX_CONCURRENCY, max_queue=MAX_QUEUE, timeout=REQUEST_TIMEOUT,
+                registry=None):
+    registry = registry or get_kb_registry(prepare_knowledge_base, DOCS_FOLDER)
+    service = SolverService(registry, concurrency, max_queue, timeout)
+    server = await DistribIQServer(service, registry, host, port).start()
+    print(f"🌐 DistribIQ API on http://{server.host}:{server.port} "
+          f"(backend: {get_backend().name}, concurrency {concurrency}, queue {max_queue})")
+    # Load the KB in the background: /health answers 503 "loading" meanwhile
+    loading = asyncio.get_running_loop().run_in_executor(None, registry.ensure_loaded)
+    try:
+        await server.serve_forever()
+    finally:
+        loading.cancel()
+        service.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless DistribIQ JSON API")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENCY)
+    parser.add_argument("--queue", type=int, default=MAX_QUEUE)
+    parser.add_argument("--timeout", type=float, default=REQUEST_TIMEOUT)
+    parser.add_argument("--backend", choices=("gemini", "record", "replay", "mock"),
+                        help="Model backend (default: DISTRIBIQ_BACKEND)")
+    args = parser.parse_args()
+    if args.backend:
+        set_backend(make_backend(args.backend))
+    try:
+        asyncio.run(serve(args.host, args.port, args.concurrency, args.queue, args.timeout))
+    except KeyboardInterrupt:
+        print("\n👋 Server stopped.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+import os
+import json
+import time
+import shutil
+import threading
+from collections.abc import Mapping
+
+try:
+    from kb_cache import CACHE_DIR, file_hash
+except ImportError:
+    from src.kb_cache import CACHE_DIR, file_hash
+
+# --- 1. CONFIGURATION ---
+SNAPSHOT_DIR = os.path.join(CACHE_DIR, "snapshots")
+SNAPSHOT_FORMAT = 1             # Bump to invalidate every snapshot (layout change)
+SNAPSHOT_KEEP = 3               # Old snapshots kept per workbook (others are pruned)
+META_FILE = "meta.json"
+
+
+class SnapshotUnavailable(RuntimeError):
+    """Raised when a snapshot cannot be written or read (pyarrow missing, unwritable cache)."""
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise SnapshotUnavailable("pyarrow is not installed (pip install pyarrow)")
+
+
+def _sheet_file(position):
+    # Sheet names can contain characters that are not valid in file names
+    return f"sheet_{position:03d}.parquet"
+
+
+def _stringify_objects(df):
+    # Columns mixing numbers and text cannot be stored as one Arrow type
+    import pandas as pd
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype == object:
+            df[col] = df[col].map(lambda v: v if pd.isna(v) else str(v))
+    return df
+
+
+# --- 2. THE SNAPSHOT ---
+class WorkbookSnapshot:
+    """
+    Columnar (Parquet) copy of an Excel workbook, one file per sheet, stored
+    under SNAPSHOT_DIR/<content hash>. Built once with openpyxl; afterwards
+    sheets are read from Parquet on first access only.
+    """
+
+    def __init__(self, excel_path, snapshot_dir=SNAPSHOT_DIR, content_hash=None):
+        self.excel_path = excel_path
+        self.source_file = os.path.basename(excel_path)
+        self.snapshot_dir = os.path.abspath(snapshot_dir)
+        self.content_hash = content_hash or file_hash(excel_path)
+        self.path = os.path.join(self.snapshot_dir, f"{self.content_hash[:24]}-v{SNAPSHOT_FORMAT}")
+        self._meta = None
+        self._sheets = {}
+        self._lock = threading.Lock()
+
+    # --- Building ---
+    def exists(self):
+        return os.path.exists(os.path.join(self.path, META_FILE))
+
+    def build(self):
+        """
+        Reads the workbook with openpyxl (the slow part) and writes every sheet
+        as Parquet. The snapshot appears atomically, so concurrent builders
+        (parse workers, other processes) never see half a snapshot.
+        """
+        _require_pyarrow()
+        import pandas as pd
+        xls = pd.ExcelFile(self.excel_path)
+        tmp_path = f"{self.path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        os.makedirs(tmp_path, exist_ok=True)
+        try:
+            sheets = []
+            for position, name in enumerate(xls.sheet_names):
+                df = pd.read_excel(xls, sheet_name=name)
+                self._sheets[name] = df
+                target = os.path.join(tmp_path, _sheet_file(position))
+                try:
+                    df.to_parquet(target, index=False)
+                except (TypeError, ValueError):
+                    _stringify_objects(df).to_parquet(target, index=False)
+                sheets.append({"name": name, "file": _sheet_file(position), "rows": len(df)})
+            meta = {
+                "source_file": self.source_file,
+                "hash": self.content_hash,
+                "format": SNAPSHOT_FORMAT,
+                "sheets": sheets,
+                "created_at": time.time(),
+            }
+            with open(os.path.join(tmp_path, META_FILE), "w", encoding="utf-8") as f:
+                json.dump(meta, f, indent=2)
+            try:
+                os.replace(tmp_path, self.path)
+            except OSError:
+                # Another builder won the race: its snapshot has the same content
+                if not self.exists():
+                    raise
+        finally:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        self._meta = meta
+        prune_snapshots(self.source_file, keep=SNAPSHOT_KEEP, snapshot_dir=self.snapshot_dir)
+        return self
+
+    def ensure(self):
+        """
+        Builds the snapshot unless it already exists for this content hash.
+        """
+        if not self.exists():
+            self.build()
+        return self
+
+    # --- Reading ---
+    @property
+    def meta(self):
+        if self._meta is None:
+            with open(os.path.join(self.path, META_FILE), "r", encoding="utf-8") as f:
+                self._meta = json.load(f)
+        return self._meta
+
+    @property
+    def sheet_names(self):
+        return [sheet["name"] for sheet in self.meta["sheets"]]
+
+    def read_sheet(self, name):
+        """
+        One sheet as a DataFrame, read from Parquet the first time it is asked for.
+        """
+        with self._lock:
+            df = self._sheets.get(name)
+            if df is None:
+                entry = next((s for s in self.meta["sheets"] if s["name"] == name), None)
+                if entry is None:
+                    raise KeyError(name)
+                import pandas as pd
+                df = pd.read_parquet(os.path.join(self.path, entry["file"]))
+                self._sheets[name] = df
+            return df
+
+    def sheets(self):
+        return LazySheets(self)
+
+
+class LazySheets(Mapping):
+    """
+    {sheet name: DataFrame} that reads each sheet from the snapshot on first access.
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self._names = snapshot.sheet_names
+
+    def __getitem__(self, name):
+        return self.snapshot.read_sheet(name)
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+
+def prune_snapshots(source_file, keep=SNAPSHOT_KEEP, snapshot_dir=SNAPSHOT_DIR):
+    """
+    Deletes all but the `keep` newest snapshots of one workbook.
+    """
+    found = []
+    try:
+        entries = list(os.scandir(snapshot_dir))
+    except OSError:
+        return
+    for entry in entries:
+        if not entry.is_dir() or ".tmp-" in entry.name:
+            continue
+        try:
+            with open(os.path.join(entry.path, META_FILE), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if meta.get("source_file") == source_file:
+            found.append((meta.get("created_at", 0), entry.path))
+    for _, path in sorted(found, reverse=True)[keep:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+# --- 3. ENTRY POINTS ---
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+_warned = False
+
+def get_snapshot(excel_path, snapshot_dir=SNAPSHOT_DIR, force=False):
+    """
+    Snapshot of the workbook's current content (built on first use), shared
+    per process so sheets already read stay in memory. Keyed by (path, mtime,
+    size) so the file is only re-hashed when it changes. force: rebuild it
+    from the Excel file even if it exists.
+    """
+    stat = os.stat(excel_path)
+    key = (os.path.abspath(excel_path), stat.st_mtime_ns, stat.st_size, os.path.abspath(snapshot_dir))
+    with _snapshots_lock:
+        snapshot = None if force else _snapshots.get(key)
+        if snapshot is None:
+            snapshot = WorkbookSnapshot(excel_path, snapshot_dir)
+            if force:
+                # Sheets come from openpyxl; an existing snapshot of the same content stays on disk
+                snapshot.build()
+            else:
+                snapshot.ensure()
+            for old in [k for k in _snapshots if k[0] == key[0]]:
+                del _snapshots[old]
+            _snapshots[key] = snapshot
+        return snapshot
+
+
+def read_workbook(excel_path, snapshot_dir=SNAPSHOT_DIR, force=False):
+    """
+    {sheet name: DataFrame} for a workbook, loaded lazily from its columnar
+    snapshot (rebuilt first with force=True). Falls back to reading the Excel
+    file directly if no snapshot can be used (pyarrow missing, read-only cache).
+    """
+    global _warned
+    try:
+        return get_snapshot(excel_path, snapshot_dir, force).sheets()
+    except (SnapshotUnavailable, OSError) as e:
+        if not _warned:
+            print(f"   ⚠️ Workbook snapshot unavailable, reading Excel directly: {e}")
+            _warned = True
+        import pandas as pd
+        xls = pd.ExcelFile(excel_path)
+        return {name: pd.read_excel(xls, sheet_name=name) for name in xls.sheet_names}
+
+
+def read_sheet(excel_path, sheet_name, snapshot_dir=SNAPSHOT_DIR):
+    """
+    A single sheet (only that sheet is read from the snapshot).
+    """
+    return read_workbook(excel_path, snapshot_dir)[sheet_name]
@@ -0,0 +1,110 @@
+import ast
+import json
+
+# --- 1. CONFIGURATION ---
+MAX_FRAGMENT_CHARS = 20_000     # Longer {...} fragments in free text are skipped, not parsed
+MAX_TABLE_ROWS = 1_000          # Rows kept per answer
+
+_FENCES = ("```json", "```python", "```")
+
+
+def table_to_rows(table):
+    """
+    Converts the schema's {"columns": [...], "rows": [[...], ...]} table into a
+    list of dicts. Returns [] for anything else.
+    """
+    if not isinstance(table, dict):
+        return []
+    columns = table.get("columns") or []
+    rows = table.get("rows") or []
+    if not columns or not isinstance(rows, list):
+        return []
+    return [
+        dict(zip(columns, row)) for row in rows[:MAX_TABLE_ROWS]
+        if isinstance(row, (list, tuple))
+    ]
+
+
+def _parse_fragment(fragment):
+    try:
+        return json.loads(fragment)
+    except ValueError:
+        pass
+    try:
+        return ast.literal_eval(fragment)      # Python-style dicts ('single quotes', True/None)
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return None
+
+
+def extract_rows_from_text(text):
+    """
+    Single pass over free text collecting top-level {...} objects. Fragments
+    are sliced by index (no per-character buffer), braces inside quoted
+    strings are ignored, and fragments longer than MAX_FRAGMENT_CHARS are
+    dropped unparsed.
+    """
+    for fence in _FENCES:
+        text = text.replace(fence, "")
+    rows = []
+    depth = 0
+    start = -1
+    quote = None
+    escaped = False
+    for i, char in enumerate(text):
+        if quote is not None:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == quote:
+                quote = None
+            continue
+        if char == "{":
+            if depth == 0:
+                start = i
+            depth += 1
+        elif char == "}" and depth > 0:
+            depth -= 1
+            if depth == 0:
+                if i + 1 - start <= MAX_FRAGMENT_CHARS:
+                    obj = _parse_fragment(text[start:i + 1])
+                    if isinstance(obj, dict):
+                        rows.append(obj)
+                        if len(rows) >= MAX_TABLE_ROWS:
+                            break
+                start = -1
+        elif depth > 0 and char in "\"'":
+            quote = char
+        elif depth > 0 and i - start > MAX_FRAGMENT_CHARS:
+            # Runaway fragment (unbalanced braces): give up on it and resync
+            depth = 0
+            start = -1
+    return rows
+
+
+def extract_rows(answer):
+    """
+    Table rows (list of dicts) contained in a final answer, or []. Prefers the
+    typed "table" field, then a list "answer", then objects embedded in text.
+    """
+    if not isinstance(answer, dict):
+        return []
+    rows = table_to_rows(answer.get("table"))
+    if rows:
+        return rows
+    value = answer.get("answer")
+    if isinstance(value, list):
+        return [row for row in value[:MAX_TABLE_ROWS] if isinstance(row, dict)]
+    if isinstance(value, str) and "{" in value:
+        return extract_rows_from_text(value)
+    return []
+
+
+def attach_rows(answer):
+    """
+    Parses the answer's table once and stores it under "rows" so the UI (and
+    the answer cache) never re-parse it.
+    """
+    if isinstance(answer, dict) and "rows" not in answer:
+        answer["rows"] = extract_rows(answer)
+    return answer
@@ -0,0 +1,339 @@
+import os
+import json
+import time
+import threading
+
+try:
+    from backends import usage_to_dict
+    from context_encoder import estimate_tokens
+except ImportError:
+    from src.backends import usage_to_dict
+    from src.context_encoder import estimate_tokens
+
+# --- 1. CONFIGURATION ---
+_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+TELEMETRY_LOG = os.environ.get("DISTRIBIQ_TELEMETRY_LOG", os.path.join(_ROOT, "distribiq_telemetry.jsonl"))
+METRICS_FILE = os.environ.get("DISTRIBIQ_METRICS_FILE", os.path.join(_ROOT, "distribiq_metrics.prom"))
+TELEMETRY_MAX_BYTES = 10 * 1024 * 1024     # Rolled over to <log>.1 past this size
+METRICS_WRITE_INTERVAL = 5.0               # Seconds between rewrites of the Prometheus file
+
+# USD per 1M tokens. Check https://ai.google.dev/pricing before using these for planning.
+MODEL_PRICING = {
+    "gemini-2.5-flash": {"input": 0.30, "cached_input": 0.075, "output": 2.50},
+    "gemini-2.5-flash-lite": {"input": 0.10, "cached_input": 0.025, "output": 0.40},
+    "gemini-2.5-pro": {"input": 1.25, "cached_input": 0.31, "output": 10.00},
+    "gemini-1.5-flash": {"input": 0.075, "cached_input": 0.01875, "output": 0.30},
+}
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60)
+SECTIONS = ("excel", "pdfs", "instructions", "question")
+
+
+def query_cost(model_name, usage):
+    """
+    USD cost of one call from its usage_metadata dict (cached prompt tokens at the cached rate).
+    """
+    prices = MODEL_PRICING.get(model_name)
+    if not prices or not usage:
+        return 0.0
+    cached = usage.get("cached_content_token_count", 0)
+    fresh = max(0, usage.get("prompt_token_count", 0) - cached)
+    return round(
+        (fresh * prices["input"] + cached * prices["cached_input"]
+         + usage.get("candidates_token_count", 0) * prices["output"]) / 1_000_000,
+        8
+    )
+
+
+def section_tokens(prompt_tokens, excel_text, prompt_text, question, has_pdfs, pdf_text=""):
+    """
+    Splits the measured prompt_token_count across prompt sections. The API only
+    reports a total, so text sections are estimated from their size and attached
+    PDFs get the remainder (text estimates are scaled down if they exceed the
+    total). PDF passages sent as text (pdf_text) are estimated like the rest.
+    prompt_text may be the list of prompt parts as sent.
+    Returns {} when the call reported no usage.
+    """
+    if not prompt_tokens:
+        return {}
+    excel = estimate_tokens(excel_text) if excel_text else 0
+    pdf_pages = estimate_tokens(pdf_text) if pdf_text else 0
+    q = estimate_tokens(question)
+    instructions = max(0, estimate_tokens(prompt_text) - excel - pdf_pages - q)
+    text_total = excel + pdf_pages + q + instructions
+    if text_total > prompt_tokens or not has_pdfs:
+        scale = prompt_tokens / text_total if text_total else 0
+        excel, pdf_pages, q = round(excel * scale), round(pdf_pages * scale), round(q * scale)
+        instructions = prompt_tokens - excel - pdf_pages - q
+    attached = max(0, prompt_tokens - excel - pdf_pages - q - instructions)
+    return {"excel": excel, "pdfs": pdf_pages + attached, "instructions": instructions, "question": q}
+
+
+# --- 2. ONE QUERY ---
+class QueryTrace:
+    """
+    Timings and token usage of one solver call. Stages are marked as they
+    happen; to_dict() is what goes into the JSONL log.
+    """
+
+    def __init__(self, question_id, question, model_name, kb_version="", streamed=False):
+        self.start = time.perf_counter()
+        self.record = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "question_id": question_id,
+            "question": question,
+            "model": model_name,
+            "kb_version": kb_version,
+            "streamed": streamed,
+            "route": "model",
+            "prompt_build_sec": 0.0,
+            "ttfb_sec": None,           # Model call start -> first byte
+            "ttft_sec": None,           # Question in -> first byte (what the user waits for)
+            "model_sec": 0.0,
+            "parse_sec": 0.0,
+            "total_sec": 0.0,
+            "usage": {},
+            "sections": {},
+            "cost_usd": 0.0,
+        }
+        self._model_start = None
+        self._first_model_start = None
+        self._prompt = None
+
+    def local_answer(self, route):
+        self.record["route"] = route
+
+    def prompt_built(self, build_started, excel_text, prompt_text, has_pdfs, pdf_text=""):
+        self.record["prompt_build_sec"] = round(time.perf_counter() - build_started, 4)
+        self._prompt = (excel_text, prompt_text, has_pdfs, pdf_text)
+
+    def model_started(self):
+        self._model_start = time.perf_counter()
+        if self._first_model_start is None:
+            self._first_model_start = self._model_start
+
+    def first_byte(self):
+        if self.record["ttfb_sec"] is None and self._first_model_start is not None:
+            now = time.perf_counter()
+            self.record["ttfb_sec"] = round(now - self._first_model_start, 4)
+            self.record["ttft_sec"] = round(now - self.start, 4)
+
+    def routed(self, routed):
+        """
+        Tier the model call ran on (model_router.py); later usage is priced for its model.
+        """
+        self.record["model"] = routed["model"]
+        self.record["tier"] = routed["tier"]
+        self.record["hedged"] = routed["hedged"]
+        if routed["fallbacks"]:
+            self.record["fallbacks"] = list(routed["fallbacks"])
+        self.router_attempts(routed.get("attempts"))
+
+    def router_attempts(self, attempts):
+        """
+        The router's other calls for this query (hedge losers, failed
+        fallbacks): listed, and their usage and cost added to the query's.
+        """
+        for attempt in attempts or ():
+            cost = query_cost(attempt["model"], attempt["usage"])
+            self.record.setdefault("attempts", []).append(dict(attempt, cost_usd=cost))
+            self._add_usage(attempt["usage"], {}, attempt["model"])
+
+    def model_finished(self, usage_metadata, model=None):
+        if self._model_start is not None:
+            self.record["model_sec"] = round(self.record["model_sec"] + time.perf_counter() - self._model_start, 4)
+        usage = usage_to_dict(usage_metadata)
+        sections = {}
+        if self._prompt is not None:
+            excel_text, prompt_text, has_pdfs, pdf_text = self._prompt
+            sections = section_tokens(
+                usage.get("prompt_token_count", 0), excel_text, prompt_text, self.record["question"], has_pdfs, pdf_text
+            )
+        self._add_usage(usage, sections, model)
+
+    # --- Fan-out (agent.py graph: parallel domain branches + merge call) ---
+    def fanned_out(self, domains):
+        self.record["domains"] = list(domains)
+        self.record["branches"] = []
+
+    def branch_finished(self, domain, build_sec, model_sec, usage_metadata, prompt, error=None, routed=None):
+        """
+        One parallel branch: usage and cost add up, stage times are those of
+        the slowest branch. prompt: (excel_text, prompt_text, has_pdfs, pdf_text).
+        """
+        model = routed["model"] if routed else self.record["model"]
+        usage = usage_to_dict(usage_metadata)
+        excel_text, prompt_text, has_pdfs, pdf_text = prompt
+        sections = section_tokens(
+            usage.get("prompt_token_count", 0), excel_text, prompt_text, self.record["question"], has_pdfs, pdf_text
+        )
+        branch = {"domain": domain, "prompt_build_sec": round(build_sec, 4), "model_sec": round(model_sec, 4),
+                  "usage": usage, "cost_usd": query_cost(model, usage)}
+        if routed:
+            branch.update(tier=routed["tier"], model=model, hedged=routed["hedged"])
+            self.router_attempts(routed.get("attempts"))
+        if error is not None:
+            branch["error"] = str(error)
+        self.record.setdefault("branches", []).append(branch)
+        self.record["prompt_build_sec"] = max(self.record["prompt_build_sec"], branch["prompt_build_sec"])
+        self.record["model_sec"] = max(self.record["model_sec"], branch["model_sec"])
+        self._add_usage(usage, sections, model)
+
+    def merge_started(self, prompt_text):
+        self._prompt = ("", prompt_text, False, "")
+        self.model_started()
+
+    def _add_usage(self, usage, sections, model=None):
+        totals = self.record["usage"]
+        for field, count in usage.items():
+            totals[field] = totals.get(field, 0) + count
+        for section, count in sections.items():
+            self.record["sections"][section] = self.record["sections"].get(section, 0) + count
+        # Priced per call: branches and fallbacks can run on different models
+        self.record["cost_usd"] = round(self.record["cost_usd"] + query_cost(model or self.record["model"], usage), 8)
+
+    def parsed(self, parse_started):
+        self.record["parse_sec"] = round(time.perf_counter() - parse_started, 4)
+
+    def failed(self, error):
+        self.record["error"] = str(error)
+        self.router_attempts(getattr(error, "attempts", None))     # model_router.RoutingFailed
+
+    def finish(self):
+        self.record["total_sec"] = round(time.perf_counter() - self.start, 4)
+        return self.record
+
+    def to_dict(self):
+        return dict(self.record)
+
+
+# --- 3. AGGREGATION + EXPORT ---
+class Telemetry:
+    """
+    Appends every finished QueryTrace to a rolling JSONL log and keeps
+    process-wide counters and latency histograms, exported in Prometheus text
+    format (prometheus_text(), also written to METRICS_FILE).
+    """
+
+    def __init__(self, log_path=TELEMETRY_LOG, metrics_path=METRICS_FILE,
+                 max_bytes=TELEMETRY_MAX_BYTES, write_interval=METRICS_WRITE_INTERVAL):
+        self.log_path = log_path
+        self.metrics_path = metrics_path
+        self.max_bytes = max_bytes
+        self.write_interval = write_interval
+        self._lock = threading.Lock()
+        self._last_write = 0.0
+        self.queries = {}                       # route -> count
+        self.errors = 0
+        self.tokens = {"prompt": 0, "candidates": 0, "cached": 0}
+        self.section_tokens = {s: 0 for s in SECTIONS}
+        self.cost_usd = 0.0
+        self.histograms = {
+            name: [0] * (len(LATENCY_BUCKETS) + 1)
+            for name in ("total", "ttft", "ttfb", "model", "prompt_build", "parse")
+        }
+        self.histogram_sums = {name: 0.0 for name in self.histograms}
+
+    def record(self, trace):
+        entry = trace.finish() if isinstance(trace, QueryTrace) else trace
+        with self._lock:
+            self._aggregate(entry)
+            try:
+                self._append(entry)
+            except OSError as e:
+                print(f"   ⚠️ Could not write telemetry log: {e}")
+            if self.metrics_path and time.monotonic() - self._last_write >= self.write_interval:
+                self._write_metrics()
+        return entry
+
+    def _aggregate(self, entry):
+        route = entry.get("route", "model")
+        self.queries[route] = self.queries.get(route, 0) + 1
+        if "error" in entry:
+            self.errors += 1
+        usage = entry.get("usage") or {}
+        self.tokens["prompt"] += usage.get("prompt_token_count", 0)
+        self.tokens["candidates"] += usage.get("candidates_token_count", 0)
+        self.tokens["cached"] += usage.get("cached_content_token_count", 0)
+        for section, count in (entry.get("sections") or {}).items():
+            self.section_tokens[section] = self.section_tokens.get(section, 0) + count
+        self.cost_usd += entry.get("cost_usd", 0.0)
+        for name in self.histograms:
+            value = entry.get(f"{name}_sec")
+            if value is None or (name != "total" and route != "model"):
+                continue
+            index = next((i for i, bound in enumerate(LATENCY_BUCKETS) if value <= bound), len(LATENCY_BUCKETS))
+            self.histograms[name][index] += 1
+            self.histogram_sums[name] += value
+
+    def _append(self, entry):
+        if not self.log_path:
+            return
+        if os.path.exists(self.log_path) and os.path.getsize(self.log_path) >= self.max_bytes:
+            os.replace(self.log_path, self.log_path + ".1")
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+
+    def _write_metrics(self):
+        # Caller holds self._lock
+        tmp_path = self.metrics_path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self._render())
+            os.replace(tmp_path, self.metrics_path)
+            self._last_write = time.monotonic()
+        except OSError as e:
+            print(f"   ⚠️ Could not write metrics file: {e}")
+
+    def flush(self):
+        with self._lock:
+            if self.metrics_path:
+                self._write_metrics()
+
+    def prometheus_text(self):
+        with self._lock:
+            return self._render()
+
+    def _render(self):
+        lines = [
+            "# HELP distribiq_queries_total Answered questions by route.",
+            "# TYPE distribiq_queries_total counter",
+        ]
+        for route, count in sorted(self.queries.items()):
+            lines.append(f'distribiq_queries_total{{route="{route}"}} {count}')
+        lines += [
+            "# HELP distribiq_errors_total Questions that ended in an error.",
+            "# TYPE distribiq_errors_total counter",
+            f"distribiq_errors_total {self.errors}",
+            "# HELP distribiq_tokens_total Tokens reported by usage_metadata.",
+            "# TYPE distribiq_tokens_total counter",
+        ]
+        for kind, count in self.tokens.items():
+            lines.append(f'distribiq_tokens_total{{kind="{kind}"}} {count}')
+        lines += [
+            "# HELP distribiq_prompt_section_tokens_total Prompt tokens attributed to each prompt section.",
+            "# TYPE distribiq_prompt_section_tokens_total counter",
+        ]
+        for section, count in self.section_tokens.items():
+            lines.append(f'distribiq_prompt_section_tokens_total{{section="{section}"}} {count}')
+        lines += [
+            "# HELP distribiq_cost_usd_total Model cost derived from token usage and MODEL_PRICING.",
+            "# TYPE distribiq_cost_usd_total counter",
+            f"distribiq_cost_usd_total {self.cost_usd:.8f}",
+        ]
+        for name, counts in self.histograms.items():
+            metric = f"distribiq_{name}_seconds"
+            lines += [f"# HELP {metric} Latency of the {name.replace('_', ' ')} stage.", f"# TYPE {metric} histogram"]
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'{metric}_bucket{{le="+Inf"}} {cumulative}')
+            lines.append(f"{metric}_sum {self.histogram_sums[name]:.4f}")
+            lines.append(f"{metric}_count {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+# --- 4. SHARED INSTANCE ---
+telemetry = Telemetry()
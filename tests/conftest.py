@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+# Add the parent directory to the path so we can see 'src'
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Offline, and telemetry files and the document cache kept out of the repo (read at import time)
+_TMP = tempfile.mkdtemp(prefix="distribiq-tests-")
+os.environ.setdefault("DISTRIBIQ_BACKEND", "mock")
+os.environ.setdefault("DISTRIBIQ_TELEMETRY_LOG", os.path.join(_TMP, "telemetry.jsonl"))
+os.environ.setdefault("DISTRIBIQ_METRICS_FILE", os.path.join(_TMP, "metrics.prom"))
+os.environ.setdefault("DISTRIBIQ_CACHE_DIR", os.path.join(_TMP, "kb_cache"))
@@ -1,7 +1,11 @@
 import os
 import json
+import math
 import time
-import pandas as pd
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 import sys
 
@@ -9,19 +13,183 @@ import sys
 # Add the parent directory to the path so we can see 'src'
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from src.agent import prepare_knowledge_base, solver_agent
+import src.agent as agent
+from src.agent import prepare_knowledge_base, solver_agent, get_model_router
+from src.prompts import PROMPT_VERSION
+from src.snapshot import read_sheet
 
 # --- SETUP ---
 load_dotenv()
 OUTPUT_FILE = "distribiq_baseline_accuracy.json"
+CHECKPOINT_FILE = "distribiq_baseline_checkpoint.jsonl"   # One JSON result per line, append-only
 
-def run_tests():
+DEFAULT_WORKERS = 4             # Scenarios in flight at once
+DEFAULT_RPM = 10                # Gemini requests per minute (free tier is ~10-15 RPM for Flash)
+MAX_RETRIES = 4                 # Extra attempts on quota / rate-limit errors
+RETRY_BASE_DELAY = 5.0          # Seconds, doubled per attempt (+ jitter)
+
+QUOTA_MARKERS = ("429", "quota", "resource_exhausted", "resourceexhausted", "rate limit", "too many requests")
+
+
+# --- RATE LIMITING ---
+class TokenBucket:
+    """
+    Thread-safe token bucket: allows `rate_per_minute` requests per minute
+    with bursts up to `capacity`.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or max(1, int(rate_per_minute // 6) or 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# --- CHECKPOINTING ---
+class Checkpoint:
+    """
+    Append-only JSONL log of finished scenarios, flushed after every line so
+    an interrupted run loses at most the questions that were in flight.
+    Entries carry the run key (knowledge base, prompt and model versions);
+    entries from another key are ignored, so a changed KB is re-asked.
+    """
+
+    def __init__(self, path, run_key=None):
+        self.path = path
+        self.run_key = run_key or {}
+        self.lock = threading.Lock()
+
+    def load(self):
+        done = {}
+        if not os.path.exists(self.path):
+            return done
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue    # Partial last line from a crash
+                if entry.pop("run_key", None) != self.run_key:
+                    continue    # Answered by another KB / prompt / model
+                done[entry["question_id"]] = entry
+        return done
+
+    def append(self, entry):
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(dict(entry, run_key=self.run_key)) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def reset(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def run_key(kb_version):
+    """
+    What a checkpointed answer depends on besides the question.
+    """
+    if agent.MODEL_ROUTING_ENABLED:
+        model = ",".join(f"{tier}={spec['model']}" for tier, spec in sorted(get_model_router().tiers.items()))
+    else:
+        model = agent.MODEL_NAME
+    return {"kb_version": kb_version, "prompt_version": PROMPT_VERSION, "model": model}
+
+
+# --- STATS ---
+def percentile(values, pct):
+    """
+    Nearest-rank percentile (no numpy needed for 20 values).
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _is_quota_error(final):
+    error = str(final.get("error", "")).lower()
+    return bool(error) and any(marker in error for marker in QUOTA_MARKERS)
+
+
+# --- ONE SCENARIO ---
+def run_scenario(row, index, total, kb_data, bucket):
+    q_id = row.get("Scenario ID", f"Q{index}")
+    q_text = row.get("Question / Request", "Unknown Question")
+    print(f"\n[{index + 1}/{total}] Testing {q_id}: {q_text[:50]}...")
+
+    start_time = time.time()
+    attempts = 0
+    while True:
+        attempts += 1
+        bucket.acquire()
+
+        # --- RUN THE AGENT ---
+        # We manually invoke the solver_agent logic here
+        state = {
+            "question_id": q_id,
+            "question": q_text,
+            "context_files": kb_data["pdf_handles"],
+            "context_text": kb_data["excel_text"],
+            "kb_version": kb_data.get("kb_version", ""),
+            "final_answer": {}
+        }
+
+        try:
+            # Invoke the agent function directly
+            result_state = solver_agent(state)
+            final = result_state["final_answer"]
+        except Exception as e:
+            final = {"answer": "Error", "error": str(e)}
+
+        if not _is_quota_error(final) or attempts > MAX_RETRIES:
+            break
+        delay = RETRY_BASE_DELAY * (2 ** (attempts - 1)) * (1 + random.random() * 0.25)
+        print(f"   ⏳ {q_id}: quota hit, retry {attempts}/{MAX_RETRIES} in {delay:.0f}s")
+        time.sleep(delay)
+
+    duration = round(time.time() - start_time, 2)
+    print(f"   ✅ {q_id} done in {duration}s")
+
+    # 4. Capture Result
+    entry = {
+        "question_id": q_id,
+        "question": q_text,
+        "generated_answer": final.get("answer", "No answer generated"),
+        "confidence": final.get("confidence", 0.0),
+        "citations": final.get("citations", []),
+        "response_time_sec": duration,
+        "attempts": attempts,
+        "status": "PASS" if final.get("confidence", 0) > 0.7 else "REVIEW"
+    }
+    if "error" in final:
+        entry["error"] = final["error"]
+    return entry
+
+
+def run_tests(workers=DEFAULT_WORKERS, rpm=DEFAULT_RPM, resume=True, checkpoint_file=CHECKPOINT_FILE):
     print("🚀 STARTING BASELINE TEST RUN (20 QUESTIONS)...")
-    
+    print(f"   ⚙️ {workers} workers, {rpm} requests/min, resume={'on' if resume else 'off'}")
+
     # 1. Load the Knowledge Base ONCE (Efficiency!)
     print("\n📦 Pre-loading Knowledge Base (PDFs + Excel)...")
     kb_data = prepare_knowledge_base()
-    
+
     if not kb_data["excel_text"] and not kb_data["pdf_handles"]:
         print("❌ CRITICAL: No data found. Stopping test.")
         return
@@ -36,82 +204,88 @@ def run_tests():
     # 2. Go UP one level to project root, then DOWN into data/docs
     project_root = os.path.abspath(os.path.join(test_dir, ".."))
     dataset_path = os.path.join(project_root, "data", "docs", "DM_Report_MASTER_Complete.xlsx")
-    
+
     print(f"📋 Loading questions from: {dataset_path}...")
-    
+
     try:
-        df = pd.read_excel(dataset_path, sheet_name="Decision Scenarios")
+        # Columnar snapshot: only this sheet is read (openpyxl runs once per workbook version)
+        df = read_sheet(dataset_path, "Decision Scenarios")
         # Filter for the first 20 scenarios just in case
         questions = df.head(20).to_dict('records')
     except Exception as e:
         print(f"❌ Error loading questions: {e}")
         return
 
-    results = []
+    # 3. Resume from the checkpoint (errored scenarios are retried)
+    key = run_key(kb_data["kb_version"])
+    checkpoint = Checkpoint(checkpoint_file, key)
+    if not resume:
+        checkpoint.reset()
+    done = {q_id: e for q_id, e in checkpoint.load().items() if "error" not in e}
+    pending = [
+        (i, row) for i, row in enumerate(questions)
+        if row.get("Scenario ID", f"Q{i}") not in done
+    ]
+    if done:
+        print(f"♻️ Resuming: {len(done)} scenarios already in {checkpoint_file}, {len(pending)} to go")
+
+    bucket = TokenBucket(rpm)
+    results = dict(done)
     total_start_time = time.time()
 
-    # 3. The Loop
-    for i, row in enumerate(questions):
-        q_id = row.get("Scenario ID", f"Q{i}")
-        q_text = row.get("Question / Request", "Unknown Question")
-        
-        print(f"\n[{i+1}/20] Testing {q_id}: {q_text[:50]}...")
-        
-        start_time = time.time()
-        
-        # --- RUN THE AGENT ---
-        # We manually invoke the solver_agent logic here
-        state = {
-            "question_id": q_id,
-            "question": q_text,
-            "context_files": kb_data["pdf_handles"],
-            "context_text": kb_data["excel_text"],
-            "final_answer": {}
-        }
-        
-        try:
-            # Invoke the agent function directly
-            result_state = solver_agent(state)
-            final = result_state["final_answer"]
-        except Exception as e:
-            final = {"answer": "Error", "error": str(e)}
-            
-        duration = round(time.time() - start_time, 2)
-        print(f"   ✅ Done in {duration}s")
-        
-        # 4. Capture Result
-        result_entry = {
-            "question_id": q_id,
-            "question": q_text,
-            "generated_answer": final.get("answer", "No answer generated"),
-            "confidence": final.get("confidence", 0.0),
-            "citations": final.get("citations", []),
-            "response_time_sec": duration,
-            "status": "PASS" if final.get("confidence", 0) > 0.7 else "REVIEW"
-        }
-        results.append(result_entry)
+    # 4. The Pool
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [
+            pool.submit(run_scenario, row, i, len(questions), kb_data, bucket)
+            for i, row in pending
+        ]
+        for future in as_completed(futures):
+            entry = future.result()
+            checkpoint.append(entry)
+            results[entry["question_id"]] = entry
+
+    # 5. Generate Report (in scenario order)
+    wall_time = round(time.time() - total_start_time, 2)
+    ordered = [
+        results[row.get("Scenario ID", f"Q{i}")] for i, row in enumerate(questions)
+        if row.get("Scenario ID", f"Q{i}") in results
+    ]
+    latencies = [r["response_time_sec"] for r in ordered]
+    avg_time = round(sum(latencies) / len(latencies), 2) if latencies else 0.0
 
-    # 4. Generate Report
-    total_time = round(time.time() - total_start_time, 2)
-    avg_time = round(total_time / len(results), 2)
-    
     report = {
         "meta": {
-            "total_questions": len(results),
-            "total_time_sec": total_time,
+            "total_questions": len(ordered),
+            "total_time_sec": wall_time,
             "avg_time_per_query": avg_time,
-            "model": "gemini-2.5-flash"
+            "p50_latency_sec": percentile(latencies, 50),
+            "p95_latency_sec": percentile(latencies, 95),
+            "p99_latency_sec": percentile(latencies, 99),
+            "throughput_qpm": round(60 * len(pending) / wall_time, 2) if wall_time else 0.0,
+            "workers": workers,
+            "rate_limit_rpm": rpm,
+            "resumed_from_checkpoint": len(done),
+            "errors": sum(1 for r in ordered if "error" in r),
+            "model": key["model"]
         },
-        "results": results
+        "results": ordered
     }
-    
-    # 5. Save to JSON
+
+    # 6. Save to JSON
     with open(OUTPUT_FILE, "w") as f:
         json.dump(report, f, indent=2)
-        
+
     print(f"\n🎉 TESTS COMPLETED!")
     print(f"📄 Report saved to: {OUTPUT_FILE}")
-    print(f"⏱️  Average Speed: {avg_time}s per query")
+    print(f"⏱️  Average Speed: {avg_time}s per query "
+          f"(p50 {report['meta']['p50_latency_sec']}s, p95 {report['meta']['p95_latency_sec']}s)")
+    print(f"🚚 Throughput: {report['meta']['throughput_qpm']} queries/min over {wall_time}s")
 
 if __name__ == "__main__":
-    run_tests()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the DistribIQ Decision Scenarios baseline.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Concurrent scenarios")
+    parser.add_argument("--rpm", type=float, default=DEFAULT_RPM, help="Max model requests per minute")
+    parser.add_argument("--fresh", action="store_true", help="Ignore and clear the checkpoint")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_FILE, help="Checkpoint JSONL path")
+    args = parser.parse_args()
+    run_tests(workers=args.workers, rpm=args.rpm, resume=not args.fresh, checkpoint_file=args.checkpoint)
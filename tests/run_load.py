@@ -0,0 +1,423 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+# Add the parent directory to the path so we can see 'src'
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Offline by default: a load test must never spend real API quota by accident
+os.environ.setdefault("DISTRIBIQ_BACKEND", "mock")
+
+from src.agent import prepare_knowledge_base, get_graph, DOCS_FOLDER, EXCEL_FILE
+from src.backends import MockBackend, set_backend, make_backend, get_backend, MOCK_LATENCY_MEDIAN, MOCK_LATENCY_SIGMA
+from src.snapshot import read_sheet
+from run_baseline import percentile
+
+# --- SETUP ---
+load_dotenv()
+OUTPUT_FILE = "distribiq_load_report.json"
+
+# Population from COST_ANALYSIS.md: 1,000 employees x 40 queries/day (~1.2M/month)
+USERS = 1000
+QUERIES_PER_USER_DAY = 40
+WORKDAY_HOURS = 8               # Queries are spread over working hours, not 24h
+PEAK_FACTOR = 2.0               # Busy hour vs. the workday average
+
+DEFAULT_DURATION = 60.0         # Seconds of arrivals (the run then drains what is still queued)
+DEFAULT_CONCURRENCY = 8         # Questions one process solves at once (worker threads)
+DEFAULT_VARIANT_SHARE = 0.7     # Share of synthetic variants; the rest repeat Decision Scenarios verbatim
+HTTP_TIMEOUT = 300.0
+MEMORY_SAMPLE_SEC = 0.25
+REGRESSION_TOLERANCE = 0.10     # --compare: relative change that counts as a regression
+
+# Metrics checked by --compare: (path, higher is better)
+WATCHED_METRICS = (
+    ("summary.throughput_qps", True),
+    ("summary.error_rate", False),
+    ("latency_sec.total.p50", False),
+    ("latency_sec.total.p95", False),
+    ("latency_sec.total.p99", False),
+    ("latency_sec.queue_wait.p95", False),
+    ("memory_mb.peak", False),
+    ("memory_mb.per_session", False),
+)
+
+VARIANT_TEMPLATES = (
+    "What is the lead time for {product}?",
+    "What is the best price for {qty} kg of {product} including volume discounts?",
+    "Can we ship {product} to {country}? What documentation is needed?",
+    "Which certifications does {product} have?",
+    "What are the EU usage restrictions for {product}?",
+    "What is the fastest delivery option for {qty} kg {product} to {country}, and what is the total cost?",
+    "Does {product} meet pharma grade requirements with GMP certification?",
+)
+COUNTRIES = ("Germany", "France", "Netherlands", "Belgium", "Italy", "Spain", "Poland", "Austria")
+QUANTITIES = (500, 1000, 1500, 2000, 6000)
+
+
+# --- QUESTIONS ---
+def short_product_name(name):
+    """
+    "Citric Acid Anhydrous BP/USP/FCC" -> "Citric Acid Anhydrous" (how people type it).
+    """
+    words = []
+    for word in str(name).split():
+        if any(c.isdigit() for c in word) or "(" in word or "/" in word or (word.isupper() and len(word) > 1):
+            break
+        words.append(word)
+    return " ".join(words[:3]) or str(name)
+
+
+def load_questions(excel_path):
+    """
+    Returns (scenario questions, product names) from the knowledge-base workbook.
+    """
+    scenarios = read_sheet(excel_path, "Decision Scenarios")["Question / Request"].dropna().astype(str).tolist()
+    products = read_sheet(excel_path, "Product Master Data")["Product Name"].dropna().map(short_product_name)
+    return scenarios, sorted(set(products))
+
+
+def question_mix(scenarios, products, variant_share, rng):
+    """
+    Endless stream of questions: verbatim scenarios (these repeat, as real
+    users do, and exercise the caches) and template variants over products,
+    quantities and countries.
+    """
+    while True:
+        if not products or rng.random() >= variant_share:
+            yield "scenario", rng.choice(scenarios)
+        else:
+            template = rng.choice(VARIANT_TEMPLATES)
+            yield "variant", template.format(product=rng.choice(products), qty=rng.choice(QUANTITIES),
+                                             country=rng.choice(COUNTRIES))
+
+
+def arrival_schedule(rate, duration, questions, rng):
+    """
+    Open-loop arrivals: a Poisson process at `rate` per second, fixed up front
+    so it does not slow down when the system does.
+    """
+    schedule, at = [], 0.0
+    while True:
+        at += rng.expovariate(rate)
+        if at >= duration:
+            return schedule
+        schedule.append((at, *next(questions)))
+
+
+# --- MEMORY ---
+def rss_mb():
+    """
+    Current resident set size of this process (Linux /proc; elsewhere the peak from getrusage).
+    """
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+class MemorySampler:
+    """
+    Samples RSS in the background and keeps the peak.
+    """
+
+    def __init__(self, interval=MEMORY_SAMPLE_SEC):
+        self.interval = interval
+        self.peak = rss_mb() or 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, rss_mb() or 0.0)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_mb() or 0.0)
+
+
+# --- TARGETS ---
+def in_process_solver(kb_data):
+    """
+    Calls the agent graph directly, as app.py does for one chat session.
+    """
+    graph = get_graph()
+
+    def solve(question, question_id):
+        result = graph.invoke({
+            "question_id": question_id,
+            "question": question,
+            "context_files": kb_data["pdf_handles"],
+            "context_text": kb_data["excel_text"],
+            "kb_version": kb_data.get("kb_version", ""),
+            "final_answer": {},
+        })
+        final = result.get("final_answer") or {}
+        return {"route": (result.get("telemetry") or {}).get("route", "model"), "error": final.get("error")}
+
+    return solve
+
+
+def http_solver(url):
+    """
+    POSTs to a running src/server.py instead (its own queueing and coalescing apply).
+    """
+    endpoint = url.rstrip("/") + "/v1/answer"
+
+    def solve(question, question_id):
+        data = json.dumps({"question": question, "question_id": question_id}).encode("utf-8")
+        request = urllib.request.Request(endpoint, data=data, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=HTTP_TIMEOUT) as response:
+                body = json.loads(response.read() or b"{}")
+        except urllib.error.HTTPError as e:
+            return {"route": "http", "error": f"HTTP {e.code}"}
+        return {"route": "coalesced" if body.get("coalesced") else "server",
+                "error": body.get("answer", {}).get("error"), "server_queue_sec": body.get("queue_sec")}
+
+    return solve
+
+
+# --- THE RUN ---
+def run_load(solve, schedule, concurrency):
+    """
+    Submits each question at its scheduled arrival time, whatever is still
+    running. Returns (per-request records, wall time, max outstanding).
+    """
+    records = []
+    lock = threading.Lock()
+    outstanding = {"now": 0, "max": 0}
+
+    def job(index, kind, question, arrival):
+        started = time.perf_counter()
+        try:
+            outcome = solve(question, f"L{index:05d}")
+        except Exception as e:
+            outcome = {"route": "exception", "error": f"{type(e).__name__}: {e}"}
+        finished = time.perf_counter()
+        record = {
+            "kind": kind,
+            "queue_sec": started - arrival,
+            "service_sec": finished - started,
+            "total_sec": finished - arrival,
+            **outcome,
+        }
+        with lock:
+            records.append(record)
+            outstanding["now"] -= 1
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        for index, (at, kind, question) in enumerate(schedule):
+            delay = t0 + at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            with lock:
+                outstanding["now"] += 1
+                outstanding["max"] = max(outstanding["max"], outstanding["now"])
+            pool.submit(job, index, kind, question, t0 + at)
+    return records, time.perf_counter() - t0, outstanding["max"]
+
+
+def _distribution(values):
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0, "max": 0.0}
+    return {
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "p99": round(percentile(values, 99), 3),
+        "mean": round(sum(values) / len(values), 3),
+        "max": round(max(values), 3),
+    }
+
+
+def _counts(values):
+    counts = {}
+    for value in values:
+        counts[value] = counts.get(value, 0) + 1
+    return dict(sorted(counts.items()))
+
+
+def build_report(config, records, wall_sec, max_outstanding, memory):
+    ok = [r for r in records if not r.get("error")]
+    report = {
+        "config": config,
+        "summary": {
+            "requests": len(records),
+            "completed": len(ok),
+            "errors": len(records) - len(ok),
+            "error_rate": round((len(records) - len(ok)) / len(records), 4) if records else 0.0,
+            "offered_qps": round(len(records) / config["duration_sec"], 3),
+            "throughput_qps": round(len(ok) / wall_sec, 3) if wall_sec else 0.0,
+            "wall_sec": round(wall_sec, 2),
+            "max_outstanding": max_outstanding,
+        },
+        "latency_sec": {
+            "total": _distribution([r["total_sec"] for r in records]),
+            "queue_wait": _distribution([r["queue_sec"] for r in records]),
+            "service": _distribution([r["service_sec"] for r in records]),
+        },
+        "memory_mb": memory,
+        "routes": _counts(r["route"] for r in records),
+        "error_types": _counts(str(r["error"]).split(":")[0][:60] for r in records if r.get("error")),
+    }
+    server_queue = [r["server_queue_sec"] for r in records if r.get("server_queue_sec") is not None]
+    if server_queue:
+        report["latency_sec"]["server_queue_wait"] = _distribution(server_queue)
+    return report
+
+
+# --- REGRESSIONS ---
+def _lookup(report, path):
+    value = report
+    for key in path.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def compare_reports(previous, current, tolerance=REGRESSION_TOLERANCE, metrics=WATCHED_METRICS):
+    """
+    Prints watched metrics side by side; returns the ones that got worse by
+    more than `tolerance` (relative). metrics: [(path, higher is better)].
+    """
+    regressions = []
+    print(f"\n📊 {'metric':<28} {'before':>10} {'after':>10} {'change':>8}")
+    for path, higher_is_better in metrics:
+        before, after = _lookup(previous, path), _lookup(current, path)
+        if before is None or after is None:
+            continue
+        change = (after - before) / before if before else (0.0 if after == before else float("inf"))
+        worse = (change < -tolerance) if higher_is_better else (change > tolerance)
+        # Error rates start at 0: any new error is a regression
+        if path == "summary.error_rate" and before == 0:
+            worse = after > 0
+        flag = "  ❌" if worse else ""
+        print(f"   {path:<28} {before:>10} {after:>10} {change:>+8.1%}{flag}")
+        if worse:
+            regressions.append(path)
+    return regressions
+
+
+# --- MAIN ---
+def main():
+    parser = argparse.ArgumentParser(description="Open-loop load test of the DistribIQ solver.")
+    parser.add_argument("--users", type=int, default=USERS, help="Simulated employees")
+    parser.add_argument("--scale", type=float, default=1.0, help="Fraction of the population one process serves")
+    parser.add_argument("--rate", type=float, help="Arrivals per second (overrides --users/--scale)")
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION, help="Seconds of arrivals")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Solver worker threads")
+    parser.add_argument("--variant-share", type=float, default=DEFAULT_VARIANT_SHARE)
+    parser.add_argument("--latency", type=float, default=MOCK_LATENCY_MEDIAN, help="Mock median latency (s)")
+    parser.add_argument("--sigma", type=float, default=MOCK_LATENCY_SIGMA, help="Mock log-normal spread")
+    parser.add_argument("--backend", choices=("mock", "replay", "gemini"), default="mock")
+    parser.add_argument("--url", help="Load a running server.py instead of an in-process solver")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for arrivals, questions and mock latencies")
+    parser.add_argument("--output", default=OUTPUT_FILE, help="Report JSON path")
+    parser.add_argument("--details", action="store_true", help="Also save every request in the report")
+    parser.add_argument("--compare", help="Previous report: print deltas, exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    rate = args.rate or args.users * args.scale * QUERIES_PER_USER_DAY / (WORKDAY_HOURS * 3600) * PEAK_FACTOR
+    scenarios, products = load_questions(os.path.join(DOCS_FOLDER, EXCEL_FILE))
+    schedule = arrival_schedule(rate, args.duration, question_mix(scenarios, products, args.variant_share, rng), rng)
+
+    print("🚀 STARTING LOAD TEST...")
+    print(f"   ⚙️ {rate:.2f} arrivals/s for {args.duration:.0f}s ({len(schedule)} questions), "
+          f"concurrency {args.concurrency}, target {args.url or 'in-process'}")
+
+    memory = {"before_kb": round(rss_mb() or 0.0, 1)}
+    if args.url:
+        solve = http_solver(args.url)
+        concurrency = max(args.concurrency, len(schedule))      # Client side must not queue
+    else:
+        if args.backend == "mock":
+            set_backend(MockBackend(args.latency, args.sigma, seed=args.seed))
+        else:
+            set_backend(make_backend(args.backend))
+        print(f"   🧪 Backend: {get_backend().name}")
+        print("\n📦 Pre-loading Knowledge Base...")
+        solve = in_process_solver(prepare_knowledge_base())
+        concurrency = args.concurrency
+    memory["after_kb"] = round(rss_mb() or 0.0, 1)
+
+    with MemorySampler() as sampler:
+        records, wall_sec, max_outstanding = run_load(solve, schedule, concurrency)
+    memory["peak"] = round(sampler.peak, 1)
+    # Memory held per question in flight on top of the loaded KB
+    sessions = min(max_outstanding, concurrency) or 1
+    memory["per_session"] = round(max(0.0, sampler.peak - memory["after_kb"]) / sessions, 2)
+    if args.url:
+        memory = {key: None for key in memory}      # The server's memory is not ours to measure
+
+    config = {
+        "target": "http" if args.url else "in-process",
+        "backend": "server" if args.url else args.backend,
+        "rate_qps": round(rate, 4),
+        "duration_sec": args.duration,
+        "concurrency": args.concurrency,
+        "variant_share": args.variant_share,
+        "mock_latency_median": args.latency if args.backend == "mock" else None,
+        "mock_latency_sigma": args.sigma if args.backend == "mock" else None,
+        "seed": args.seed,
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+    }
+    report = build_report(config, records, wall_sec, max_outstanding, memory)
+    report["created_at"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    if args.details:
+        report["requests"] = records
+
+    # Sorted keys and fixed rounding keep successive reports diffable
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True, default=str)
+
+    summary, total = report["summary"], report["latency_sec"]["total"]
+    print(f"\n🎉 LOAD TEST COMPLETED!")
+    print(f"📄 Report saved to: {args.output}")
+    print(f"🚚 Throughput: {summary['throughput_qps']} q/s (offered {summary['offered_qps']} q/s), "
+          f"errors {summary['errors']}/{summary['requests']}")
+    print(f"⏱️  Latency p50 {total['p50']}s, p95 {total['p95']}s, p99 {total['p99']}s; "
+          f"queue wait p95 {report['latency_sec']['queue_wait']['p95']}s")
+    if not args.url:
+        print(f"🧠 Memory: {memory['after_kb']} MB after KB load, peak {memory['peak']} MB, "
+              f"~{memory['per_session']} MB per session in flight")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            previous = json.load(f)
+        regressions = compare_reports(previous, report, args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) vs {args.compare}: {', '.join(regressions)}")
+            sys.exit(1)
+        print(f"\n✅ No regressions vs {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
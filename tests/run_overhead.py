@@ -0,0 +1,206 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+from contextlib import redirect_stdout
+from dotenv import load_dotenv
+
+# Add the parent directory to the path so we can see 'src'
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Offline: only the work around the model call is measured
+os.environ.setdefault("DISTRIBIQ_BACKEND", "mock")
+
+import src.agent as agent
+from src.agent import (prepare_knowledge_base, solver_agent, solver_runtime, get_business_context, current_time,
+                       DOCS_FOLDER, EXCEL_FILE)
+from src.backends import MockBackend, set_backend
+from src.prompts import build_suffix
+from run_load import load_questions, compare_reports
+from run_baseline import percentile
+
+# --- SETUP ---
+load_dotenv()
+OUTPUT_FILE = "distribiq_overhead_report.json"
+
+DEFAULT_ITERATIONS = 300        # Solver calls measured (after WARMUP_CALLS)
+WARMUP_CALLS = 10               # Fill the engine, retrieval index and prompt templates first
+STAGE_LOOPS = 200               # Calls per timing of a stage...
+STAGE_REPEATS = 5               # ...repeated, the fastest counts (like timeit)
+IMPORT_RUNS = 3                 # Fresh interpreters per import timing (the fastest counts)
+IMPORT_TARGETS = {"agent": "src.agent", "server": "src.server"}
+HEAVY_MODULES = ("pandas", "numpy", "langgraph", "google.generativeai")
+REGRESSION_TOLERANCE = 0.5      # Sub-millisecond timings are noisy: only large slowdowns count
+
+# Metrics checked by --compare: (path, higher is better). The clock, prefix
+# and suffix stages take a few microseconds: reported, but too noisy to gate on.
+WATCHED_METRICS = (
+    ("imports.agent.sec", False),
+    ("imports.server.sec", False),
+    ("per_call_ms.total.p50", False),
+    ("per_call_ms.total.p95", False),
+    ("per_call_ms.prompt_build.p50", False),
+    ("stages_us.retrieval", False),
+    ("stages_us.pdf_select", False),
+)
+
+
+# --- IMPORT TIME ---
+def measure_import(module):
+    """
+    Seconds to import `module` in a fresh interpreter, and which heavy
+    libraries the import pulled in.
+    """
+    code = (
+        "import sys, time, json; t = time.perf_counter(); import " + module + "; "
+        "print(json.dumps({'sec': time.perf_counter() - t, "
+        f"'heavy_modules': [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))"
+    )
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    runs = []
+    for _ in range(IMPORT_RUNS):
+        out = subprocess.run([sys.executable, "-W", "ignore", "-c", code], cwd=root, capture_output=True,
+                             text=True, check=True)
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    best = min(runs, key=lambda r: r["sec"])
+    return {"sec": round(best["sec"], 3), "heavy_modules": best["heavy_modules"]}
+
+
+# --- PER-CALL OVERHEAD ---
+def _distribution_ms(seconds):
+    values = [s * 1000 for s in seconds]
+    return {
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "mean": round(sum(values) / len(values), 3) if values else 0.0,
+    }
+
+
+def measure_calls(kb_data, questions, iterations, local_answers):
+    """
+    Runs solver_agent against a zero-latency mock model: everything measured
+    is local work (fast path, retrieval, prompt building, parsing, telemetry).
+    """
+    set_backend(MockBackend(latency_median=0.0))
+    agent.FAST_PATH_ENABLED = agent.ANSWER_CACHE_ENABLED = local_answers
+    agent.TELEMETRY_ENABLED = False
+
+    def call(i):
+        state = {
+            "question_id": f"B{i:04d}",
+            "question": questions[i % len(questions)],
+            "context_files": kb_data["pdf_handles"],
+            "context_text": kb_data["excel_text"],
+            "kb_version": kb_data["kb_version"],
+        }
+        started = time.perf_counter()
+        solver_agent(state)
+        return time.perf_counter() - started, state["telemetry"]
+
+    totals, builds, routes = [], [], {}
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        for i in range(WARMUP_CALLS):
+            call(i)
+        for i in range(iterations):
+            total, trace = call(i)
+            totals.append(total)
+            if trace["route"] == "model":
+                builds.append(trace["prompt_build_sec"])
+            routes[trace["route"]] = routes.get(trace["route"], 0) + 1
+    return {"total": _distribution_ms(totals), "prompt_build": _distribution_ms(builds)}, dict(sorted(routes.items()))
+
+
+def _micro(fn, loops=STAGE_LOOPS, repeats=STAGE_REPEATS):
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        best = min(best, time.perf_counter() - started)
+    return round(best / loops * 1e6, 1)
+
+
+def measure_stages(kb_data, question):
+    """
+    Microseconds per call of the local stages in front of the model call.
+    """
+    kb_version, excel_text = kb_data["kb_version"], kb_data["excel_text"]
+    time_context = get_business_context(current_time())
+    rows_text, _ = agent._select_excel_context(question, excel_text)
+    pdf_index = agent._load_pdf_index(kb_version)
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        return {
+            "clock": _micro(lambda: get_business_context(current_time())),
+            "prefix": _micro(lambda: solver_runtime.template(kb_version, excel_text).prefix(True, True)),
+            "suffix": _micro(lambda: build_suffix(question, time_context, retrieved_context=rows_text)),
+            "retrieval": _micro(lambda: agent._select_excel_context(question, excel_text)),
+            "pdf_select": _micro(lambda: pdf_index.select(question)) if pdf_index is not None else None,
+        }
+
+
+# --- MAIN ---
+def main():
+    parser = argparse.ArgumentParser(description="Per-call overhead of the DistribIQ solver outside the model.")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS, help="Solver calls measured")
+    parser.add_argument("--local-answers", action="store_true",
+                        help="Keep the fast path and answer cache on (default: every call builds a prompt)")
+    parser.add_argument("--skip-imports", action="store_true", help="Do not time module imports")
+    parser.add_argument("--output", default=OUTPUT_FILE, help="Report JSON path")
+    parser.add_argument("--compare", help="Previous report: print deltas, exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+    args = parser.parse_args()
+
+    print("🚀 MEASURING SOLVER OVERHEAD...")
+    imports = {}
+    if not args.skip_imports:
+        for name, module in IMPORT_TARGETS.items():
+            imports[name] = measure_import(module)
+            heavy = ", ".join(imports[name]["heavy_modules"]) or "none"
+            print(f"   📦 import {module}: {imports[name]['sec']}s (heavy libraries loaded: {heavy})")
+
+    print("\n📦 Pre-loading Knowledge Base...")
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        kb_data = prepare_knowledge_base()
+    scenarios, _ = load_questions(os.path.join(DOCS_FOLDER, EXCEL_FILE))
+
+    per_call, routes = measure_calls(kb_data, scenarios, args.iterations, args.local_answers)
+    stages = measure_stages(kb_data, scenarios[0])
+
+    report = {
+        "config": {
+            "iterations": args.iterations,
+            "local_answers": args.local_answers,
+            "questions": len(scenarios),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+        },
+        "imports": imports,
+        "per_call_ms": per_call,
+        "stages_us": stages,
+        "routes": routes,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+    print(f"\n🎉 OVERHEAD MEASURED ({args.iterations} calls, routes {routes})")
+    print(f"📄 Report saved to: {args.output}")
+    print(f"⏱️  Per call: p50 {per_call['total']['p50']} ms, p95 {per_call['total']['p95']} ms; "
+          f"prompt build p50 {per_call['prompt_build']['p50']} ms")
+    print("🔬 Stages (µs/call): " + ", ".join(f"{name} {value}" for name, value in stages.items()))
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            previous = json.load(f)
+        regressions = compare_reports(previous, report, args.tolerance, WATCHED_METRICS)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) vs {args.compare}: {', '.join(regressions)}")
+            sys.exit(1)
+        print(f"\n✅ No regressions vs {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
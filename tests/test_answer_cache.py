@@ -0,0 +1,58 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from src.answer_cache import AnswerCache, answer_expiry, normalize_question
+
+
+MORNING = datetime(2026, 3, 10, 9, 30, tzinfo=timezone.utc)
+MIDNIGHT = datetime(2026, 3, 11, 0, 0, tzinfo=timezone.utc)
+
+
+def key(question, kb_version="kb-1"):
+    return AnswerCache.make_key(question, kb_version, "v1", "gemini-2.5-flash")
+
+
+def test_questions_differing_in_case_and_punctuation_share_a_key():
+    assert normalize_question("  What is the MOQ   of Xanthan Gum?? ") == "what is the moq of xanthan gum"
+    assert key("What is the MOQ?") == key("what is the moq")
+    assert key("What is the MOQ?") != key("What is the MOQ?", kb_version="kb-2")
+
+
+@pytest.mark.parametrize("question, expires_at", [
+    ("What is the MOQ of Xanthan Gum?", None),
+    ("When would 500 kg arrive in Berlin?", MIDNIGHT),
+    ("Is the warehouse open right now?", MORNING.replace(hour=18, minute=0)),
+])
+def test_expiry_follows_what_the_answer_depends_on(question, expires_at):
+    assert answer_expiry(question, MORNING) == expires_at
+
+
+def test_expired_answer_is_a_miss():
+    cache = AnswerCache()
+    cache.put(key("When does it arrive?"), {"answer": "Friday"}, expires_at=MIDNIGHT)
+
+    assert cache.get(key("When does it arrive?"), MORNING) == {"answer": "Friday"}
+    assert cache.get(key("When does it arrive?"), MIDNIGHT) is None
+    assert cache.stats()["expirations"] == 1 and cache.stats()["size"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = AnswerCache(max_entries=2)
+    cache.put(key("a"), "A")
+    cache.put(key("b"), "B")
+    cache.get(key("a"), MORNING)
+    cache.put(key("c"), "C")
+
+    assert cache.get(key("b"), MORNING) is None
+    assert (cache.get(key("a"), MORNING), cache.get(key("c"), MORNING)) == ("A", "C")
+    assert cache.stats()["evictions"] == 1
+
+
+def test_callers_cannot_mutate_cached_answers():
+    cache = AnswerCache()
+    cache.put(key("a"), {"citations": ["row 2"]})
+    cache.get(key("a"), MORNING)["citations"].append("row 3")
+
+    assert cache.get(key("a"), MORNING) == {"citations": ["row 2"]}
+    assert cache.stats()["hit_rate"] == 1.0
@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from src.backends import MockBackend, RecordingBackend, ReplayBackend, CassetteMiss, chunk_text, request_key
+
+
+HINT = "v1|What is the MOQ of Xanthan Gum?"
+
+
+def record(tmp_path, stream=False):
+    recorder = RecordingBackend(MockBackend(latency_median=0.0, latency_sigma=0.0), tmp_path)
+    if stream:
+        return "".join(chunk_text(c) for c in recorder.generate_stream("gemini-2.5-flash", ["prompt"], key_hint=HINT))
+    return recorder.generate("gemini-2.5-flash", ["prompt at 10:00"], key_hint=HINT).text
+
+
+def test_replay_returns_the_recorded_response(tmp_path):
+    recorded = record(tmp_path)
+    replay = ReplayBackend(tmp_path, latency="none")
+    # The prompt embeds the time: only model + key_hint identify the request
+    response = replay.generate("gemini-2.5-flash", ["prompt at 11:00"], key_hint=HINT)
+
+    assert response.text == recorded
+    assert response.usage_metadata.total_token_count > 0
+    assert (replay.hits, replay.misses) == (1, 0)
+
+
+def test_streamed_recording_replays_the_same_chunks(tmp_path):
+    recorded = record(tmp_path, stream=True)
+    chunks = list(ReplayBackend(tmp_path, latency="none").generate_stream("gemini-2.5-flash", ["x"], key_hint=HINT))
+
+    assert "".join(c.text for c in chunks) == recorded and len(chunks) > 1
+    assert chunks[-1].usage_metadata is not None and chunks[0].usage_metadata is None
+
+
+def test_unknown_request_misses_or_falls_back(tmp_path):
+    with pytest.raises(CassetteMiss):
+        ReplayBackend(tmp_path).generate("gemini-2.5-flash", ["x"], key_hint="other")
+
+    fallback = ReplayBackend(tmp_path, fallback={"answer": "n/a"})
+    assert json.loads(fallback.generate("gemini-2.5-flash", ["x"], key_hint="other").text) == {"answer": "n/a"}
+
+
+def test_request_key_depends_on_model_and_hint():
+    assert request_key("m", ["a"], HINT) == request_key("m", ["b"], HINT)
+    assert request_key("m", ["a"], HINT) != request_key("other", ["a"], HINT)
+    assert request_key("m", ["a"]) != request_key("m", ["b"])
+
+
+def test_mock_is_reproducible_with_a_seed():
+    first, second = MockBackend(seed=3), MockBackend(seed=3)
+
+    assert [first.sample_latency() for _ in range(3)] == [second.sample_latency() for _ in range(3)]
+    assert first.calls == 3
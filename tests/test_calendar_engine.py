@@ -0,0 +1,74 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.calendar_engine import add_business_days, answer_delivery, delivery_schedule, easter_sunday, holidays_for
+from src.query_engine import StructuredQueryEngine
+
+
+def engine():
+    master = pd.DataFrame({
+        "PharmaCo SKU": ["PC-CA-JBL-001", "PC-XG-CPK-005"],
+        "Product Name": ["Citric Acid Anhydrous", "Xanthan Gum FG"],
+        "Supplier Name": ["Jungbunzlauer", "CP Kelco"],
+        "Lead Time (weeks)": ["1", "2-3"],
+    })
+    logistics = pd.DataFrame({
+        "PharmaCo SKU": ["PC-CA-JBL-001"],
+        "Origin City": ["Basel"], "Origin Country": ["Switzerland"],
+        "Destination City": ["Germany DC"], "Shipping Method": ["Road"], "Transit Time (days)": ["2-3"],
+    })
+    quality = pd.DataFrame({"PharmaCo SKU": ["PC-CA-JBL-001"], "Quality Hold (days)": [1]})
+    return StructuredQueryEngine({"Product Master Data": master, "Logistics Matrix": logistics,
+                                  "Quality Requirements": quality})
+
+
+def days(*isodates):
+    return np.array(isodates, dtype="datetime64[D]")
+
+
+def test_movable_holidays():
+    assert easter_sunday(2026) == date(2026, 4, 5)
+    uk = holidays_for("UK", [2026])
+    assert {"2026-04-03", "2026-04-06", "2026-05-04", "2026-05-25", "2026-08-31"} <= set(uk.astype(str))
+    assert "2026-11-26" in holidays_for("USA", [2026]).astype(str)      # Thanksgiving
+    assert len(holidays_for("Atlantis", [2026])) == 0
+
+
+def test_business_days_skip_each_countrys_holidays():
+    # Thursday before Easter: Good Friday and Easter Monday are off in Germany, not in China
+    result = add_business_days(date(2026, 4, 2), [1, 1], ["Germany", "China"], [2026])
+
+    assert (result == days("2026-04-07", "2026-04-03")).all()
+
+
+def test_start_on_a_weekend_rolls_forward():
+    assert add_business_days(date(2026, 3, 7), [0], ["Germany"], [2026])[0] == np.datetime64("2026-03-09")
+
+
+def test_delivery_schedule_chains_lead_time_hold_and_transit():
+    schedule = delivery_schedule(engine().sheets, date(2026, 3, 2)).set_index("PharmaCo SKU")
+    routed, ex_works = schedule.loc["PC-CA-JBL-001"], schedule.loc["PC-XG-CPK-005"]
+
+    # 1 week = 5 business days in Switzerland, then 1 + 2..3 days in Germany
+    assert (routed["Dispatch Earliest"], routed["Dispatch Latest"]) == (np.datetime64("2026-03-09"),) * 2
+    assert (routed["Arrival Earliest"], routed["Arrival Latest"]) == (
+        np.datetime64("2026-03-12"), np.datetime64("2026-03-13"))
+    assert ex_works["Destination"] == "" and ex_works["Dispatch Latest"] == np.datetime64("2026-03-23")
+
+
+def test_single_product_arrival_is_answered_locally():
+    result = answer_delivery(engine(), "When would Citric Acid arrive?", date(2026, 3, 2))
+
+    assert result["confidence"] == 1.0 and "Logistics Matrix (Row 2)" in result["citations"]
+    assert "Thu 2026-03-12" in result["answer"] and "Fri 2026-03-13" in result["answer"]
+
+
+@pytest.mark.parametrize("question", [
+    "What would Citric Acid cost if it arrives next week?",
+    "When would Citric Acid and Xanthan Gum arrive?",
+])
+def test_other_date_questions_go_to_the_model(question):
+    assert answer_delivery(engine(), question, date(2026, 3, 2)) is None
@@ -0,0 +1,57 @@
+import pandas as pd
+import pytest
+
+from src.context_encoder import encode_workbook, compare_encodings, format_cell, estimate_tokens
+
+
+SUPPLIER = "Jungbunzlauer Suisse AG"
+SHEETS = {
+    "Product Master Data": pd.DataFrame({
+        "PharmaCo SKU": ["PC-CA-JBL-001", "PC-CA-JBL-002", "PC-XG-CPK-005"],
+        "Product Name": ["Citric Acid Anhydrous", "Citric Acid Monohydrate", "Xanthan Gum FG"],
+        "Supplier Name": [SUPPLIER, SUPPLIER, "CP Kelco"],
+        "Grade": ["Pharmaceutical Grade", "Pharmaceutical Grade", "Food Grade"],
+        "MOQ (kg)": [500.0, 250.0, float("nan")],
+        "Notes": ["tab\there", "line\nbreak", ""],
+    }),
+}
+
+
+def decode(text):
+    """Reads the compact encoding back into {sheet: [row cells]}."""
+    codes, sheets, sheet, section = {}, {}, None, None
+    for line in text.splitlines():
+        if line.startswith("### DICTIONARY"):
+            section = "legend"
+        elif line.startswith("### SHEET: "):
+            sheet, section = line[len("### SHEET: "):].split(" (")[0], "header"
+            sheets[sheet] = []
+        elif section == "legend" and line:
+            code, value = line.split("\t", 1)
+            codes[code] = value
+        elif section == "header":
+            section = "rows"
+        elif section == "rows" and line:
+            sheets[sheet].append([codes.get(cell, cell) for cell in line.split("\t")])
+    return sheets
+
+
+def test_compact_encoding_round_trips():
+    text = encode_workbook(SHEETS, "book.xlsx", "compact")
+    expected = [[format_cell(v) for v in row] for row in SHEETS["Product Master Data"].itertuples(index=False)]
+
+    assert decode(text) == {"Product Master Data": expected}
+    assert text.count(SUPPLIER) == 1                       # Once, in the legend
+    assert "PC-CA-JBL-001" in text and "500\t" in text     # SKUs verbatim, no trailing .0
+
+
+def test_compact_is_smaller_than_markdown():
+    report = compare_encodings(SHEETS, "book.xlsx")
+
+    assert report["compact"] < report["markdown"] and report["reduction_pct"] > 0
+    assert report["compact"] == estimate_tokens(encode_workbook(SHEETS, "book.xlsx", "compact"))
+
+
+def test_unknown_encoding_is_rejected():
+    with pytest.raises(ValueError):
+        encode_workbook(SHEETS, "book.xlsx", "yaml")
@@ -0,0 +1,72 @@
+from datetime import datetime, timezone
+
+import src.agent as agent
+from src.answer_cache import AnswerCache
+from src.conversation import Conversation
+from test_query_engine import make_engine
+
+
+NOW = datetime(2026, 3, 10, 10, 0, tzinfo=timezone.utc)
+
+
+def session(question, answer):
+    conversation = Conversation()
+    conversation.add_turn(question, {"answer": answer})
+    return conversation
+
+
+def solver_state(question, conversation):
+    return {"question": question, "kb_version": "kb-1", "context_text": "",
+            "conversation": conversation.context() if conversation else ""}
+
+
+def test_sessions_with_different_context_do_not_share_cached_answers():
+    cache = AnswerCache()
+    first = session("Price of SKU-1001 from Germany?", "EUR 4.10/kg")
+    second = session("Price of SKU-2002 from India?", "USD 1.80/kg")
+    key_first = agent._answer_cache_key(solver_state("Why?", first), "gemini-2.5-flash")
+    key_second = agent._answer_cache_key(solver_state("Why?", second), "gemini-2.5-flash")
+
+    cache.put(key_first, {"answer": "Because of the German surcharge"})
+
+    assert key_first != key_second
+    assert cache.get(key_second, NOW) is None
+    assert cache.get(key_first, NOW) == {"answer": "Because of the German surcharge"}
+
+
+def test_same_context_and_standalone_questions_still_hit():
+    conversation = session("Price of SKU-1001 from Germany?", "EUR 4.10/kg")
+
+    assert (agent._answer_cache_key(solver_state("Why?", conversation), "m")
+            == agent._answer_cache_key(solver_state("why", conversation), "m"))
+    assert (agent._answer_cache_key(solver_state("Why?", None), "m")
+            == AnswerCache.make_key("Why?", "kb-1", agent.PROMPT_VERSION, "m"))
+
+
+def test_follow_up_carries_the_product_and_keeps_its_own_supplier():
+    engine = make_engine()
+    conversation = Conversation()
+    conversation.add_turn("What is the lead time for Citric Acid?", {"answer": "2-3 weeks."}, engine)
+
+    assert conversation.resolve("And from DSM?", engine) == (
+        "And from DSM? (about: Citric Acid Anhydrous BP/USP/FCC)")
+    assert conversation.resolve("What is the MOQ of Xanthan Gum?", engine) == "What is the MOQ of Xanthan Gum?"
+
+
+def test_follow_up_without_a_subject_takes_it_from_the_answer():
+    engine = make_engine()
+    conversation = Conversation()
+    conversation.add_turn("Which product ships fastest?", {"answer": "Xanthan Gum FG from CP Kelco."}, engine)
+
+    assert conversation.resolve("Is it halal?", engine) == "Is it halal? (about: Xanthan Gum FG, CP Kelco)"
+
+
+def test_long_session_stays_within_the_budget():
+    conversation = Conversation(token_budget=200)
+    for i in range(50):
+        conversation.add_turn(f"Question {i} about SKU PC-CA-JBL-001 shipping to Germany?", {"answer": "x" * 400})
+
+    stats = conversation.stats()
+    assert stats["turns"] == 50 and stats["context_tokens"] <= 200
+    assert conversation.turns[-1]["question"].startswith("Question 49")
+    assert "Germany" in conversation.context() and "PC-CA-JBL-001" in conversation.context()
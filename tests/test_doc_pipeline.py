@@ -0,0 +1,92 @@
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+from src.doc_pipeline import DocumentPipeline, IngestProgress, STATUS_ERROR
+
+
+@pytest.fixture
+def docs(tmp_path):
+    folder = tmp_path / "docs"
+    folder.mkdir()
+    pd.DataFrame({"PharmaCo SKU": ["PC-CA-JBL-001"], "Lead Time (weeks)": ["2-3"]}).to_excel(
+        folder / "book.xlsx", sheet_name="Product Master Data", index=False)
+    return folder
+
+
+def pipeline(docs, tmp_path):
+    return DocumentPipeline(str(docs), cache_dir=str(tmp_path / "cache"), workers=1, progress=IngestProgress())
+
+
+def test_second_sync_parses_nothing(docs, tmp_path):
+    first = pipeline(docs, tmp_path).sync()
+    second = pipeline(docs, tmp_path).sync()
+
+    assert first["added"] == ["book.xlsx"]
+    assert second["unchanged"] == ["book.xlsx"] and not second["added"] + second["changed"]
+    assert "PC-CA-JBL-001" in pipeline(docs, tmp_path).load_artifact("book.xlsx")["text"]
+
+
+def test_changed_and_removed_files(docs, tmp_path):
+    pipeline(docs, tmp_path).sync()
+    pd.DataFrame({"PharmaCo SKU": ["PC-AA-DSM-003"]}).to_excel(docs / "book.xlsx", index=False)
+    shutil.copy(docs / "book.xlsx", docs / "other.xlsx")
+    changed = pipeline(docs, tmp_path).sync()
+    os.remove(docs / "other.xlsx")
+    removed = pipeline(docs, tmp_path).sync()
+
+    assert changed["changed"] == ["book.xlsx"] and changed["added"] == ["other.xlsx"]
+    assert removed["removed"] == ["other.xlsx"]
+    assert "PC-AA-DSM-003" in pipeline(docs, tmp_path).load_artifact("book.xlsx")["text"]
+
+
+def recording_parses(pipeline):
+    parsed, parse = [], pipeline._parse
+    pipeline._parse = lambda jobs, force=False: (parsed.extend(rel for rel, _, _ in jobs), parse(jobs, force))[1]
+    return parsed
+
+
+def test_renamed_file_reuses_its_artifact(docs, tmp_path):
+    pipeline(docs, tmp_path).sync()
+    os.rename(docs / "book.xlsx", docs / "renamed.xlsx")
+    renamed = pipeline(docs, tmp_path)
+    parsed = recording_parses(renamed)
+    summary = renamed.sync()
+
+    assert parsed == []
+    assert summary["added"] == ["renamed.xlsx"] and summary["removed"] == ["book.xlsx"]
+    assert renamed.load_artifact("renamed.xlsx") is not None
+
+
+def test_force_parses_everything_again(docs, tmp_path):
+    pipeline(docs, tmp_path).sync()
+    forced = pipeline(docs, tmp_path)
+    parsed = recording_parses(forced)
+    summary = forced.sync(force=True)
+
+    assert parsed == ["book.xlsx"]
+    assert summary["changed"] == ["book.xlsx"]
+    assert forced.load_artifact("book.xlsx") is not None
+
+
+def test_unreadable_file_is_recorded_not_raised(docs, tmp_path):
+    (docs / "broken.pdf").write_bytes(b"not a pdf")
+    summary = pipeline(docs, tmp_path).sync()
+
+    assert summary["failed"] == ["broken.pdf"]
+    assert pipeline(docs, tmp_path).manifest["broken.pdf"]["status"] == STATUS_ERROR
+
+
+def test_pdfs_known_to_be_attached_are_listed_before_sync(docs, tmp_path):
+    (docs / "broken.pdf").write_bytes(b"not a pdf")
+    assert pipeline(docs, tmp_path).pdfs_to_attach() == {}
+    assert list(pipeline(docs, tmp_path).pdfs_to_attach(all_pdfs=True)) == ["broken.pdf"]
+
+    pipeline(docs, tmp_path).sync()
+    synced = pipeline(docs, tmp_path)
+
+    assert synced.pdfs_to_attach() == {"broken.pdf": synced.manifest["broken.pdf"]["hash"]}
+    (docs / "broken.pdf").write_bytes(b"still not a pdf")
+    assert synced.pdfs_to_attach() == {}
@@ -0,0 +1,40 @@
+from src.domains import classify_question, concat_answers, should_fan_out
+
+
+def partial(domain, **answer):
+    return {"domain": domain, "answer": answer}
+
+
+def test_questions_are_routed_by_keyword():
+    assert classify_question("What is the MOQ of Xanthan Gum?") == ["product"]
+    assert classify_question("Price of 500 kg of Citric Acid shipped to France, and is it REACH compliant?") == [
+        "product", "logistics", "compliance"]
+    assert classify_question("Hello") == []
+
+
+def test_only_multi_domain_questions_fan_out():
+    assert not should_fan_out(["product"])
+    assert should_fan_out(["product", "logistics"])
+
+
+def test_branch_answers_are_concatenated():
+    table = {"columns": ["SKU", "Value"], "rows": [["PC-1", "€2.00/kg"]]}
+    merged = concat_answers([
+        partial("product", answer="€2.00/kg", table=table, citations=["Pricing Tiers"], confidence=0.9),
+        partial("logistics", answer="5 days by road", citations=["Pricing Tiers", "Logistics Matrix"],
+                table={"columns": ["SKU", "Value"], "rows": [["PC-1", "5 days"]]}, confidence=0.7),
+    ], timestamp="2026-03-10 10:00")
+
+    assert merged["answer"] == "Product, quality & pricing: €2.00/kg\nLogistics & shipping: 5 days by road"
+    assert merged["table"]["rows"] == [["PC-1", "€2.00/kg"], ["PC-1", "5 days"]]
+    assert merged["citations"] == ["Pricing Tiers", "Logistics Matrix"]
+    assert merged["confidence"] == 0.7
+    assert table["rows"] == [["PC-1", "€2.00/kg"]]          # Branch answers are not modified
+
+
+def test_failed_branch_is_reported_not_hidden():
+    merged = concat_answers([partial("product", answer="€2.00/kg", confidence=1), partial("compliance", error="timeout")])
+
+    assert merged["answer"] == "€2.00/kg"
+    assert "Not answered (compliance)" in merged["explanation"]
+    assert concat_answers([partial("compliance", error="timeout")]) == {"error": "compliance: timeout"}
@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+from src.json_stream import StreamingJSONObject
+
+
+RESPONSE = {
+    "answer": 'Lead time is 2-3 weeks \u2014 "confirmed"\n\tvia C:\\docs / \U0001F600',
+    "confidence": 0.9,
+    "citations": [{"source": "Pricing Tiers", "note": "row [3] {x}"}],
+    "details": None,
+}
+
+
+def chunks(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("ensure_ascii", [True, False])
+@pytest.mark.parametrize("size", range(1, 8))
+def test_any_chunking_decodes_like_json_loads(size, ensure_ascii):
+    text = json.dumps(RESPONSE, ensure_ascii=ensure_ascii)
+    parser = StreamingJSONObject()
+    for chunk in chunks(text, size):
+        parser.feed(chunk)
+
+    assert parser.done
+    assert parser.fields == json.loads(text)
+    assert parser.partial == {}
+
+
+def test_partial_answer_grows_before_the_rest_arrives():
+    parser = StreamingJSONObject()
+    seen = []
+    for chunk in chunks('{"answer": "Ships in \\uD83D\\uDE00 two weeks", "confidence": 1}', 5):
+        if "answer" in parser.feed(chunk) and "answer" in parser.partial:
+            seen.append(parser.partial["answer"])
+
+    assert seen == sorted(seen, key=len) and len(seen) > 3
+    assert all(text == "Ships in \U0001F600 two weeks"[:len(text)] for text in seen)
+    assert parser.value("answer") == "Ships in \U0001F600 two weeks"
+    assert parser.value("confidence") == 1
+
+
+def test_lone_surrogate_is_kept_like_json_loads():
+    text = '{"answer": "a\\ud83d b"}'
+    parser = StreamingJSONObject()
+    parser.feed(text)
+
+    assert parser.fields == json.loads(text)
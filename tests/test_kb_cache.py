@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from src.kb_cache import KnowledgeBaseCache, file_hash
+
+
+NOW = datetime(2026, 3, 10, 10, 0, tzinfo=timezone.utc)
+
+
+def upload(name, expires_in):
+    return SimpleNamespace(name=name, expiration_time=NOW + expires_in)
+
+
+def test_file_hash_follows_content_not_name(tmp_path):
+    (tmp_path / "a.pdf").write_bytes(b"same")
+    (tmp_path / "b.pdf").write_bytes(b"same")
+    (tmp_path / "c.pdf").write_bytes(b"other")
+
+    assert file_hash(tmp_path / "a.pdf") == file_hash(tmp_path / "b.pdf") != file_hash(tmp_path / "c.pdf")
+
+
+def test_handle_survives_a_restart(tmp_path):
+    cache = KnowledgeBaseCache(tmp_path)
+    cache.put_pdf_handle("coa.pdf", "h1", upload("files/abc", timedelta(hours=48)))
+    cache.save()
+
+    assert KnowledgeBaseCache(tmp_path).get_pdf_remote_name("coa.pdf", "h1", NOW) == "files/abc"
+
+
+def test_changed_content_or_expiring_handle_is_not_reused(tmp_path):
+    cache = KnowledgeBaseCache(tmp_path)
+    cache.put_pdf_handle("coa.pdf", "h1", upload("files/abc", timedelta(minutes=20)))
+
+    assert cache.get_pdf_remote_name("coa.pdf", "h2", NOW) is None
+    assert cache.get_pdf_remote_name("coa.pdf", "h1", NOW) is None     # Inside the expiry margin
+
+
+def test_corrupt_manifest_starts_empty(tmp_path):
+    (tmp_path / "manifest.json").write_text("{not json")
+
+    assert KnowledgeBaseCache(tmp_path).manifest == {"pdfs": {}}
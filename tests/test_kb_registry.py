@@ -0,0 +1,68 @@
+import time
+import threading
+
+import src.kb_registry as kb_registry
+from src.kb_registry import KnowledgeBaseRegistry
+
+
+class Loader:
+    """Returns a new knowledge-base version per call; raises while `broken`."""
+
+    def __init__(self):
+        self.calls = 0
+        self.broken = False
+
+    def __call__(self):
+        self.calls += 1
+        if self.broken:
+            raise OSError("workbook is locked")
+        return {"kb_version": f"kb-{self.calls}", "excel_text": "rows", "pdf_handles": []}
+
+
+def test_in_flight_question_keeps_its_version(tmp_path):
+    registry = KnowledgeBaseRegistry(Loader(), tmp_path)
+    registry.ensure_loaded()
+
+    with registry.acquire() as old:
+        registry.reload(wait=True)
+        assert old.data["kb_version"] == "kb-1"          # Still readable while borrowed
+        assert registry.current().version == "kb-2"
+    assert old.data is None and old.refs == 0            # Released once the question ends
+
+
+def test_concurrent_first_loads_build_once(tmp_path):
+    loader = Loader()
+    slow_loader = lambda: (time.sleep(0.1), loader())[1]
+    registry = KnowledgeBaseRegistry(slow_loader, tmp_path)
+    threads = [threading.Thread(target=registry.ensure_loaded) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert loader.calls == 1
+
+
+def test_failed_rebuild_keeps_the_current_version(tmp_path):
+    loader = Loader()
+    registry = KnowledgeBaseRegistry(loader, tmp_path)
+    registry.ensure_loaded()
+    loader.broken = True
+    registry.reload(wait=True)
+
+    assert registry.current().version == "kb-1"
+    assert registry.stats()["failed_builds"] == 1 and "locked" in registry.stats()["last_error"]
+
+
+def test_watcher_reloads_after_a_file_change(tmp_path, monkeypatch):
+    monkeypatch.setattr(kb_registry, "WATCH_SETTLE_POLLS", 1)
+    registry = KnowledgeBaseRegistry(Loader(), tmp_path, watch_interval=0.05)
+    registry.ensure_loaded()
+    registry.start_watcher()
+    (tmp_path / "new.pdf").write_bytes(b"%PDF")
+    deadline = time.time() + 5
+    while registry.current().version == "kb-1" and time.time() < deadline:
+        time.sleep(0.05)
+    registry.stop_watcher()
+
+    assert registry.current().version == "kb-2"
@@ -0,0 +1,91 @@
+import time
+
+import pytest
+
+from src.backends import MockBackend, set_backend
+from src.model_router import ModelRouter, RoutingFailed
+
+
+TIERS = {
+    "fast": {"model": "gemini-2.5-flash-lite", "timeout": 0.5, "fallback": "standard"},
+    "standard": {"model": "gemini-2.5-flash", "timeout": 0.5, "fallback": "fast"},
+    "strong": {"model": "gemini-2.5-pro", "timeout": 0.5, "fallback": "standard"},
+}
+
+
+def call_args(model_name):
+    return {"model_name": model_name, "contents": ["question"], "key_hint": "test|question"}
+
+
+def make_router(hedging=False, **backend_options):
+    backend = MockBackend(latency_median=0.0, latency_sigma=0.0, seed=7, **backend_options)
+    set_backend(backend)
+    return ModelRouter(tiers=TIERS, hedging=hedging), backend
+
+
+def test_answers_on_the_requested_tier():
+    router, backend = make_router()
+    response, routed = router.generate("fast", call_args)
+
+    assert routed == {"tier": "fast", "model": "gemini-2.5-flash-lite", "hedged": False, "fallbacks": [],
+                      "attempts": []}
+    assert "[mock]" in response.text
+    assert backend.calls_by_model == {"gemini-2.5-flash-lite": 1}
+
+
+def test_error_falls_back_to_the_next_tier():
+    router, backend = make_router(error_rate={"gemini-2.5-flash-lite": 1.0})
+    _, routed = router.generate("fast", call_args)
+
+    assert (routed["tier"], routed["fallbacks"]) == ("standard", ["fast"])
+    assert [(a["tier"], a["outcome"]) for a in routed["attempts"]] == [("fast", "error")]
+    assert backend.calls_by_model == {"gemini-2.5-flash-lite": 1, "gemini-2.5-flash": 1}
+    assert router.snapshot()["fast"]["fallbacks"] == 1
+
+
+def test_timeout_falls_back_to_the_next_tier():
+    router, _ = make_router(model_latency={"gemini-2.5-pro": 2.0})
+    started = time.perf_counter()
+    _, routed = router.generate("strong", call_args)
+
+    assert (routed["tier"], routed["fallbacks"]) == ("standard", ["strong"])
+    assert time.perf_counter() - started < 1.5
+    assert router.snapshot()["strong"]["timeouts"] == 1
+
+
+def test_every_tier_failing_raises_with_the_attempts():
+    router, _ = make_router(error_rate=1.0)
+    with pytest.raises(RoutingFailed) as failure:
+        router.generate("fast", call_args)
+
+    assert [a["tier"] for a in failure.value.attempts] == ["fast", "standard"]
+
+
+def test_slow_call_gets_a_hedge_and_both_are_priced():
+    # No latency history yet: the hedge goes out after half the 0.5s budget
+    router, backend = make_router(hedging=True, model_latency={"gemini-2.5-flash": 0.35})
+    _, routed = router.generate("standard", call_args)
+
+    assert routed["hedged"] is True
+    assert len(routed["attempts"]) == 1
+    assert backend.calls_by_model == {"gemini-2.5-flash": 2}
+    time.sleep(0.4)     # The losing call returns in the background
+    stats = router.snapshot()["standard"]
+    assert stats["hedges"] == 1
+    assert stats["cost_usd"] > 0 and stats["samples"] == 2
+
+
+def test_branch_tier_is_capped():
+    router, _ = make_router()
+
+    assert [router.cap_tier(tier, "standard") for tier in TIERS] == ["fast", "standard", "standard"]
+
+
+def test_stalled_stream_times_out():
+    router, _ = make_router(model_latency={"gemini-2.5-flash-lite": 2.0})
+    started = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        list(router.stream("fast", call_args("gemini-2.5-flash-lite")))
+
+    assert time.perf_counter() - started < 1.0
+    assert router.snapshot()["fast"]["timeouts"] == 1
@@ -0,0 +1,46 @@
+from src.pdf_index import PageIndex, PdfTextUnavailable, split_passages
+
+
+PAGES = {
+    "/docs/rates.pdf": [
+        "Freight Handbook\n1. Road Transport Rates (Intra-EU)\nGermany\n1.20\nFrance\n1.35\n",
+        "2. Sea Freight\nContainer rates to Singapore are quoted per TEU.\nContinued on the next page",
+        "Sea freight surcharges apply in peak season.",
+    ],
+    "/docs/scan.pdf": ["", "  "],
+}
+
+
+def page_source(path):
+    if path not in PAGES:
+        raise PdfTextUnavailable(f"Could not read {path}")
+    return PAGES[path]
+
+
+def test_passages_follow_numbered_sections_across_pages():
+    passages = split_passages("rates.pdf", PAGES["/docs/rates.pdf"])
+
+    assert [(p["page"], p["section"]) for p in passages] == [
+        (1, ""), (1, "1. Road Transport Rates (Intra-EU)"), (2, "2. Sea Freight"), (3, "2. Sea Freight")]
+    assert "Germany | 1.20 | France | 1.35" in passages[1]["text"]      # Table cells on one line
+
+
+def test_files_without_text_are_left_for_attachment():
+    index = PageIndex(["/docs/rates.pdf", "/docs/scan.pdf", "/docs/locked.pdf"], page_source=page_source)
+
+    assert index.unindexed == ["/docs/scan.pdf", "/docs/locked.pdf"]
+    assert index.errors["scan.pdf"] == "no extractable text"
+
+
+def test_selected_passages_carry_page_citations():
+    index = PageIndex(["/docs/rates.pdf"], page_source=page_source)
+    text, citations = index.select("What are the sea freight rates to Singapore?")
+
+    assert citations[0] == "rates.pdf, p. 2 (2. Sea Freight)"
+    assert "per TEU" in text and "Germany" not in text
+
+
+def test_unrelated_question_selects_nothing():
+    index = PageIndex(["/docs/rates.pdf"], page_source=page_source)
+
+    assert index.select("Is Xanthan Gum halal certified?") == ("", [])
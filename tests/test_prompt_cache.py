@@ -0,0 +1,97 @@
+import json
+from datetime import timedelta
+
+import pytest
+
+import src.agent as agent
+import src.prompt_cache as prompt_cache
+from src.prompt_cache import LocalPrefixCache
+
+
+PREFIX = "ROLE + WORKBOOK " * 50
+
+
+def test_same_prefix_is_reused():
+    cache = LocalPrefixCache()
+    first = cache.get_model("gemini-2.5-flash", PREFIX, [], "kb-1")
+    second = cache.get_model("gemini-2.5-flash", PREFIX, [], "kb-1")
+
+    assert first is second
+    assert cache.stats() == {"backend": "local", "hits": 1, "misses": 1, "skipped": 0, "entries": 1}
+
+
+def test_model_or_kb_version_change_misses():
+    cache = LocalPrefixCache()
+    cache.get_model("gemini-2.5-flash", PREFIX, [], "kb-1")
+    cache.get_model("gemini-2.5-flash", PREFIX, [], "kb-2")
+    cache.get_model("gemini-2.5-flash-lite", PREFIX, [], "kb-1")
+
+    assert (cache.hits, cache.misses) == (0, 3)
+
+
+def test_oldest_prefix_is_evicted():
+    cache = LocalPrefixCache(max_entries=2)
+    for kb_version in ("kb-1", "kb-2", "kb-3"):
+        cache.get_model("gemini-2.5-flash", PREFIX, [], kb_version)
+    cache.get_model("gemini-2.5-flash", PREFIX, [], "kb-1")
+
+    assert cache.stats()["entries"] == 2
+    assert (cache.hits, cache.misses) == (0, 4)
+
+
+def test_cached_model_counts_uses():
+    cache = LocalPrefixCache()
+    model = cache.get_model("gemini-2.5-flash", PREFIX, [], "kb-1")
+    model.generate_content(["question 1"])
+    answer = json.loads(model.generate_content(["question 2"]).text)
+
+    assert "(use #2)" in answer["explanation"]
+
+
+def test_bound_model_sends_only_the_suffix(monkeypatch):
+    monkeypatch.setattr(agent, "PROMPT_CACHE_BACKEND", "local")
+    cache = agent.get_prompt_cache("local")
+    hits = cache.hits
+
+    for question in ("stock of item A?", "stock of item B?"):
+        bound_model, parts = agent._bind_model(PREFIX, question, [], "kb-bind")
+        assert bound_model is not None
+        assert parts == [question]
+
+    assert cache.hits == hits + 1
+
+
+class RefusingGenai:
+    """Stands in for google.generativeai: every cache create call is refused."""
+
+    def __init__(self):
+        self.creates = 0
+        self.caching = self
+        self.CachedContent = self
+
+    def create(self, **kwargs):
+        self.creates += 1
+        raise RuntimeError("cached content too small")
+
+
+def refused_twice(monkeypatch, retry_after):
+    genai = RefusingGenai()
+    monkeypatch.setattr(prompt_cache, "gemini_sdk", lambda: genai)
+    cache = prompt_cache.GeminiPrefixCache(retry_after=retry_after)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            cache.get_model("gemini-2.5-flash", PREFIX * 10, [], "kb-1")
+    return genai, cache
+
+
+def test_refused_prefix_is_not_retried_right_away(monkeypatch):
+    genai, _ = refused_twice(monkeypatch, timedelta(minutes=10))
+
+    assert genai.creates == 1
+
+
+def test_refused_prefix_is_retried_after_the_backoff(monkeypatch):
+    genai, cache = refused_twice(monkeypatch, timedelta(0))
+
+    assert genai.creates == 2
+    assert len(cache._failed) == 1
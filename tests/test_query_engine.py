@@ -0,0 +1,80 @@
+import pandas as pd
+import pytest
+
+from src.query_engine import StructuredQueryEngine
+
+
+def make_engine(lead_times=("2-3", "1", "4-6")):
+    master = pd.DataFrame({
+        "PharmaCo SKU": ["PC-CA-JBL-001", "PC-AA-DSM-003", "PC-XG-CPK-005"][:len(lead_times)],
+        "Product Name": ["Citric Acid Anhydrous BP/USP/FCC", "Ascorbic Acid USP", "Xanthan Gum FG"][:len(lead_times)],
+        "Supplier Name": ["Jungbunzlauer", "DSM Nutritional", "CP Kelco"][:len(lead_times)],
+        "Supplier Code": ["JBL-01", "DSM-02", "CPK-03"][:len(lead_times)],
+        "Lead Time (weeks)": list(lead_times),
+        "MOQ (kg)": [500, 250, 1000][:len(lead_times)],
+    })
+    pricing = pd.DataFrame({
+        "PharmaCo SKU": ["PC-CA-JBL-001", "PC-CA-JBL-001"],
+        "Product Name": ["Citric Acid Anhydrous BP/USP/FCC"] * 2,
+        "Volume Tier": ["Tier 1", "Tier 2"],
+        "Min Qty (kg)": [0, 1001],
+        "Max Qty (kg)": [1000, 5000],
+        "Unit Price (€/kg)": [2.0, 1.8],
+        "Discount %": ["0%", "10%"],
+        "Payment Terms": ["30 days"] * 2,
+        "Volume Rebate": ["None"] * 2,
+    })
+    quality = pd.DataFrame({
+        "PharmaCo SKU": ["PC-CA-JBL-001", "PC-AA-DSM-003"],
+        "Retest Period (months)": [24, 12],
+    })
+    return StructuredQueryEngine({"Product Master Data": master, "Pricing Tiers": pricing,
+                                  "Quality Requirements": quality})
+
+
+def test_attribute_lookup_names_product_and_supplier():
+    result = make_engine().answer("What is the lead time for Citric Acid from Jungbunzlauer?")
+
+    assert result["route"] == "fast_path" and result["confidence"] == 1.0
+    assert result["answer"] == ("The lead time for Citric Acid Anhydrous BP/USP/FCC (PC-CA-JBL-001) "
+                                "from Jungbunzlauer is 2-3 weeks.")
+
+
+def test_price_uses_the_matching_volume_tier():
+    result = make_engine().answer("What is the price of Citric Acid for 2000 kg?")
+
+    assert "Tier 2: €1.80/kg" in result["answer"]
+    assert "total €3,600.00" in result["answer"]
+
+
+def test_lead_time_ranges_straddling_the_limit_go_to_the_model():
+    # Decision Scenario S002: "2-3 weeks" may or may not make a 2-week deadline
+    assert make_engine().answer("Which products can we get within 2 weeks?") is None
+
+
+def test_lead_time_filter_without_matches_goes_to_the_model():
+    assert make_engine(lead_times=("4-6", "5-7")).answer("Which products can we get within 2 weeks?") is None
+
+
+def test_lead_time_filter_lists_products_that_surely_make_it():
+    result = make_engine(lead_times=("1", "2", "4-6")).answer("Which products can we get within 2 weeks?")
+
+    assert [row["PharmaCo SKU"] for row in result["answer"]] == ["PC-CA-JBL-001", "PC-AA-DSM-003"]
+    assert "≤ 2 weeks" in result["explanation"]
+
+
+def test_limits_of_one_are_singular():
+    engine = make_engine(lead_times=("1", "1", "1"))
+
+    assert "≤ 1 week:" in engine.answer("Which products can we get within 1 week?")["explanation"]
+    assert engine.answer("Which products have a retest period shorter than 1 month?")["answer"] == (
+        "No products have a retest period shorter than 1 month.")
+
+
+@pytest.mark.parametrize("question", [
+    "Why is the lead time for Citric Acid so long?",
+    "Compare the lead time of Citric Acid and Ascorbic Acid",
+    "When would 500 kg of Citric Acid arrive in Berlin?",
+])
+def test_reasoning_questions_go_to_the_model(question):
+    assert make_engine().answer(question) is None
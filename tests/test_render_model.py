@@ -0,0 +1,48 @@
+import json
+
+from src.render_model import build_render_model, classify_explanation, ensure_render_model, message_from_answer
+
+
+FINAL = {
+    "answer": "Two products qualify.",
+    "table": {"columns": ["MOQ (kg)", "PharmaCo SKU"], "rows": [[500, "PC-1"], [250, "PC-2"]]},
+    "explanation": "1. Looked up the MOQ\nFiltered rows below 600 kg\nSource: 'Product Master Data' sheet\nDone",
+    "citations": ["Product Master Data, rows 2-3"],
+}
+
+
+def test_explanation_is_classified_once():
+    assert classify_explanation(FINAL["explanation"]) == [
+        ("step", "Looked up the MOQ"),
+        ("action", "Filtered rows below 600 kg"),
+        ("source", "Source: 'Product Master Data' sheet"),
+        ("line", "Done"),
+    ]
+
+
+def test_table_puts_identifiers_first_with_short_labels():
+    model = build_render_model(FINAL, timings={"total": 1.2})
+
+    assert list(model["table"].columns) == ["SKU", "MOQ (kg)"]
+    assert model["text"] == "Two products qualify."      # Summary next to the typed table
+    assert model["timings"] == {"total": 1.2} and model["error"] is None
+
+
+def test_list_answer_is_shown_as_table_only():
+    model = build_render_model({"answer": [{"PharmaCo SKU": "PC-1"}]})
+
+    assert model["text"] is None and len(model["table"]) == 1
+
+
+def test_old_history_entries_get_a_render_model():
+    message = {"role": "assistant", "content": json.dumps(FINAL)}
+
+    assert ensure_render_model(message)["render"]["citations"] == FINAL["citations"]
+    assert ensure_render_model({"role": "assistant", "content": "plain text"})["render"] is None
+    assert "render" not in ensure_render_model({"role": "user", "content": "hi"})
+
+
+def test_new_answers_carry_their_render_model():
+    message = message_from_answer({"error": "timeout"})
+
+    assert message["render"]["error"] == "timeout" and json.loads(message["content"]) == {"error": "timeout"}
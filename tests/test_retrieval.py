@@ -0,0 +1,49 @@
+import pandas as pd
+
+from src.retrieval import RowIndex, tokenize
+
+
+SHEETS = {
+    "Product Master Data": pd.DataFrame({
+        "PharmaCo SKU": ["PC-CA-JBL-001", "PC-AA-DSM-003", "PC-XG-CPK-005"],
+        "Product Name": ["Citric Acid Anhydrous", "Ascorbic Acid USP", "Xanthan Gum FG"],
+        "Supplier Name": ["Jungbunzlauer", "DSM Nutritional", "CP Kelco"],
+    }),
+    "Quality Requirements": pd.DataFrame({
+        "PharmaCo SKU": ["PC-CA-JBL-001", "PC-AA-DSM-003", "PC-XG-CPK-005"],
+        "Retest Period (months)": [24, 12, 36],
+    }),
+    "Decision Scenarios": pd.DataFrame({"Question": ["What is the lead time of Xanthan Gum?"]}),
+}
+
+
+def test_compound_terms_are_kept_whole_and_split():
+    assert tokenize("The food-grade SKU PC-CA-JBL-001") == [
+        "food-grade", "food", "grade", "sku", "pc-ca-jbl-001", "pc", "ca", "jbl", "001"]
+
+
+def test_named_product_selects_only_its_row():
+    text, included = RowIndex(SHEETS).select("Who supplies Xanthan Gum?")
+
+    assert included == {"Product Master Data": [4]}
+    assert "CP Kelco" in text and "Jungbunzlauer" not in text
+
+
+def test_column_name_pulls_in_the_whole_sheet():
+    _, included = RowIndex(SHEETS).select("What is the retest period?")
+
+    assert included == {"Quality Requirements": [2, 3, 4]}
+
+
+def test_benchmark_sheet_is_never_retrieved():
+    _, included = RowIndex(SHEETS).select("lead time of Xanthan Gum")
+
+    assert "Decision Scenarios" not in included
+
+
+def test_rows_beyond_the_budget_are_dropped():
+    index = RowIndex(SHEETS)
+    _, everything = index.select("What is the retest period?")
+    _, budgeted = index.select("What is the retest period?", budget_tokens=50)
+
+    assert 0 < len(budgeted.get("Quality Requirements", [])) < len(everything["Quality Requirements"])
@@ -0,0 +1,42 @@
+import random
+
+from run_load import (arrival_schedule, build_report, compare_reports, question_mix, run_load,
+                      short_product_name)
+
+
+def test_product_names_are_shortened_the_way_people_type_them():
+    assert short_product_name("Citric Acid Anhydrous BP/USP/FCC") == "Citric Acid Anhydrous"
+    assert short_product_name("Vitamin D3 100 CWS") == "Vitamin"
+    assert short_product_name("E330") == "E330"
+
+
+def test_arrivals_are_open_loop_at_the_requested_rate():
+    rng = random.Random(1)
+    schedule = arrival_schedule(50, 20, question_mix(["S1?"], ["Xanthan Gum"], 0.5, rng), rng)
+
+    assert 800 < len(schedule) < 1200
+    assert [at for at, _, _ in schedule] == sorted(at for at, _, _ in schedule)
+    assert {kind for _, kind, _ in schedule} == {"scenario", "variant"}
+
+
+def test_run_records_every_request_including_failures():
+    def solve(question, question_id):
+        if question == "boom":
+            raise ValueError("bad question")
+        return {"route": "fast_path"}
+
+    records, wall_sec, _ = run_load(solve, [(0.0, "scenario", "ok"), (0.01, "variant", "boom")], concurrency=2)
+    config = {"duration_sec": 1.0}
+    report = build_report(config, records, wall_sec, 1, {"peak": 100})
+
+    assert report["summary"]["requests"] == 2 and report["summary"]["error_rate"] == 0.5
+    assert report["routes"] == {"exception": 1, "fast_path": 1}
+    assert report["error_types"] == {"ValueError": 1}
+
+
+def test_regressions_respect_direction_and_tolerance():
+    before = {"summary": {"throughput_qps": 10.0, "error_rate": 0.0}, "latency_sec": {"total": {"p95": 2.0}}}
+    after = {"summary": {"throughput_qps": 9.5, "error_rate": 0.01}, "latency_sec": {"total": {"p95": 2.5}}}
+
+    assert compare_reports(before, after) == ["summary.error_rate", "latency_sec.total.p95"]
+    assert compare_reports(before, before) == []
@@ -0,0 +1,102 @@
+import asyncio
+import json
+
+import pandas as pd
+import pytest
+
+import src.agent as agent
+from src.agent import prepare_knowledge_base, EXCEL_FILE
+from src.backends import MockBackend, set_backend
+from src.kb_registry import KnowledgeBaseRegistry
+from src.server import SolverService, DistribIQServer, Overloaded
+
+
+QUESTION = "What is the stock level of the main product?"
+
+
+@pytest.fixture(scope="module")
+def registry(tmp_path_factory):
+    # A one-sheet workbook instead of data/docs (the document cache is in a
+    # temporary folder too, see conftest.py)
+    docs = tmp_path_factory.mktemp("docs")
+    pd.DataFrame({
+        "PharmaCo SKU": ["PC-CA-JBL-001", "PC-XG-CPK-005"],
+        "Product Name": ["Citric Acid Anhydrous", "Xanthan Gum FG"],
+        "Supplier Name": ["Jungbunzlauer", "CP Kelco"],
+        "Lead Time (weeks)": ["2-3", "4"],
+        "Stock (kg)": [1200, 300],
+    }).to_excel(docs / EXCEL_FILE, sheet_name="Product Master Data", index=False)
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(agent, "DOCS_FOLDER", str(docs))
+        registry = KnowledgeBaseRegistry(prepare_knowledge_base, str(docs))
+        registry.ensure_loaded()
+        yield registry
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    # Every question goes to the (slow) mock model
+    monkeypatch.setattr(agent, "FAST_PATH_ENABLED", False)
+    monkeypatch.setattr(agent, "ANSWER_CACHE_ENABLED", False)
+    backend = MockBackend(latency_median=0.3, latency_sigma=0.0)
+    set_backend(backend)
+    return backend
+
+
+def test_identical_questions_share_one_model_call(registry, backend):
+    service = SolverService(registry, concurrency=2, max_queue=4, timeout=10)
+
+    async def ask_five():
+        return await asyncio.gather(*(service.answer(QUESTION, f"Q{i}") for i in range(5)))
+
+    results = asyncio.run(ask_five())
+    service.shutdown()
+
+    assert backend.calls == 1
+    assert [r["coalesced"] for r in results] == [False, True, True, True, True]
+    assert len({json.dumps(r["answer"], sort_keys=True) for r in results}) == 1
+    assert service.stats()["coalesced"] == 4
+
+
+def test_full_queue_rejects_with_429(registry, backend):
+    service = SolverService(registry, concurrency=1, max_queue=1, timeout=10)
+    server = DistribIQServer(service, registry)
+
+    async def overflow():
+        first = [asyncio.ensure_future(service.answer(f"{QUESTION} ({i})", f"Q{i}")) for i in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded):
+            await service.answer(f"{QUESTION} (2)", "Q2")
+        status, body, headers = await server._answer({"body": json.dumps({"question": f"{QUESTION} (3)"})})
+        await asyncio.gather(*first)
+        return status, body, headers
+
+    status, body, headers = asyncio.run(overflow())
+    service.shutdown()
+
+    assert status == 429
+    assert "Retry-After" in headers
+    assert service.stats()["rejected"] == 2
+    assert backend.calls == 2
+
+
+def test_queued_question_is_solved_against_the_version_it_was_keyed_on(registry, backend):
+    versions = iter(["kb-old", "kb-new"])
+    data = registry.current().data
+    swapping = KnowledgeBaseRegistry(lambda: dict(data, kb_version=next(versions)), registry.watch_dir)
+    old = swapping.ensure_loaded()
+    service = SolverService(swapping, concurrency=1, max_queue=1, timeout=10)
+
+    async def reload_while_queued():
+        running = asyncio.ensure_future(service.answer(f"{QUESTION} (0)", "Q0"))
+        queued = asyncio.ensure_future(service.answer(f"{QUESTION} (1)", "Q1"))
+        await asyncio.sleep(0.05)
+        swapping.reload(wait=True)
+        return await asyncio.gather(running, queued)
+
+    results = asyncio.run(reload_while_queued())
+    service.shutdown()
+
+    assert [r["kb_version"] for r in results] == ["kb-old", "kb-old"]
+    assert swapping.current().version == "kb-new"
+    assert old.refs == 0 and old.data is None         # Released once both questions were answered
@@ -0,0 +1,49 @@
+import os
+
+import pandas as pd
+import pytest
+
+import src.snapshot as snapshot
+from src.snapshot import WorkbookSnapshot, get_snapshot, read_workbook
+
+
+pytest.importorskip("pyarrow")
+
+
+@pytest.fixture
+def workbook(tmp_path):
+    path = tmp_path / "book.xlsx"
+    with pd.ExcelWriter(path) as writer:
+        pd.DataFrame({"PharmaCo SKU": ["PC-1", "PC-2"], "MOQ (kg)": [500, "on request"]}).to_excel(
+            writer, sheet_name="Product Master Data", index=False)
+        pd.DataFrame({"Country": ["DE"]}).to_excel(writer, sheet_name="Logistics Matrix", index=False)
+    return path
+
+
+def test_sheets_round_trip_through_parquet(workbook, tmp_path):
+    sheets = read_workbook(workbook, tmp_path / "snapshots")
+    reopened = WorkbookSnapshot(workbook, tmp_path / "snapshots").sheets()
+
+    assert list(sheets) == list(reopened) == ["Product Master Data", "Logistics Matrix"]
+    assert reopened["Product Master Data"]["MOQ (kg)"].tolist() == ["500", "on request"]    # Mixed column as text
+    assert reopened["Logistics Matrix"]["Country"].tolist() == ["DE"]
+
+
+def test_second_load_does_not_touch_the_workbook(workbook, tmp_path, monkeypatch):
+    get_snapshot(workbook, tmp_path / "snapshots")
+    monkeypatch.setattr(snapshot, "_snapshots", {})
+    monkeypatch.setattr(pd, "ExcelFile", lambda *a, **k: pytest.fail("workbook was parsed again"))
+
+    assert get_snapshot(workbook, tmp_path / "snapshots").sheets()["Logistics Matrix"].shape == (1, 1)
+
+
+def test_changed_workbook_gets_a_new_snapshot_and_old_ones_are_pruned(workbook, tmp_path, monkeypatch):
+    monkeypatch.setattr(snapshot, "SNAPSHOT_KEEP", 2)
+    paths = []
+    for i in range(3):
+        pd.DataFrame({"Version": [i]}).to_excel(workbook, index=False)
+        os.utime(workbook, ns=(i * 10**9, i * 10**9))
+        paths.append(get_snapshot(workbook, tmp_path / "snapshots").path)
+
+    assert len(set(paths)) == 3
+    assert sorted(os.listdir(tmp_path / "snapshots")) == sorted(os.path.basename(p) for p in paths[1:])
@@ -0,0 +1,36 @@
+import os
+import subprocess
+import sys
+
+from src.agent import SolverRuntime
+from src.prompts import PromptTemplate
+
+
+def test_prefix_is_rendered_once_per_variant():
+    template = PromptTemplate("| SKU | MOQ |")
+
+    assert template.prefix(full_workbook=True) is template.prefix(full_workbook=True)
+    assert "| SKU | MOQ |" in template.prefix(full_workbook=True)
+    assert "| SKU | MOQ |" not in template.prefix(pdfs_attached=False)
+
+
+def test_runtime_reuses_templates_and_keeps_recent_versions():
+    runtime = SolverRuntime(max_versions=2)
+    excel_text = "| SKU | MOQ |"
+    first = runtime.register("kb-1", excel_text, pdf_index="index-1")
+    runtime.register("kb-2", "other")
+    runtime.register("kb-3", "newest")
+
+    assert runtime.template("kb-3", "newest") is runtime.template("kb-3", "newest")
+    assert runtime.pdf_index("kb-1") is None and runtime.pdf_index("kb-3") is None
+    assert runtime.template("kb-1", excel_text) is not first["template"]        # Evicted, rebuilt on use
+    assert runtime.template("kb-2", "changed text").excel_text == "changed text"
+
+
+def test_importing_the_agent_loads_no_heavy_libraries():
+    heavy = ("langgraph", "google.generativeai", "numpy", "pandas")
+    code = f"import sys, src.agent, src.conversation; print([m for m in {heavy!r} if m in sys.modules])"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.join(os.path.dirname(__file__), ".."))
+
+    assert result.stdout.strip().splitlines()[-1] == "[]"
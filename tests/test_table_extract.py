@@ -0,0 +1,51 @@
+import time
+
+import src.table_extract as table_extract
+from src.table_extract import attach_rows, extract_rows, extract_rows_from_text
+
+
+def test_schema_table_becomes_rows():
+    answer = {"answer": "See table", "table": {"columns": ["SKU", "MOQ"], "rows": [["PC-1", 500], ["PC-2", 250]]}}
+
+    assert extract_rows(answer) == [{"SKU": "PC-1", "MOQ": 500}, {"SKU": "PC-2", "MOQ": 250}]
+
+
+def test_objects_in_free_text_are_found():
+    text = ("Two products qualify:\n```json\n{\"SKU\": \"PC-1\", \"note\": \"it's {fine}\"}\n```\n"
+            "and {'SKU': 'PC-2', 'halal': True}. Braces in prose {like this} are skipped.")
+
+    assert extract_rows_from_text(text) == [{"SKU": "PC-1", "note": "it's {fine}"}, {"SKU": "PC-2", "halal": True}]
+
+
+def test_list_answer_keeps_only_dicts():
+    assert extract_rows({"answer": [{"SKU": "PC-1"}, "PC-2", None]}) == [{"SKU": "PC-1"}]
+    assert extract_rows({"answer": "No table here"}) == []
+    assert extract_rows("not an answer") == []
+
+
+def test_rows_are_capped(monkeypatch):
+    monkeypatch.setattr(table_extract, "MAX_TABLE_ROWS", 3)
+
+    assert len(extract_rows_from_text('{"a": 1} ' * 10)) == 3
+
+
+def test_unbalanced_brace_does_not_swallow_later_rows():
+    text = "{ unclosed " + "x" * (table_extract.MAX_FRAGMENT_CHARS + 10) + ' {"SKU": "PC-1"}'
+
+    assert extract_rows_from_text(text) == [{"SKU": "PC-1"}]
+
+
+def test_long_text_is_scanned_in_linear_time():
+    text = '{"SKU": "PC-1", "MOQ": 500} filler text ' * 20_000
+    started = time.perf_counter()
+    rows = extract_rows_from_text(text)
+
+    assert len(rows) == table_extract.MAX_TABLE_ROWS
+    assert time.perf_counter() - started < 2.0
+
+
+def test_rows_are_attached_once():
+    answer = attach_rows({"answer": [{"SKU": "PC-1"}]})
+    answer["answer"] = []
+
+    assert attach_rows(answer)["rows"] == [{"SKU": "PC-1"}]
@@ -0,0 +1,47 @@
+import json
+
+from src.telemetry import QueryTrace, Telemetry, query_cost, section_tokens
+
+
+USAGE = {"prompt_token_count": 10_000, "cached_content_token_count": 8_000, "candidates_token_count": 1_000}
+
+
+def test_cached_prompt_tokens_are_priced_at_the_cached_rate():
+    # 2,000 fresh x $0.30 + 8,000 cached x $0.075 + 1,000 output x $2.50, per 1M tokens
+    assert query_cost("gemini-2.5-flash", USAGE) == 0.0037
+    assert query_cost("unknown-model", USAGE) == 0.0
+
+
+def test_sections_add_up_to_the_measured_prompt():
+    sections = section_tokens(1_000, "x" * 2_000, "x" * 2_400, "What is the MOQ?", has_pdfs=True)
+
+    assert sum(sections.values()) == 1_000
+    assert sections["excel"] == 501 and sections["pdfs"] > 0
+    assert section_tokens(0, "x", "x", "q", has_pdfs=False) == {}
+
+
+def test_finished_query_is_logged_and_exported(tmp_path):
+    telemetry = Telemetry(log_path=str(tmp_path / "log.jsonl"), metrics_path=str(tmp_path / "metrics.prom"))
+    trace = QueryTrace("Q1", "What is the MOQ?", "gemini-2.5-flash")
+    trace.model_started()
+    trace.first_byte()
+    trace.model_finished(USAGE)
+    telemetry.record(trace)
+    telemetry.flush()
+
+    entry = json.loads((tmp_path / "log.jsonl").read_text())
+    metrics = (tmp_path / "metrics.prom").read_text()
+    assert entry["question_id"] == "Q1" and entry["cost_usd"] == 0.0037 and entry["ttft_sec"] is not None
+    assert 'distribiq_queries_total{route="model"} 1' in metrics
+    assert 'distribiq_tokens_total{kind="cached"} 8000' in metrics
+    assert "distribiq_ttft_seconds_count 1" in metrics
+
+
+def test_log_rolls_over_past_its_size_limit(tmp_path):
+    log = tmp_path / "log.jsonl"
+    telemetry = Telemetry(log_path=str(log), metrics_path=None, max_bytes=100)
+    for i in range(3):
+        telemetry.record(QueryTrace(f"Q{i}", "What is the MOQ of Xanthan Gum?", "gemini-2.5-flash"))
+
+    assert (tmp_path / "log.jsonl.1").exists()
+    assert len(log.read_text().splitlines()) < 3